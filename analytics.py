@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from itertools import chain
+from typing import Any, Dict, List
+
+import numpy as np
+
+
+@dataclass
+class OccupancyReport:
+    # mapy 7 x 24: dzień tygodnia (0 = poniedziałek) x godzina rozpoczęcia
+    capacity: np.ndarray
+    reserved: np.ndarray
+    fill_rate: np.ndarray
+    groups: Dict[str, List[Dict[str, Any]]] = field(default_factory=dict)
+    total_sessions: int = 0
+    total_reservations: int = 0
+    cancellation_rate: float = 0.0
+
+
+def _rate(numerator, denominator):
+    num = np.asarray(numerator, dtype=np.float64)
+    den = np.asarray(denominator, dtype=np.float64)
+    return np.divide(num, den, out=np.zeros_like(num), where=den > 0)
+
+
+class OccupancyAnalytics:
+    """Obłożenie zajęć liczone na tablicach NumPy.
+
+    Dane czytane są jednym przebiegiem po sesjach i jednym po rezerwacjach,
+    a wszystkie sumy to bincount po indeksach - bez pętli po wierszach.
+    """
+
+    GROUP_COLUMNS = {"name": 3, "difficulty_level": 4, "trainer_id": 5}
+
+    def __init__(self, db):
+        self.db = db
+
+    def _load(self, start=None, end=None):
+        sessions = self.db.get_sessions_for_analytics(start, end)
+        pairs = np.fromiter(
+            chain.from_iterable(self.db.iter_reservation_statuses(start, end)),
+            dtype=np.int64,
+        ).reshape(-1, 2)
+        return sessions, pairs
+
+    def report(self, start=None, end=None) -> OccupancyReport:
+        sessions, pairs = self._load(start, end)
+        n = len(sessions)
+
+        ids = np.fromiter((s[0] for s in sessions), dtype=np.int64, count=n)
+        weekday = np.fromiter((s[1] for s in sessions), dtype=np.int64, count=n)
+        hour = np.fromiter((s[2] for s in sessions), dtype=np.int64, count=n)
+        capacity = np.fromiter((s[6] for s in sessions), dtype=np.int64, count=n)
+
+        # rezerwacje -> indeks sesji; rezerwacje sesji spoza zakresu/anulowanych odpadają
+        order = np.argsort(ids)
+        sorted_ids = ids[order]
+        pos = np.searchsorted(sorted_ids, pairs[:, 0])
+        pos_clipped = np.minimum(pos, max(n - 1, 0))
+        known = (pos < n) & (sorted_ids[pos_clipped] == pairs[:, 0]) if n else np.zeros(len(pairs), dtype=bool)
+        session_idx = order[pos_clipped[known]]
+        active = pairs[known, 1].astype(bool)
+
+        reserved = np.bincount(session_idx[active], minlength=n)
+        cancelled = np.bincount(session_idx[~active], minlength=n)
+
+        cell = weekday * 24 + hour
+        cap_map = np.bincount(cell, weights=capacity, minlength=7 * 24).reshape(7, 24)
+        res_map = np.bincount(cell, weights=reserved, minlength=7 * 24).reshape(7, 24)
+
+        groups = {}
+        for key, column in self.GROUP_COLUMNS.items():
+            labels = np.array([s[column] for s in sessions], dtype=object)
+            groups[key] = self._group(labels, capacity, reserved, cancelled)
+
+        total_active = int(reserved.sum())
+        total_cancelled = int(cancelled.sum())
+        return OccupancyReport(
+            capacity=cap_map,
+            reserved=res_map,
+            fill_rate=_rate(res_map, cap_map),
+            groups=groups,
+            total_sessions=n,
+            total_reservations=total_active + total_cancelled,
+            cancellation_rate=total_cancelled / (total_active + total_cancelled) if total_cancelled else 0.0,
+        )
+
+    @staticmethod
+    def _group(labels, capacity, reserved, cancelled) -> List[Dict[str, Any]]:
+        if len(labels) == 0:
+            return []
+        keys, inverse = np.unique(labels.astype(str), return_inverse=True)
+        k = len(keys)
+        sessions = np.bincount(inverse, minlength=k)
+        cap = np.bincount(inverse, weights=capacity, minlength=k)
+        res = np.bincount(inverse, weights=reserved, minlength=k)
+        canc = np.bincount(inverse, weights=cancelled, minlength=k)
+        fill = _rate(res, cap)
+        cancel_rate = _rate(canc, res + canc)
+
+        rows = [
+            {
+                "key": str(keys[i]),
+                "sessions": int(sessions[i]),
+                "capacity": int(cap[i]),
+                "reserved": int(res[i]),
+                "fill_rate": float(fill[i]),
+                "cancellation_rate": float(cancel_rate[i]),
+            }
+            for i in np.argsort(-fill, kind="stable")
+        ]
+        return rows
@@ -0,0 +1,229 @@
+from __future__ import annotations
+
+import logging
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from scheduling import format_ts, session_bounds
+
+logger = logging.getLogger(__name__)
+
+# wejście wpuszczamy od tylu minut przed startem do końca zajęć
+EARLY_MINUTES = 30
+
+
+@dataclass
+class Booking:
+    reservation_id: int
+    client_id: int
+    email: str
+    first_name: str
+    session_id: int
+    session_name: str
+    start: datetime
+    end: datetime
+    checked_in: bool = False
+
+
+def _booking(row) -> Booking:
+    reservation_id, client_id, email, first_name, session_id, name, start_time, duration, checked_in = row
+    start, end = session_bounds(start_time, duration)
+    return Booking(reservation_id, client_id, email.lower(), first_name, session_id, name or "Zajęcia",
+                   start, end, bool(checked_in))
+
+
+class CheckInIndex:
+    """Dzisiejsze rezerwacje w pamięci: client_id -> rezerwacje, email -> client_id.
+
+    load() czyta stan dnia jednym zapytaniem, a sync() dociąga tylko zmiany
+    z dziennika reservation_changes od ostatnio widzianego id. Wyszukiwanie
+    przy skanie to dwa odczyty ze słownika - bez bazy.
+    """
+
+    def __init__(self, db, day: date):
+        self.db = db
+        self.day = day
+        self.last_change = 0
+        self._by_reservation: Dict[int, Booking] = {}
+        self._by_client: Dict[int, Dict[int, Booking]] = {}
+        self._clients_by_email: Dict[str, int] = {}
+        # wejścia z tej sesji kiosku - przeżywają sync(), zanim writer zapisze je w bazie
+        self._checked_in = set()
+        self._lock = threading.Lock()
+
+    def load(self):
+        start = datetime.combine(self.day, datetime.min.time())
+        last_change, rows = self.db.get_checkin_snapshot(format_ts(start), format_ts(start + timedelta(days=1)))
+        with self._lock:
+            self._by_reservation.clear()
+            self._by_client.clear()
+            self._clients_by_email.clear()
+            for row in rows:
+                self._put(_booking(row))
+            self.last_change = last_change
+
+    def sync(self) -> int:
+        changes = self.db.get_checkin_changes(self.last_change)
+        with self._lock:
+            for change_id, reservation_id, row, status in changes:
+                self._drop(reservation_id)
+                if row is not None and status == "ACTIVE":
+                    booking = _booking(row)
+                    if booking.start.date() == self.day:
+                        self._put(booking)
+                self.last_change = change_id
+        return len(changes)
+
+    def _put(self, booking: Booking):
+        booking.checked_in = booking.checked_in or booking.reservation_id in self._checked_in
+        self._by_reservation[booking.reservation_id] = booking
+        self._by_client.setdefault(booking.client_id, {})[booking.reservation_id] = booking
+        self._clients_by_email[booking.email] = booking.client_id
+
+    def _drop(self, reservation_id: int):
+        booking = self._by_reservation.pop(reservation_id, None)
+        if booking is not None:
+            self._by_client.get(booking.client_id, {}).pop(reservation_id, None)
+
+    def mark_checked_in(self, booking: Booking):
+        with self._lock:
+            booking.checked_in = True
+            self._checked_in.add(booking.reservation_id)
+
+    def lookup(self, code: str) -> List[Booking]:
+        """Rezerwacje klienta po emailu albo ID, posortowane po starcie."""
+        code = code.strip().lower()
+        client_id = int(code) if code.isdigit() else self._clients_by_email.get(code)
+        with self._lock:
+            bookings = list(self._by_client.get(client_id, {}).values())
+        bookings.sort(key=lambda b: b.start)
+        return bookings
+
+    def __len__(self):
+        return len(self._by_reservation)
+
+
+class AttendanceWriter:
+    """Zapisuje wejścia paczkami w osobnym wątku - skan nie czeka na bazę.
+
+    Paczka idzie do bazy, gdy uzbiera się batch_size wpisów albo minie
+    flush_interval od pierwszego wpisu w kolejce. Paczka, której nie udało
+    się zapisać, czeka w pending i jest ponawiana co flush_interval, z
+    następną paczką i przy stop() - wątek nie kończy się na błędzie bazy.
+    """
+
+    def __init__(self, db, batch_size: int = 100, flush_interval: float = 0.5):
+        self.db = db
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.written = 0
+        # wpisy z nieudanych zapisów - add_attendance pomija duplikaty, więc ponowienie jest bezpieczne
+        self.pending: List[tuple] = []
+        self._queue: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="attendance-writer", daemon=True)
+            self._thread.start()
+
+    def submit(self, record: tuple):
+        self._queue.put(record)
+
+    def stop(self, timeout: float = 5.0):
+        # None w kolejce = zapisz resztę i zakończ
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            try:
+                # z zaległą paczką nie czekamy w nieskończoność na kolejny skan
+                record = self._queue.get(timeout=self.flush_interval if self.pending else None)
+            except queue.Empty:
+                self._write(self.pending)
+                continue
+            if record is None:
+                break
+            batch = [record]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    record = self._queue.get(timeout=max(remaining, 0))
+                except queue.Empty:
+                    break
+                if record is None:
+                    stopping = True
+                    break
+                batch.append(record)
+            self._write(self.pending + batch)
+        if self.pending:
+            self._write(self.pending)
+
+    def _write(self, batch: List[tuple], attempts: int = 3) -> bool:
+        error = None
+        for attempt in range(attempts):
+            try:
+                self.written += self.db.add_attendance(batch)
+                self.pending = []
+                return True
+            except Exception as exc:
+                # np. baza zajęta dłużej niż timeout połączenia - ponawiamy tę samą paczkę
+                error = exc
+                if attempt < attempts - 1:
+                    time.sleep(self.flush_interval)
+        logger.error("Nie udało się zapisać wejść (%d), ponowienie z następną paczką", len(batch), exc_info=error)
+        self.pending = batch
+        return False
+
+
+class CheckInService:
+    def __init__(self, db, day: Optional[date] = None, writer: Optional[AttendanceWriter] = None):
+        self.index = CheckInIndex(db, day or date.today())
+        self.writer = writer or AttendanceWriter(db)
+
+    def start(self):
+        # dziennik zmian sprzed wczoraj nie jest już nikomu potrzebny
+        self.index.db.prune_reservation_changes(format_ts(
+            datetime.combine(self.index.day - timedelta(days=1), datetime.min.time())
+        ))
+        self.index.load()
+        self.writer.start()
+
+    def stop(self):
+        self.writer.stop()
+
+    def refresh(self) -> int:
+        return self.index.sync()
+
+    def check_in(self, code: str, now: Optional[datetime] = None) -> Tuple[bool, str]:
+        if not code or not code.strip():
+            return False, "Zeskanuj kartę albo podaj email"
+
+        now = now or datetime.now()
+        bookings = self.index.lookup(code)
+        if not bookings:
+            return False, "Brak rezerwacji na dziś"
+
+        early = timedelta(minutes=EARLY_MINUTES)
+        for b in bookings:
+            if b.start - early <= now <= b.end and not b.checked_in:
+                self.index.mark_checked_in(b)
+                self.writer.submit((b.reservation_id, b.client_id, b.session_id, format_ts(now)))
+                return True, f"Witaj, {b.first_name}! {b.session_name} o {b.start:%H:%M}"
+
+        if any(b.checked_in and b.start - early <= now <= b.end for b in bookings):
+            return False, "Wejście już zarejestrowane"
+        upcoming = [b for b in bookings if b.start - early > now]
+        if upcoming:
+            return False, f"Zajęcia zaczynają się o {upcoming[0].start:%H:%M} - zapraszamy później"
+        return False, "Dzisiejsze zajęcia już się skończyły"
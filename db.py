@@ -1,12 +1,147 @@
+import json
+import re
 import sqlite3
+import uuid
+from contextlib import closing
+from datetime import datetime
+
+
+def _fts_query(text):
+    # każde słowo jako fraza z prefiksem, np. "jog" -> "jog"* (bez składni FTS od użytkownika)
+    terms = re.findall(r"\w+", text or "")
+    return " ".join(f'"{t}"*' for t in terms)
+
+
+def _normalize_ts(value):
+    # seed_sessions zapisuje daty z "T", formularze ze spacją - trzymamy jeden format,
+    # żeby porównania tekstowe na start_time (indeksy, zakresy) były poprawne
+    if value is None:
+        return None
+    return str(value).replace("T", " ", 1)
+
+
+class SessionQuery:
+    """Składany filtr sesji kompilowany do sparametryzowanego SQL.
+
+    Każda metoda dokłada warunek i zwraca self, więc można łączyć wywołania:
+    SessionQuery().of_type("group").price_between(high=40).limit(20)
+    """
+
+    _RESERVED = (
+        "(SELECT COUNT(*) FROM reservations r "
+        "WHERE r.session_id = s.id AND r.status = 'ACTIVE')"
+    )
+
+    def __init__(self):
+        self._where = ["s.status = 'ACTIVE'"]
+        self._params = []
+        self._after = None
+        self._limit = None
+        self._offset = None
+
+    def _add(self, clause, *params):
+        self._where.append(clause)
+        self._params.extend(params)
+        return self
+
+    def of_type(self, session_type):
+        return self._add("s.type = ?", session_type)
+
+    def difficulty(self, *levels):
+        if not levels:
+            return self
+        marks = ", ".join("?" for _ in levels)
+        return self._add(f"s.difficulty_level IN ({marks})", *levels)
+
+    def price_between(self, low=None, high=None):
+        if low is not None:
+            self._add("s.price >= ?", float(low))
+        if high is not None:
+            self._add("s.price <= ?", float(high))
+        return self
+
+    def trainer(self, trainer_id):
+        return self._add("s.trainer_id = ?", int(trainer_id))
+
+    def starting_between(self, start=None, end=None):
+        if start is not None:
+            self._add("s.start_time >= ?", _normalize_ts(start))
+        if end is not None:
+            self._add("s.start_time < ?", _normalize_ts(end))
+        return self
+
+    def hours_between(self, from_hour=None, to_hour=None):
+        # godzina rozpoczęcia, włącznie z obu stron
+        if from_hour is not None:
+            self._add("CAST(substr(s.start_time, 12, 2) AS INTEGER) >= ?", int(from_hour))
+        if to_hour is not None:
+            self._add("CAST(substr(s.start_time, 12, 2) AS INTEGER) <= ?", int(to_hour))
+        return self
+
+    def with_free_places(self, places=1):
+        return self._add(f"s.capacity - {self._RESERVED} >= ?", int(places))
+
+    def after(self, start_time, session_id):
+        # stronicowanie po kluczu: wiersze po (start_time, id) ostatniego wyniku
+        self._after = (_normalize_ts(start_time), int(session_id))
+        return self
+
+    def limit(self, n):
+        self._limit = int(n)
+        return self
+
+    def offset(self, n):
+        self._offset = int(n)
+        return self
+
+    def compile(self):
+        where = list(self._where)
+        params = list(self._params)
+        if self._after is not None:
+            where.append("(s.start_time, s.id) > (?, ?)")
+            params.extend(self._after)
+
+        sql = (
+            f"SELECT s.*, {self._RESERVED} AS reserved FROM sessions s "
+            f"WHERE {' AND '.join(where)} "
+            "ORDER BY s.start_time, s.id"
+        )
+        if self._limit is not None or self._offset is not None:
+            sql += " LIMIT ? OFFSET ?"
+            params.extend([self._limit if self._limit is not None else -1, self._offset or 0])
+        return sql, params
 
 
 class Database:
+    # podbić przy nowej jednorazowej poprawce danych w create_tables
+    SCHEMA_VERSION = 1
+
     def __init__(self, db_path: str = "mygym.db"):
+        # każde connect() do ":memory:" to osobna, pusta baza - zamieniamy na nazwaną bazę
+        # w pamięci (VFS memdb), którą widzą wszystkie połączenia; w odróżnieniu od
+        # cache=shared blokady działają jak dla pliku, więc równoległe transakcje czekają
+        if db_path == ":memory:":
+            db_path = f"file:/mygym-{uuid.uuid4().hex}?vfs=memdb"
         self.db_path = db_path
+        self._uri = db_path.startswith("file:")
+        # baza w pamięci istnieje, dopóki otwarte jest choć jedno połączenie
+        in_memory = "vfs=memdb" in db_path or "mode=memory" in db_path
+        self._keepalive = sqlite3.connect(db_path, uri=True) if in_memory else None
 
     def connect(self):
-        return sqlite3.connect(self.db_path)
+        return sqlite3.connect(self.db_path, uri=self._uri)
+
+    def close(self):
+        if self._keepalive is not None:
+            self._keepalive.close()
+            self._keepalive = None
+
+    def clone(self, db_path: str = ":memory:") -> "Database":
+        """Kopia całej bazy przez backup API, np. świeża baza testowa z gotowego szablonu."""
+        copy = Database(db_path)
+        with closing(self.connect()) as src, closing(copy.connect()) as dst:
+            src.backup(dst)
+        return copy
 
     def create_tables(self):
         with self.connect() as conn:
@@ -50,13 +185,619 @@ class Database:
                     session_id INTEGER NOT NULL,
                     created_at TEXT NOT NULL,
                     status TEXT NOT NULL CHECK (status IN ('ACTIVE', 'CANCELLED')),
+                    starts_at TEXT,
+                    ends_at TEXT,
                     FOREIGN KEY (client_id) REFERENCES users(id),
                     FOREIGN KEY (session_id) REFERENCES sessions(id)
                 )
             ''')
 
+            # archiwum - te same kolumny co tabele bieżące, bez AUTOINCREMENT
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS sessions_archive
+                (
+                    id INTEGER PRIMARY KEY,
+                    type TEXT NOT NULL,
+                    name TEXT,
+                    description TEXT,
+                    difficulty_level TEXT,
+                    price REAL,
+                    trainer_id INTEGER NOT NULL,
+                    start_time TEXT NOT NULL,
+                    duration_min INTEGER NOT NULL,
+                    capacity INTEGER NOT NULL,
+                    status TEXT NOT NULL
+                )
+            ''')
+
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS reservations_archive
+                (
+                    id INTEGER PRIMARY KEY,
+                    client_id INTEGER NOT NULL,
+                    session_id INTEGER NOT NULL,
+                    created_at TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    starts_at TEXT,
+                    ends_at TEXT
+                )
+            ''')
+
+            # czas zajęć skopiowany do rezerwacji - kolizje klienta szukamy po indeksie (client_id, status, ends_at)
+            added = {
+                table: self._add_missing_columns(cursor, table, [('starts_at', 'TEXT'), ('ends_at', 'TEXT')])
+                for table in ('reservations', 'reservations_archive')
+            }
+            cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS reservations_time_ai AFTER INSERT ON reservations
+                WHEN new.starts_at IS NULL BEGIN
+                    UPDATE reservations
+                    SET starts_at = (SELECT start_time FROM sessions WHERE id = new.session_id),
+                        ends_at = (
+                            SELECT datetime(start_time, '+' || duration_min || ' minutes')
+                            FROM sessions WHERE id = new.session_id
+                        )
+                    WHERE id = new.id;
+                END
+            ''')
+            cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS reservations_time_su AFTER UPDATE OF start_time, duration_min ON sessions
+                BEGIN
+                    UPDATE reservations
+                    SET starts_at = new.start_time,
+                        ends_at = datetime(new.start_time, '+' || new.duration_min || ' minutes')
+                    WHERE session_id = new.id;
+                END
+            ''')
+
+            # wyszukiwanie pełnotekstowe po nazwie i opisie sesji
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'sessions_fts'")
+            fts_exists = cursor.fetchone() is not None
+            cursor.execute('''
+                CREATE VIRTUAL TABLE IF NOT EXISTS sessions_fts USING fts5(
+                    name,
+                    description,
+                    content='sessions',
+                    content_rowid='id',
+                    tokenize='unicode61 remove_diacritics 2'
+                )
+            ''')
+            if not fts_exists:
+                cursor.execute("INSERT INTO sessions_fts(sessions_fts) VALUES ('rebuild')")
+                cursor.execute("INSERT INTO sessions_fts(sessions_fts, rank) VALUES ('rank', 'bm25(10.0, 1.0)')")
+
+            cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS sessions_fts_ai AFTER INSERT ON sessions BEGIN
+                    INSERT INTO sessions_fts (rowid, name, description)
+                    VALUES (new.id, new.name, new.description);
+                END
+            ''')
+            cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS sessions_fts_ad AFTER DELETE ON sessions BEGIN
+                    INSERT INTO sessions_fts (sessions_fts, rowid, name, description)
+                    VALUES ('delete', old.id, old.name, old.description);
+                END
+            ''')
+            cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS sessions_fts_au AFTER UPDATE OF name, description ON sessions BEGIN
+                    INSERT INTO sessions_fts (sessions_fts, rowid, name, description)
+                    VALUES ('delete', old.id, old.name, old.description);
+                    INSERT INTO sessions_fts (rowid, name, description)
+                    VALUES (new.id, new.name, new.description);
+                END
+            ''')
+
+            # jednorazowe poprawki danych starszych plików bazy - wersja w PRAGMA user_version
+            cursor.execute('PRAGMA user_version')
+            if cursor.fetchone()[0] < 1:
+                cursor.execute(
+                    "UPDATE sessions SET start_time = replace(start_time, 'T', ' ') WHERE instr(start_time, 'T') > 0"
+                )
+
+                # rezerwacje, które zostały aktywne po anulowaniu sesji przed kaskadowym anulowaniem
+                cursor.execute('''
+                    UPDATE reservations SET status = 'CANCELLED'
+                    WHERE status = 'ACTIVE'
+                      AND session_id IN (SELECT id FROM sessions WHERE status = 'CANCELLED')
+                ''')
+
+            # rezerwacje archiwalne biorą czas z sesji archiwalnych
+            for reservations, sessions in (('reservations', 'sessions'), ('reservations_archive', 'sessions_archive')):
+                if added[reservations]:
+                    cursor.execute(f'''
+                        UPDATE {reservations}
+                        SET starts_at = (SELECT start_time FROM {sessions} s WHERE s.id = {reservations}.session_id),
+                            ends_at = (
+                                SELECT datetime(start_time, '+' || duration_min || ' minutes')
+                                FROM {sessions} s WHERE s.id = {reservations}.session_id
+                            )
+                    ''')
+
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_sessions_start ON sessions(start_time)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_sessions_status_start ON sessions(status, start_time)')
+            cursor.execute(
+                'CREATE INDEX IF NOT EXISTS idx_sessions_trainer ON sessions(trainer_id, status, start_time)'
+            )
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_sessions_type ON sessions(type, status, start_time)')
+            cursor.execute(
+                'CREATE INDEX IF NOT EXISTS idx_sessions_trainer_duration ON sessions(trainer_id, duration_min)'
+            )
+            cursor.execute(
+                'CREATE INDEX IF NOT EXISTS idx_sessions_difficulty '
+                'ON sessions(difficulty_level, status, start_time)'
+            )
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_reservations_session ON reservations(session_id, status)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_reservations_client ON reservations(client_id, status)')
+            cursor.execute(
+                'CREATE INDEX IF NOT EXISTS idx_reservations_client_time ON reservations(client_id, status, ends_at)'
+            )
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_sessions_archive_trainer ON sessions_archive(trainer_id)')
+            cursor.execute(
+                'CREATE INDEX IF NOT EXISTS idx_reservations_archive_session ON reservations_archive(session_id)'
+            )
+            cursor.execute(
+                'CREATE INDEX IF NOT EXISTS idx_reservations_archive_client ON reservations_archive(client_id)'
+            )
+
+            # powiadomienia zapisywane w tej samej transakcji co zmiana sesji (outbox)
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS notifications_outbox
+                (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    user_id INTEGER NOT NULL,
+                    session_id INTEGER NOT NULL,
+                    kind TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    created_at TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'PENDING'
+                        CHECK (status IN ('PENDING', 'SENDING', 'SENT', 'FAILED')),
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    sent_at TEXT,
+                    FOREIGN KEY (user_id) REFERENCES users(id)
+                )
+            ''')
+            cursor.execute(
+                'CREATE INDEX IF NOT EXISTS idx_notifications_outbox_status ON notifications_outbox(status, id)'
+            )
+
+            # lista oczekujących - kolejka FIFO po id w obrębie sesji
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS waitlist
+                (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    session_id INTEGER NOT NULL,
+                    client_id INTEGER NOT NULL,
+                    created_at TEXT NOT NULL,
+                    status TEXT NOT NULL CHECK (status IN ('WAITING', 'PROMOTED', 'CANCELLED')),
+                    FOREIGN KEY (session_id) REFERENCES sessions(id),
+                    FOREIGN KEY (client_id) REFERENCES users(id)
+                )
+            ''')
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_waitlist_queue ON waitlist(session_id, status, id)')
+            cursor.execute('''
+                CREATE UNIQUE INDEX IF NOT EXISTS idx_waitlist_client
+                ON waitlist(session_id, client_id) WHERE status = 'WAITING'
+            ''')
+
+            self._create_rollups(cursor)
+            self._create_feed_versions(cursor)
+            self._create_participant_versions(cursor)
+            self._create_attendance(cursor)
+            self._create_billing(cursor)
+            self._create_credits(cursor)
+            self._create_seat_holds(cursor)
+
+            cursor.execute(f'PRAGMA user_version = {self.SCHEMA_VERSION}')
+            conn.commit()
+
+    # agregaty do raportów: (tabela, kolumny klucza, wyrażenia klucza dla rezerwacji r / sesji s)
+    ROLLUPS = [
+        ('rollup_session_day', ('day', 'session_id'), ('date(s.start_time)', 's.id')),
+        ('rollup_trainer_week', ('trainer_id', 'week_start'),
+         ('s.trainer_id', "date(s.start_time, 'weekday 0', '-6 days')")),
+        ('rollup_client_month', ('client_id', 'month'), ('r.client_id', "strftime('%Y-%m', s.start_time)")),
+    ]
+
+    def _create_rollups(self, cursor):
+        """Tabele agregatów utrzymywane przyrostowo triggerami na reservations i sessions.
+
+        bookings - utworzone rezerwacje, cancellations - anulowane,
+        revenue - suma cen rezerwacji, które są nadal aktywne.
+        """
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'rollup_session_day'")
+        created = cursor.fetchone() is None
+
+        for table, keys, exprs in self.ROLLUPS:
+            cursor.execute(f'''
+                CREATE TABLE IF NOT EXISTS {table}
+                (
+                    {keys[0]} {'TEXT' if keys[0] == 'day' else 'INTEGER'} NOT NULL,
+                    {keys[1]} {'INTEGER' if keys[1] == 'session_id' else 'TEXT'} NOT NULL,
+                    bookings INTEGER NOT NULL DEFAULT 0,
+                    cancellations INTEGER NOT NULL DEFAULT 0,
+                    revenue REAL NOT NULL DEFAULT 0,
+                    PRIMARY KEY ({keys[0]}, {keys[1]})
+                )
+            ''')
+
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_rollup_trainer_week ON rollup_trainer_week(week_start)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_rollup_client_month ON rollup_client_month(month)')
+
+        # (nazwa triggera, warunek, zmiana bookings, zmiana cancellations, znak przychodu)
+        events = [
+            ('ai', 'AFTER INSERT ON reservations WHEN new.status = \'ACTIVE\'', 1, 0, 1),
+            ('cancel', 'AFTER UPDATE OF status ON reservations '
+                       'WHEN old.status = \'ACTIVE\' AND new.status = \'CANCELLED\'', 0, 1, -1),
+            ('restore', 'AFTER UPDATE OF status ON reservations '
+                        'WHEN old.status = \'CANCELLED\' AND new.status = \'ACTIVE\'', 0, -1, 1),
+        ]
+        for suffix, when, d_book, d_cancel, sign in events:
+            statements = []
+            for table, keys, exprs in self.ROLLUPS:
+                statements.append(f'''
+                    INSERT INTO {table} ({keys[0]}, {keys[1]}, bookings, cancellations, revenue)
+                    SELECT {exprs[0]}, {exprs[1]}, {d_book}, {d_cancel}, {sign} * COALESCE(s.price, 0)
+                    FROM sessions s, (SELECT new.client_id AS client_id) r
+                    WHERE s.id = new.session_id
+                    ON CONFLICT ({keys[0]}, {keys[1]}) DO UPDATE SET
+                        bookings = bookings + excluded.bookings,
+                        cancellations = cancellations + excluded.cancellations,
+                        revenue = revenue + excluded.revenue;
+                ''')
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS rollup_reservations_{suffix} {when} BEGIN
+                    {''.join(statements)}
+                END
+            ''')
+
+        # zmiana ceny, terminu albo trenera sesji przenosi jej wkład ze starych kluczy na nowe
+        session_row = 'SELECT {row}.id AS id, {row}.trainer_id AS trainer_id, ' \
+                      '{row}.start_time AS start_time, {row}.price AS price'
+        statements = []
+        for table, keys, exprs in self.ROLLUPS:
+            for row, sign in (('old', -1), ('new', 1)):
+                statements.append(f'''
+                    INSERT INTO {table} ({keys[0]}, {keys[1]}, bookings, cancellations, revenue)
+                    SELECT {exprs[0]}, {exprs[1]}, {sign} * COUNT(*), {sign} * SUM(r.status = 'CANCELLED'),
+                           {sign} * SUM(r.status = 'ACTIVE') * COALESCE(s.price, 0)
+                    FROM reservations r, ({session_row.format(row=row)}) s
+                    WHERE r.session_id = s.id
+                    GROUP BY 1, 2
+                    ON CONFLICT ({keys[0]}, {keys[1]}) DO UPDATE SET
+                        bookings = bookings + excluded.bookings,
+                        cancellations = cancellations + excluded.cancellations,
+                        revenue = revenue + excluded.revenue;
+                ''')
+            # puste wiersze po starych kluczach - pełne przeliczenie też by ich nie miało
+            statements.append(f'''
+                DELETE FROM {table}
+                WHERE bookings = 0 AND cancellations = 0
+                  AND ({keys[0]}, {keys[1]}) IN (
+                      SELECT {exprs[0]}, {exprs[1]}
+                      FROM reservations r, ({session_row.format(row='old')}) s
+                      WHERE r.session_id = s.id
+                  );
+            ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS rollup_sessions_au AFTER UPDATE OF price, start_time, trainer_id ON sessions
+            WHEN old.price IS NOT new.price OR old.start_time IS NOT new.start_time
+              OR old.trainer_id IS NOT new.trainer_id
+            BEGIN
+                {''.join(statements)}
+            END
+        ''')
+
+        # tabele dodane do istniejącej bazy - jednorazowe wypełnienie z dotychczasowych rezerwacji
+        if created:
+            self._fill_rollups(cursor)
+
+    def _create_feed_versions(self, cursor):
+        # licznik zmian kalendarza użytkownika - podbijany triggerami, klucz cache plików .ics
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS feed_versions
+            (
+                user_id INTEGER PRIMARY KEY,
+                version INTEGER NOT NULL DEFAULT 0,
+                FOREIGN KEY (user_id) REFERENCES users(id)
+            )
+        ''')
+
+        bump = '''
+            INSERT INTO feed_versions (user_id, version) SELECT {user}, 1 WHERE {user} IS NOT NULL
+            ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+        '''
+        bump_participants = '''
+            INSERT INTO feed_versions (user_id, version)
+            SELECT client_id, 1 FROM reservations WHERE session_id = new.id AND status = 'ACTIVE'
+            ON CONFLICT (user_id) DO UPDATE SET version = version + 1;
+        '''
+        triggers = {
+            'feed_reservations_ai': ('AFTER INSERT ON reservations', bump.format(user='new.client_id')),
+            'feed_reservations_au': ('AFTER UPDATE OF status ON reservations WHEN old.status IS NOT new.status',
+                                     bump.format(user='new.client_id')),
+            'feed_reservations_ad': ('AFTER DELETE ON reservations', bump.format(user='old.client_id')),
+            'feed_sessions_ai': ('AFTER INSERT ON sessions', bump.format(user='new.trainer_id')),
+            'feed_sessions_au': (
+                'AFTER UPDATE OF type, name, description, trainer_id, start_time, duration_min, status ON sessions',
+                bump.format(user='old.trainer_id')
+                + bump.format(user='CASE WHEN new.trainer_id IS NOT old.trainer_id THEN new.trainer_id END')
+                + bump_participants,
+            ),
+            'feed_sessions_ad': ('AFTER DELETE ON sessions', bump.format(user='old.trainer_id')),
+        }
+        for name, (when, body) in triggers.items():
+            cursor.execute(f'CREATE TRIGGER IF NOT EXISTS {name} {when} BEGIN {body} END')
+
+    def _create_participant_versions(self, cursor):
+        # licznik zmian list uczestników sesji trenera - unieważnia cache w widoku trenera
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS participant_versions
+            (
+                trainer_id INTEGER PRIMARY KEY,
+                version INTEGER NOT NULL DEFAULT 0,
+                FOREIGN KEY (trainer_id) REFERENCES users(id)
+            )
+        ''')
+
+        bump = '''
+            INSERT INTO participant_versions (trainer_id, version)
+            SELECT trainer_id, 1 FROM sessions WHERE id = {row}.session_id
+            ON CONFLICT (trainer_id) DO UPDATE SET version = version + 1;
+        '''
+        triggers = {
+            'participants_reservations_ai': ('AFTER INSERT ON reservations', bump.format(row='new')),
+            'participants_reservations_au': (
+                'AFTER UPDATE OF status ON reservations WHEN old.status IS NOT new.status', bump.format(row='new')
+            ),
+            'participants_reservations_ad': ('AFTER DELETE ON reservations', bump.format(row='old')),
+        }
+        for name, (when, body) in triggers.items():
+            cursor.execute(f'CREATE TRIGGER IF NOT EXISTS {name} {when} BEGIN {body} END')
+
+    def _create_attendance(self, cursor):
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS attendance
+            (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                reservation_id INTEGER NOT NULL UNIQUE,
+                client_id INTEGER NOT NULL,
+                session_id INTEGER NOT NULL,
+                checked_in_at TEXT NOT NULL,
+                FOREIGN KEY (reservation_id) REFERENCES reservations(id),
+                FOREIGN KEY (client_id) REFERENCES users(id),
+                FOREIGN KEY (session_id) REFERENCES sessions(id)
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_attendance_session ON attendance(session_id)')
+
+        # dziennik zmian rezerwacji - czytnik (kiosk) dociąga tylko to, co zmieniło się od ostatniego id
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS reservation_changes
+            (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                reservation_id INTEGER NOT NULL,
+                changed_at TEXT NOT NULL DEFAULT (datetime('now', 'localtime'))
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_reservation_changes_time ON reservation_changes(changed_at)')
+
+        log = 'INSERT INTO reservation_changes (reservation_id) VALUES ({row}.id);'
+        triggers = {
+            'changes_reservations_ai': ('AFTER INSERT ON reservations', log.format(row='new')),
+            'changes_reservations_au': (
+                'AFTER UPDATE OF status ON reservations WHEN old.status IS NOT new.status', log.format(row='new')
+            ),
+            'changes_reservations_ad': ('AFTER DELETE ON reservations', log.format(row='old')),
+            'changes_sessions_au': (
+                'AFTER UPDATE OF start_time, duration_min, name, status ON sessions',
+                'INSERT INTO reservation_changes (reservation_id) '
+                'SELECT id FROM reservations WHERE session_id = new.id AND status = \'ACTIVE\';',
+            ),
+        }
+        for name, (when, body) in triggers.items():
+            cursor.execute(f'CREATE TRIGGER IF NOT EXISTS {name} {when} BEGIN {body} END')
+
+    def _create_billing(self, cursor):
+        # jedna faktura na klienta i miesiąc - powtórzony przebieg niczego nie zdubluje
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS invoices
+            (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                client_id INTEGER NOT NULL,
+                month TEXT NOT NULL,
+                items INTEGER NOT NULL,
+                pt_items INTEGER NOT NULL,
+                amount REAL NOT NULL,
+                created_at TEXT NOT NULL,
+                UNIQUE (client_id, month),
+                FOREIGN KEY (client_id) REFERENCES users(id)
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_invoices_month ON invoices(month, client_id)')
+
+        # postęp przebiegu - ostatni rozliczony klient, od niego wznawiamy po przerwaniu
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS billing_runs
+            (
+                month TEXT PRIMARY KEY,
+                status TEXT NOT NULL CHECK (status IN ('RUNNING', 'DONE')),
+                last_client_id INTEGER NOT NULL DEFAULT 0,
+                invoices INTEGER NOT NULL DEFAULT 0,
+                started_at TEXT NOT NULL,
+                finished_at TEXT
+            )
+        ''')
+
+    def _create_credits(self, cursor):
+        """Karnety: dziennik ruchów wejść i saldo utrzymywane triggerem.
+
+        Saldo zmienia tylko trigger na credit_ledger, w tej samej instrukcji co
+        wpis - CHECK (balance >= 0) odrzuca wpis, który zszedłby poniżej zera,
+        więc równoległe zapisy nie wydadzą tego samego wejścia dwa razy.
+        """
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS credit_accounts
+            (
+                client_id INTEGER PRIMARY KEY,
+                balance INTEGER NOT NULL DEFAULT 0 CHECK (balance >= 0),
+                FOREIGN KEY (client_id) REFERENCES users(id)
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS credit_ledger
+            (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                client_id INTEGER NOT NULL,
+                delta INTEGER NOT NULL,
+                reason TEXT NOT NULL CHECK (reason IN ('PURCHASE', 'BOOKING', 'REFUND', 'ADJUST')),
+                reservation_id INTEGER,
+                created_at TEXT NOT NULL,
+                FOREIGN KEY (client_id) REFERENCES users(id),
+                FOREIGN KEY (reservation_id) REFERENCES reservations(id)
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_credit_ledger_client ON credit_ledger(client_id, id)')
+        # jedno pobranie i jeden zwrot na rezerwację (NULL-e w indeksie UNIQUE się nie powtarzają)
+        cursor.execute(
+            'CREATE UNIQUE INDEX IF NOT EXISTS idx_credit_ledger_reservation ON credit_ledger(reservation_id, reason)'
+        )
+
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS credit_ledger_ai AFTER INSERT ON credit_ledger BEGIN
+                -- CHECK sprawdzany jest przed ON CONFLICT, więc najpierw puste konto, potem zmiana salda
+                INSERT INTO credit_accounts (client_id) VALUES (new.client_id) ON CONFLICT (client_id) DO NOTHING;
+                UPDATE credit_accounts SET balance = balance + new.delta WHERE client_id = new.client_id;
+            END
+        ''')
+        # anulowanie rezerwacji opłaconej karnetem oddaje wejście w tej samej transakcji
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS credit_reservations_cancel AFTER UPDATE OF status ON reservations
+            WHEN old.status = 'ACTIVE' AND new.status = 'CANCELLED' BEGIN
+                INSERT INTO credit_ledger (client_id, delta, reason, reservation_id, created_at)
+                SELECT client_id, -delta, 'REFUND', reservation_id, datetime('now', 'localtime')
+                FROM credit_ledger
+                WHERE reservation_id = new.id AND reason = 'BOOKING'
+                ON CONFLICT (reservation_id, reason) DO NOTHING;
+            END
+        ''')
+
+    def _create_seat_holds(self, cursor):
+        # miejsce trzymane na czas płatności online - zajmuje pojemność sesji do expires_at
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS seat_holds
+            (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id INTEGER NOT NULL,
+                client_id INTEGER NOT NULL,
+                created_at TEXT NOT NULL,
+                expires_at TEXT NOT NULL,
+                UNIQUE (session_id, client_id),
+                FOREIGN KEY (session_id) REFERENCES sessions(id),
+                FOREIGN KEY (client_id) REFERENCES users(id)
+            )
+        ''')
+        # sprzątanie wygasłych po indeksie - bez skanowania całej tabeli
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_seat_holds_expires ON seat_holds(expires_at)')
+        # rezerwacja (także z listy oczekujących) zwalnia trzymane miejsce tego klienta
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS holds_reservations_ai AFTER INSERT ON reservations
+            WHEN new.status = 'ACTIVE' BEGIN
+                DELETE FROM seat_holds WHERE session_id = new.session_id AND client_id = new.client_id;
+            END
+        ''')
+
+    @classmethod
+    def _fill_rollups(cls, cur):
+        # pełne przeliczenie z bieżących i zarchiwizowanych danych
+        for table, keys, exprs in cls.ROLLUPS:
+            cur.execute(f'DELETE FROM {table}')
+            cur.execute(f'''
+                INSERT INTO {table} ({keys[0]}, {keys[1]}, bookings, cancellations, revenue)
+                SELECT
+                    {exprs[0]},
+                    {exprs[1]},
+                    COUNT(*),
+                    SUM(r.status = 'CANCELLED'),
+                    SUM(CASE WHEN r.status = 'ACTIVE' THEN COALESCE(s.price, 0) ELSE 0 END)
+                FROM (
+                    SELECT client_id, session_id, status FROM reservations
+                    UNION ALL
+                    SELECT client_id, session_id, status FROM reservations_archive
+                ) r
+                JOIN (
+                    SELECT id, trainer_id, start_time, price FROM sessions
+                    UNION ALL
+                    SELECT id, trainer_id, start_time, price FROM sessions_archive
+                ) s ON s.id = r.session_id
+                GROUP BY 1, 2
+            ''')
+
+    def rebuild_rollups(self):
+        # backfill w jednej transakcji
+        with self.connect() as conn:
+            cur = conn.cursor()
+            self._fill_rollups(cur)
             conn.commit()
 
+    def get_session_day_rollup(self, first_day, last_day):
+        with self.connect() as conn:
+            cur = conn.cursor()
+            cur.execute('''
+                SELECT day, session_id, bookings, cancellations, revenue
+                FROM rollup_session_day
+                WHERE day >= ? AND day <= ?
+                ORDER BY day, session_id
+            ''', (str(first_day), str(last_day)))
+            return cur.fetchall()
+
+    def get_trainer_week_rollup(self, week_start, trainer_id=None):
+        with self.connect() as conn:
+            cur = conn.cursor()
+            if trainer_id is None:
+                cur.execute('''
+                    SELECT trainer_id, week_start, bookings, cancellations, revenue
+                    FROM rollup_trainer_week
+                    WHERE week_start = ?
+                    ORDER BY trainer_id
+                ''', (str(week_start),))
+            else:
+                cur.execute('''
+                    SELECT trainer_id, week_start, bookings, cancellations, revenue
+                    FROM rollup_trainer_week
+                    WHERE trainer_id = ? AND week_start = ?
+                ''', (trainer_id, str(week_start)))
+            return cur.fetchall()
+
+    def get_client_month_rollup(self, month, client_id=None):
+        with self.connect() as conn:
+            cur = conn.cursor()
+            if client_id is None:
+                cur.execute('''
+                    SELECT client_id, month, bookings, cancellations, revenue
+                    FROM rollup_client_month
+                    WHERE month = ?
+                    ORDER BY client_id
+                ''', (month,))
+            else:
+                cur.execute('''
+                    SELECT client_id, month, bookings, cancellations, revenue
+                    FROM rollup_client_month
+                    WHERE client_id = ? AND month = ?
+                ''', (client_id, month))
+            return cur.fetchall()
+
+    @staticmethod
+    def _add_missing_columns(cursor, table, columns):
+        # proste migracje starszych plików bazy - dopisuje brakujące kolumny na końcu tabeli
+        cursor.execute(f'PRAGMA table_info({table})')
+        existing = {row[1] for row in cursor.fetchall()}
+        added = []
+        for name, definition in columns:
+            if name not in existing:
+                cursor.execute(f'ALTER TABLE {table} ADD COLUMN {name} {definition}')
+                added.append(name)
+        return added
+
     # użytkownicy
     def add_user(self, first_name, last_name, email, password_hash, role):
         with self.connect() as conn:
@@ -74,6 +815,30 @@ class Database:
             cur.execute('SELECT * FROM users WHERE email = ?', (email,))
             return cur.fetchone()
 
+    def find_existing_emails(self, emails):
+        # jedno zapytanie dla całej listy - email ma indeks UNIQUE
+        with self.connect() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                "SELECT email FROM users WHERE email IN (SELECT value FROM json_each(?))",
+                (json.dumps(list(emails)),)
+            )
+            return {row[0] for row in cur.fetchall()}
+
+    def add_users(self, rows):
+        # rows: (first_name, last_name, email, password_hash, role); jedna transakcja,
+        # email zajęty w międzyczasie jest pomijany zamiast wycofywać cały import
+        with self.connect() as conn:
+            cur = conn.cursor()
+            before = conn.total_changes
+            cur.executemany('''
+                INSERT INTO users (first_name, last_name, email, password_hash, role)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (email) DO NOTHING
+            ''', rows)
+            conn.commit()
+            return conn.total_changes - before
+
     def get_user_by_id(self, user_id):
         with self.connect() as conn:
             cur = conn.cursor()
@@ -123,15 +888,22 @@ class Database:
                 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             ''', (
                 session_type, name, description, difficulty_level, price,
-                trainer_id, start_time, duration_min, capacity, status
+                trainer_id, _normalize_ts(start_time), duration_min, capacity, status
             ))
             conn.commit()
             return cur.lastrowid
 
-    def get_all_sessions(self):
+    def get_all_sessions(self, include_archived=False):
         with self.connect() as conn:
             cur = conn.cursor()
-            cur.execute('SELECT * FROM sessions WHERE status = "ACTIVE"')
+            if include_archived:
+                cur.execute('''
+                    SELECT * FROM sessions WHERE status = "ACTIVE"
+                    UNION ALL
+                    SELECT * FROM sessions_archive WHERE status = "ACTIVE"
+                ''')
+            else:
+                cur.execute('SELECT * FROM sessions WHERE status = "ACTIVE"')
             return cur.fetchall()
 
     def get_session_by_id(self, session_id):
@@ -140,37 +912,712 @@ class Database:
             cur.execute('SELECT * FROM sessions WHERE id = ?', (session_id,))
             return cur.fetchone()
 
-    def get_sessions_for_trainer(self, trainer_id):
+    def get_sessions_for_trainer(self, trainer_id, include_archived=False):
         with self.connect() as conn:
             cur = conn.cursor()
-            cur.execute('SELECT * FROM sessions WHERE trainer_id = ? AND status = "ACTIVE"', (trainer_id,))
+            if include_archived:
+                cur.execute('''
+                    SELECT * FROM sessions WHERE trainer_id = ? AND status = "ACTIVE"
+                    UNION ALL
+                    SELECT * FROM sessions_archive WHERE trainer_id = ? AND status = "ACTIVE"
+                ''', (trainer_id, trainer_id))
+            else:
+                cur.execute('SELECT * FROM sessions WHERE trainer_id = ? AND status = "ACTIVE"', (trainer_id,))
             return cur.fetchall()
 
-    def update_session(self, session_id, **changes):
+    def update_session(self, session_id, notify=False, **changes):
         if not changes:
             return False
 
+        if "start_time" in changes:
+            changes["start_time"] = _normalize_ts(changes["start_time"])
+
         fields = ", ".join([f"{k} = ?" for k in changes.keys()])
         values = list(changes.values()) + [session_id]
 
         with self.connect() as conn:
             cur = conn.cursor()
             cur.execute(f"UPDATE sessions SET {fields} WHERE id = ?", values)
+            if notify:
+                self._enqueue_participant_notifications(cur, "SESSION_CHANGED", "id = ?", (session_id,))
+            if "capacity" in changes:
+                self._promote_waitlist(cur, session_id)
             conn.commit()
         return True
 
-    def cancel_session(self, session_id):
+    @staticmethod
+    def _enqueue_participant_notifications(cur, kind, where, params):
+        # jeden INSERT ... SELECT dla wszystkich uczestników pasujących sesji
+        created_at = datetime.now().isoformat(sep=" ", timespec="seconds")
+        cur.execute(f'''
+            INSERT INTO notifications_outbox (user_id, session_id, kind, payload, created_at)
+            SELECT
+                u.id,
+                s.id,
+                ?,
+                json_object(
+                    'email', u.email,
+                    'first_name', u.first_name,
+                    'last_name', u.last_name,
+                    'session_name', s.name,
+                    'start_time', s.start_time,
+                    'duration_min', s.duration_min
+                ),
+                ?
+            FROM reservations r
+            JOIN sessions s ON s.id = r.session_id
+            JOIN users u ON u.id = r.client_id
+            WHERE r.status = 'ACTIVE' AND r.session_id IN (SELECT id FROM sessions WHERE {where})
+        ''', (kind, created_at, *params))
+        return cur.rowcount
+
+    def _cancel_sessions_where(self, where, params):
+        # sesje i wszystkie ich aktywne rezerwacje w jednej transakcji, bez pętli po wierszach
         with self.connect() as conn:
             cur = conn.cursor()
-            cur.execute('UPDATE sessions SET status = "CANCELLED" WHERE id = ?', (session_id,))
+            self._enqueue_participant_notifications(
+                cur, "SESSION_CANCELLED", f"status = 'ACTIVE' AND {where}", params
+            )
+            cur.execute(f'''
+                UPDATE reservations SET status = 'CANCELLED'
+                WHERE status = 'ACTIVE' AND session_id IN (SELECT id FROM sessions WHERE {where})
+            ''', params)
+            reservations = cur.rowcount
+            cur.execute(f'''
+                UPDATE waitlist SET status = 'CANCELLED'
+                WHERE status = 'WAITING' AND session_id IN (SELECT id FROM sessions WHERE {where})
+            ''', params)
+            cur.execute(f"UPDATE sessions SET status = 'CANCELLED' WHERE status = 'ACTIVE' AND {where}", params)
+            sessions = cur.rowcount
             conn.commit()
+        return sessions, reservations
+
+    def cancel_session(self, session_id):
+        return self._cancel_sessions_where("id = ?", (session_id,))
+
+    def cancel_sessions(self, session_ids):
+        ids = json.dumps([int(i) for i in session_ids])
+        return self._cancel_sessions_where("id IN (SELECT value FROM json_each(?))", (ids,))
+
+    def cancel_trainer_sessions_between(self, trainer_id, start, end):
+        return self._cancel_sessions_where(
+            "trainer_id = ? AND start_time >= ? AND start_time < ?",
+            (trainer_id, _normalize_ts(start), _normalize_ts(end)),
+        )
+
+    def cancel_sessions_between(self, start, end):
+        return self._cancel_sessions_where(
+            "start_time >= ? AND start_time < ?",
+            (_normalize_ts(start), _normalize_ts(end)),
+        )
 
     def session_exists(self, name, start_time):
         with self.connect() as conn:
             cur = conn.cursor()
-            cur.execute("SELECT 1 FROM sessions WHERE name = ? AND start_time = ?", (name, start_time))
+            cur.execute(
+                "SELECT 1 FROM sessions WHERE name = ? AND start_time = ?",
+                (name, _normalize_ts(start_time))
+            )
             return cur.fetchone() is not None
 
+    def get_trainer_intervals(self, trainer_id, start, end, exclude_session_id=None):
+        """Aktywne sesje trenera nachodzące na [start, end): (id, start_time, duration_min).
+
+        Dolna granica to start minus najdłuższa sesja trenera (MAX z indeksu),
+        więc przeszukujemy tylko wąski zakres idx_sessions_trainer.
+        """
+        start, end = _normalize_ts(start), _normalize_ts(end)
+        with self.connect() as conn:
+            cur = conn.cursor()
+            cur.execute('''
+                SELECT id, start_time, duration_min
+                FROM sessions
+                WHERE trainer_id = ? AND status = 'ACTIVE'
+                  AND start_time < ?
+                  AND start_time > datetime(?, '-' || (
+                      SELECT COALESCE(MAX(duration_min), 0) FROM sessions WHERE trainer_id = ?
+                  ) || ' minutes')
+                  AND datetime(start_time, '+' || duration_min || ' minutes') > ?
+                  AND id != ?
+                ORDER BY start_time
+            ''', (trainer_id, end, start, trainer_id, start, exclude_session_id or -1))
+            return cur.fetchall()
+
+    def get_busy_intervals(self, start, end, trainer_id=None):
+        # wszystkie aktywne sesje w zakresie, posortowane po trenerze i starcie (jedno zapytanie na cały tydzień)
+        query = '''
+            SELECT trainer_id, start_time, duration_min
+            FROM sessions
+            WHERE status = 'ACTIVE' AND start_time >= datetime(?, '-1 day') AND start_time < ?
+        '''
+        params = [_normalize_ts(start), _normalize_ts(end)]
+        if trainer_id is not None:
+            query += ' AND trainer_id = ?'
+            params.append(trainer_id)
+        query += ' ORDER BY trainer_id, start_time'
+
+        with self.connect() as conn:
+            cur = conn.cursor()
+            cur.execute(query, params)
+            return cur.fetchall()
+
+    def find_trainer_conflicts(self, trainer_id, start, end, exclude_session_id=None):
+        return [r[0] for r in self.get_trainer_intervals(trainer_id, start, end, exclude_session_id)]
+
+    def add_sessions(self, sessions):
+        # sessions: krotki w kolejności kolumn jak w add_session, wszystko w jednej transakcji
+        rows = [
+            (t, name, desc, diff, price, trainer_id, _normalize_ts(start), duration, capacity, status)
+            for (t, name, desc, diff, price, trainer_id, start, duration, capacity, status) in sessions
+        ]
+        with self.connect() as conn:
+            cur = conn.cursor()
+            cur.executemany('''
+                INSERT INTO sessions (
+                    type, name, description, difficulty_level, price,
+                    trainer_id, start_time, duration_min, capacity, status
+                )
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', rows)
+            conn.commit()
+        return len(rows)
+
+    def query_sessions(self, query):
+        # wiersze sesji z dodatkową kolumną reserved na końcu
+        sql, params = query.compile()
+        with self.connect() as conn:
+            cur = conn.cursor()
+            cur.execute(sql, params)
+            return cur.fetchall()
+
+    def search_sessions(self, text, limit=50):
+        match = _fts_query(text)
+        if not match:
+            return []
+
+        with self.connect() as conn:
+            cur = conn.cursor()
+            cur.execute('''
+                SELECT s.*
+                FROM sessions_fts f
+                JOIN sessions s ON s.id = f.rowid
+                WHERE sessions_fts MATCH ? AND s.status = 'ACTIVE'
+                ORDER BY f.rank
+                LIMIT ?
+            ''', (match, int(limit)))
+            return cur.fetchall()
+
+    def get_schedule_overview(self, start, end):
+        # (dzień, godzina, sesje, miejsca, zapisani) dla aktywnych sesji z [start, end) - jedno grupowane zapytanie
+        with self.connect() as conn:
+            cur = conn.cursor()
+            cur.execute(f'''
+                SELECT
+                    substr(s.start_time, 1, 10),
+                    CAST(substr(s.start_time, 12, 2) AS INTEGER),
+                    COUNT(*),
+                    SUM(s.capacity),
+                    SUM({SessionQuery._RESERVED})
+                FROM sessions s
+                WHERE s.status = 'ACTIVE' AND s.start_time >= ? AND s.start_time < ?
+                GROUP BY 1, 2
+                ORDER BY 1, 2
+            ''', (_normalize_ts(start), _normalize_ts(end)))
+            return cur.fetchall()
+
+    def archive_sessions_before(self, cutoff):
+        # przenosi stare sesje razem z rezerwacjami w jednej transakcji
+        cutoff = _normalize_ts(cutoff)
+        with self.connect() as conn:
+            cur = conn.cursor()
+            cur.execute('''
+                INSERT INTO reservations_archive
+                SELECT r.* FROM reservations r
+                WHERE r.session_id IN (SELECT id FROM sessions WHERE start_time < ?)
+            ''', (cutoff,))
+            reservations = cur.rowcount
+            cur.execute('''
+                DELETE FROM reservations
+                WHERE session_id IN (SELECT id FROM sessions WHERE start_time < ?)
+            ''', (cutoff,))
+
+            cur.execute(
+                'DELETE FROM waitlist WHERE session_id IN (SELECT id FROM sessions WHERE start_time < ?)',
+                (cutoff,)
+            )
+
+            cur.execute('INSERT INTO sessions_archive SELECT * FROM sessions WHERE start_time < ?', (cutoff,))
+            sessions = cur.rowcount
+            cur.execute('DELETE FROM sessions WHERE start_time < ?', (cutoff,))
+            conn.commit()
+        return sessions, reservations
+
+    # analityka - surowe dane do obliczeń wektorowych
+    def get_sessions_for_analytics(self, start=None, end=None):
+        query = '''
+            SELECT
+                id,
+                (CAST(strftime('%w', start_time) AS INTEGER) + 6) % 7,
+                CAST(substr(start_time, 12, 2) AS INTEGER),
+                COALESCE(name, ''),
+                COALESCE(difficulty_level, ''),
+                trainer_id,
+                capacity
+            FROM sessions
+            WHERE status = 'ACTIVE'
+        '''
+        params = []
+        if start is not None:
+            query += ' AND start_time >= ?'
+            params.append(_normalize_ts(start))
+        if end is not None:
+            query += ' AND start_time < ?'
+            params.append(_normalize_ts(end))
+
+        with self.connect() as conn:
+            cur = conn.cursor()
+            cur.execute(query, params)
+            return cur.fetchall()
+
+    def iter_reservation_statuses(self, start=None, end=None):
+        """Generator par (session_id, 1 jeśli ACTIVE / 0 jeśli CANCELLED) bez budowania listy w pamięci."""
+        query = "SELECT session_id, status = 'ACTIVE' FROM reservations WHERE 1 = 1"
+        params = []
+        if start is not None:
+            query += ' AND starts_at >= ?'
+            params.append(_normalize_ts(start))
+        if end is not None:
+            query += ' AND starts_at < ?'
+            params.append(_normalize_ts(end))
+
+        with self.connect() as conn:
+            cur = conn.cursor()
+            cur.execute(query, params)
+            yield from cur
+
+    # eksport - generatory paczek wierszy (fetchmany), stała pamięć niezależnie od rozmiaru tabeli
+    @staticmethod
+    def _export_filters(start, end, trainer_id):
+        where = []
+        params = []
+        if start is not None:
+            where.append('s.start_time >= ?')
+            params.append(_normalize_ts(start))
+        if end is not None:
+            where.append('s.start_time < ?')
+            params.append(_normalize_ts(end))
+        if trainer_id is not None:
+            where.append('s.trainer_id = ?')
+            params.append(int(trainer_id))
+        return (' WHERE ' + ' AND '.join(where)) if where else '', params
+
+    def _iter_chunks(self, query, params, chunk_size):
+        with self.connect() as conn:
+            cur = conn.cursor()
+            cur.execute(query, params)
+            while True:
+                rows = cur.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield rows
+
+    def iter_reservations_export(self, start=None, end=None, trainer_id=None, include_archived=False,
+                                 chunk_size=5000):
+        where, params = self._export_filters(start, end, trainer_id)
+        select = '''
+            SELECT
+                r.id, r.created_at, r.status,
+                u.id, u.first_name, u.last_name, u.email,
+                s.id, s.name, s.type, s.start_time, s.duration_min, s.price, s.trainer_id
+            FROM {reservations} r
+            JOIN {sessions} s ON s.id = r.session_id
+            JOIN users u ON u.id = r.client_id
+        ''' + where
+        query = select.format(reservations='reservations', sessions='sessions')
+        if include_archived:
+            query += ' UNION ALL ' + select.format(reservations='reservations_archive', sessions='sessions_archive')
+            params = params * 2
+        query += ' ORDER BY 11, 1'
+        return self._iter_chunks(query, params, chunk_size)
+
+    def iter_sessions_export(self, start=None, end=None, trainer_id=None, include_archived=False,
+                             chunk_size=5000):
+        where, params = self._export_filters(start, end, trainer_id)
+        select = '''
+            SELECT s.*, (
+                SELECT COUNT(*) FROM {reservations} r WHERE r.session_id = s.id AND r.status = 'ACTIVE'
+            ) AS reserved
+            FROM {sessions} s
+        ''' + where
+        query = select.format(reservations='reservations', sessions='sessions')
+        if include_archived:
+            query += ' UNION ALL ' + select.format(reservations='reservations_archive', sessions='sessions_archive')
+            params = params * 2
+        query += ' ORDER BY 8, 1'
+        return self._iter_chunks(query, params, chunk_size)
+
+    # kalendarze .ics
+    def get_feed_version(self, user_id):
+        with self.connect() as conn:
+            cur = conn.cursor()
+            cur.execute('SELECT version FROM feed_versions WHERE user_id = ?', (user_id,))
+            row = cur.fetchone()
+            return row[0] if row else 0
+
+    def get_feed_versions(self):
+        # (user_id, rola, wersja) dla wszystkich klientów i trenerów
+        with self.connect() as conn:
+            cur = conn.cursor()
+            cur.execute('''
+                SELECT u.id, u.role, COALESCE(f.version, 0)
+                FROM users u
+                LEFT JOIN feed_versions f ON f.user_id = u.id
+                WHERE u.role IN ('client', 'trainer')
+                ORDER BY u.id
+            ''')
+            return cur.fetchall()
+
+    def iter_feed_events(self, role, user_ids, chunk_size=5000):
+        """Wydarzenia do kalendarzy wielu użytkowników jednym zapytaniem.
+
+        Wiersze: (user_id, uid, type, name, description, start_time, duration_min),
+        posortowane po użytkowniku i czasie rozpoczęcia.
+        """
+        ids = json.dumps([int(i) for i in user_ids])
+        if role == 'trainer':
+            query = '''
+                SELECT s.trainer_id, 'session-' || s.id, s.type, s.name, s.description, s.start_time, s.duration_min
+                FROM sessions s
+                WHERE s.trainer_id IN (SELECT value FROM json_each(?)) AND s.status = 'ACTIVE'
+                ORDER BY s.trainer_id, s.start_time
+            '''
+        else:
+            query = '''
+                SELECT r.client_id, 'reservation-' || r.id, s.type, s.name, s.description, s.start_time,
+                       s.duration_min
+                FROM reservations r
+                JOIN sessions s ON s.id = r.session_id
+                WHERE r.client_id IN (SELECT value FROM json_each(?)) AND r.status = 'ACTIVE'
+                  AND s.status = 'ACTIVE'
+                ORDER BY r.client_id, s.start_time
+            '''
+        for rows in self._iter_chunks(query, (ids,), chunk_size):
+            yield from rows
+
+    # check-in
+    _CHECKIN_SELECT = '''
+        SELECT
+            r.id, r.client_id, u.email, u.first_name, s.id, s.name, s.start_time, s.duration_min,
+            a.id IS NOT NULL
+        FROM reservations r
+        JOIN sessions s ON s.id = r.session_id
+        JOIN users u ON u.id = r.client_id
+        LEFT JOIN attendance a ON a.reservation_id = r.id
+    '''
+
+    def get_checkin_snapshot(self, start, end):
+        """Aktywne rezerwacje na sesje z [start, end) i id ostatniej zmiany, od której liczyć kolejne."""
+        with self.connect() as conn:
+            cur = conn.cursor()
+            # id czytane przed danymi - zmiana w międzyczasie zostanie po prostu zastosowana drugi raz
+            cur.execute('SELECT COALESCE(MAX(id), 0) FROM reservation_changes')
+            last_change = cur.fetchone()[0]
+            cur.execute(self._CHECKIN_SELECT + '''
+                WHERE s.status = 'ACTIVE' AND s.start_time >= ? AND s.start_time < ? AND r.status = 'ACTIVE'
+            ''', (_normalize_ts(start), _normalize_ts(end)))
+            return last_change, cur.fetchall()
+
+    def get_checkin_changes(self, after_id, limit=1000):
+        """Zmiany od after_id: (id zmiany, id rezerwacji, wiersz jak w snapshot albo None, status).
+
+        Wiersz jest None, gdy rezerwacji już nie ma (archiwizacja).
+        """
+        with self.connect() as conn:
+            cur = conn.cursor()
+            cur.execute('''
+                SELECT c.id, c.reservation_id, r.status
+                FROM reservation_changes c
+                LEFT JOIN reservations r ON r.id = c.reservation_id
+                WHERE c.id > ?
+                ORDER BY c.id
+                LIMIT ?
+            ''', (after_id, limit))
+            changes = cur.fetchall()
+            if not changes:
+                return []
+            ids = json.dumps(sorted({reservation_id for _, reservation_id, _ in changes}))
+            cur.execute(self._CHECKIN_SELECT + '''
+                WHERE r.id IN (SELECT value FROM json_each(?)) AND s.status = 'ACTIVE'
+            ''', (ids,))
+            rows = {row[0]: row for row in cur.fetchall()}
+            return [
+                (change_id, reservation_id, rows.get(reservation_id), status)
+                for change_id, reservation_id, status in changes
+            ]
+
+    def add_attendance(self, records):
+        # records: (reservation_id, client_id, session_id, checked_in_at); powtórne wejście nic nie zmienia
+        with self.connect() as conn:
+            cur = conn.cursor()
+            before = conn.total_changes
+            cur.executemany('''
+                INSERT INTO attendance (reservation_id, client_id, session_id, checked_in_at)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT (reservation_id) DO NOTHING
+            ''', records)
+            conn.commit()
+            return conn.total_changes - before
+
+    def get_session_attendance(self, session_id):
+        with self.connect() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                'SELECT client_id, checked_in_at FROM attendance WHERE session_id = ? ORDER BY checked_in_at',
+                (session_id,)
+            )
+            return cur.fetchall()
+
+    def prune_reservation_changes(self, before):
+        with self.connect() as conn:
+            cur = conn.cursor()
+            cur.execute('DELETE FROM reservation_changes WHERE changed_at < ?', (_normalize_ts(before),))
+            conn.commit()
+            return cur.rowcount
+
+    # rozliczenia miesięczne
+    def start_billing_run(self, month, started_at):
+        """Zakłada przebieg dla miesiąca albo zwraca istniejący: (status, last_client_id, faktury)."""
+        with self.connect() as conn:
+            cur = conn.cursor()
+            cur.execute('''
+                INSERT INTO billing_runs (month, status, started_at) VALUES (?, 'RUNNING', ?)
+                ON CONFLICT (month) DO NOTHING
+            ''', (month, started_at))
+            cur.execute('SELECT status, last_client_id, invoices FROM billing_runs WHERE month = ?', (month,))
+            row = cur.fetchone()
+            conn.commit()
+            return row
+
+    def get_billing_run(self, month):
+        with self.connect() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                'SELECT month, status, last_client_id, invoices, started_at, finished_at FROM billing_runs '
+                'WHERE month = ?',
+                (month,)
+            )
+            return cur.fetchone()
+
+    def bill_clients_after(self, month, after_client_id, limit, created_at):
+        """Faktury za miesiąc dla kolejnej paczki klientów (id > after_client_id) jednym INSERT ... SELECT.
+
+        Pomija rezerwacje opłacone wejściem z karnetu.
+
+        Faktury i przesunięcie kursora przebiegu zapisywane są w jednej
+        transakcji, więc przerwany przebieg wznawia się od pierwszej
+        nierozliczonej paczki. Zwraca (id ostatniego klienta paczki albo
+        None, gdy klientów już nie ma; liczba nowych faktur).
+        """
+        first_day = f'{month}-01 00:00:00'
+        with self.connect() as conn:
+            cur = conn.cursor()
+            cur.execute('BEGIN IMMEDIATE')
+            cur.execute('''
+                SELECT MAX(id) FROM (
+                    SELECT id FROM users WHERE id > ? AND role = 'client' ORDER BY id LIMIT ?
+                )
+            ''', (after_client_id, int(limit)))
+            last_id = cur.fetchone()[0]
+            if last_id is None:
+                conn.commit()
+                return None, 0
+
+            # rezerwacje z miesiąca, także te już przeniesione do archiwum
+            cur.execute('''
+                INSERT INTO invoices (client_id, month, items, pt_items, amount, created_at)
+                SELECT r.client_id, ?, COUNT(*), SUM(COALESCE(s.type, sa.type) = 'pt'),
+                       SUM(COALESCE(s.price, sa.price)), ?
+                FROM (
+                    SELECT id, client_id, session_id FROM reservations
+                    WHERE client_id > ? AND client_id <= ? AND status = 'ACTIVE'
+                      AND starts_at >= ? AND starts_at < datetime(?, '+1 month')
+                    UNION ALL
+                    SELECT id, client_id, session_id FROM reservations_archive
+                    WHERE client_id > ? AND client_id <= ? AND status = 'ACTIVE'
+                      AND starts_at >= ? AND starts_at < datetime(?, '+1 month')
+                ) r
+                LEFT JOIN sessions s ON s.id = r.session_id
+                LEFT JOIN sessions_archive sa ON sa.id = r.session_id
+                WHERE COALESCE(s.price, sa.price) > 0
+                  -- opłacone wejściem z karnetu
+                  AND NOT EXISTS (
+                      SELECT 1 FROM credit_ledger l WHERE l.reservation_id = r.id AND l.reason = 'BOOKING'
+                  )
+                GROUP BY r.client_id
+                ON CONFLICT (client_id, month) DO NOTHING
+            ''', (month, created_at) + (after_client_id, last_id, first_day, first_day) * 2)
+            billed = cur.rowcount
+            cur.execute(
+                'UPDATE billing_runs SET last_client_id = ?, invoices = invoices + ? WHERE month = ?',
+                (last_id, billed, month)
+            )
+            conn.commit()
+            return last_id, billed
+
+    def finish_billing_run(self, month, finished_at):
+        with self.connect() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                "UPDATE billing_runs SET status = 'DONE', finished_at = ? WHERE month = ?",
+                (finished_at, month)
+            )
+            conn.commit()
+
+    def get_invoices(self, month, client_id=None):
+        with self.connect() as conn:
+            cur = conn.cursor()
+            query = 'SELECT id, client_id, month, items, pt_items, amount, created_at FROM invoices WHERE month = ?'
+            params = [month]
+            if client_id is not None:
+                query += ' AND client_id = ?'
+                params.append(client_id)
+            cur.execute(query + ' ORDER BY client_id', params)
+            return cur.fetchall()
+
+    # karnety
+    def get_credit_balance(self, client_id):
+        with self.connect() as conn:
+            cur = conn.cursor()
+            cur.execute('SELECT balance FROM credit_accounts WHERE client_id = ?', (client_id,))
+            row = cur.fetchone()
+            return row[0] if row else 0
+
+    def add_credits(self, client_id, credits, created_at, reason='PURCHASE'):
+        """Dopisuje (albo przy ujemnym credits zdejmuje) wejścia; None, jeśli saldo zeszłoby poniżej zera."""
+        try:
+            with self.connect() as conn:
+                cur = conn.cursor()
+                cur.execute('''
+                    INSERT INTO credit_ledger (client_id, delta, reason, created_at) VALUES (?, ?, ?, ?)
+                ''', (client_id, int(credits), reason, created_at))
+                cur.execute('SELECT balance FROM credit_accounts WHERE client_id = ?', (client_id,))
+                balance = cur.fetchone()[0]
+                conn.commit()
+                return balance
+        except sqlite3.IntegrityError:
+            return None
+
+    def get_credit_history(self, client_id, limit=50):
+        with self.connect() as conn:
+            cur = conn.cursor()
+            cur.execute('''
+                SELECT id, delta, reason, reservation_id, created_at
+                FROM credit_ledger
+                WHERE client_id = ?
+                ORDER BY id DESC
+                LIMIT ?
+            ''', (client_id, int(limit)))
+            return cur.fetchall()
+
+    @staticmethod
+    def _insert_reservation_with_credit(cur, client_id, session_id, created_at, only_if_available=False):
+        """Wstawia rezerwację i pobiera wejście z karnetu za płatne zajęcia (w bieżącej transakcji).
+
+        only_if_available - pobiera wejście tylko wtedy, gdy klient je ma; bez
+        tej flagi pusty karnet kończy się IntegrityError (CHECK na saldzie).
+        Zwraca (id rezerwacji, saldo po pobraniu albo None bez pobrania).
+        """
+        cur.execute('''
+            INSERT INTO reservations (client_id, session_id, created_at, status)
+            VALUES (?, ?, ?, 'ACTIVE')
+        ''', (client_id, session_id, created_at))
+        reservation_id = cur.lastrowid
+        debit = '''
+            INSERT INTO credit_ledger (client_id, delta, reason, reservation_id, created_at)
+            SELECT ?, -1, 'BOOKING', ?, ? FROM sessions WHERE id = ? AND price > 0
+        '''
+        params = (client_id, reservation_id, created_at, session_id)
+        if only_if_available:
+            debit += ' AND EXISTS (SELECT 1 FROM credit_accounts WHERE client_id = ? AND balance > 0)'
+            params += (client_id,)
+        cur.execute(debit, params)
+        balance = None
+        if cur.rowcount:
+            cur.execute('SELECT balance FROM credit_accounts WHERE client_id = ?', (client_id,))
+            balance = cur.fetchone()[0]
+        return reservation_id, balance
+
+    def add_reservation_with_credit(self, client_id, session_id, created_at):
+        """Rezerwacja i pobranie wejścia z karnetu w jednej transakcji.
+
+        Wejście pobierane jest tylko za płatne zajęcia. Zwraca (id rezerwacji,
+        saldo po pobraniu albo None dla zajęć bezpłatnych) albo None, gdy
+        na karnecie nie ma już wejść - wtedy nic nie zostaje zapisane.
+        """
+        try:
+            with self.connect() as conn:
+                cur = conn.cursor()
+                cur.execute('BEGIN IMMEDIATE')
+                booked = self._insert_reservation_with_credit(cur, client_id, session_id, created_at)
+                conn.commit()
+                return booked
+        except sqlite3.IntegrityError:
+            return None
+
+    # powiadomienia
+    def claim_notifications(self, limit):
+        with self.connect() as conn:
+            cur = conn.cursor()
+            cur.execute('''
+                UPDATE notifications_outbox
+                SET status = 'SENDING', attempts = attempts + 1
+                WHERE id IN (
+                    SELECT id FROM notifications_outbox
+                    WHERE status = 'PENDING'
+                    ORDER BY id
+                    LIMIT ?
+                )
+                RETURNING id, user_id, session_id, kind, payload, created_at
+            ''', (int(limit),))
+            rows = cur.fetchall()
+            conn.commit()
+        return sorted(rows)
+
+    def mark_notifications_sent(self, notification_ids):
+        sent_at = datetime.now().isoformat(sep=" ", timespec="seconds")
+        with self.connect() as conn:
+            cur = conn.cursor()
+            cur.execute('''
+                UPDATE notifications_outbox SET status = 'SENT', sent_at = ?
+                WHERE id IN (SELECT value FROM json_each(?))
+            ''', (sent_at, json.dumps(list(notification_ids))))
+            conn.commit()
+
+    def release_notifications(self, notification_ids, max_attempts):
+        # nieudana wysyłka wraca do kolejki, po max_attempts próbach zostaje FAILED
+        with self.connect() as conn:
+            cur = conn.cursor()
+            cur.execute('''
+                UPDATE notifications_outbox
+                SET status = CASE WHEN attempts >= ? THEN 'FAILED' ELSE 'PENDING' END
+                WHERE id IN (SELECT value FROM json_each(?))
+            ''', (int(max_attempts), json.dumps(list(notification_ids))))
+            conn.commit()
+
+    def reset_stuck_notifications(self):
+        # po awarii w trakcie wysyłki
+        with self.connect() as conn:
+            cur = conn.cursor()
+            cur.execute("UPDATE notifications_outbox SET status = 'PENDING' WHERE status = 'SENDING'")
+            conn.commit()
+            return cur.rowcount
+
+    def count_notifications(self, status="PENDING"):
+        with self.connect() as conn:
+            cur = conn.cursor()
+            cur.execute('SELECT COUNT(*) FROM notifications_outbox WHERE status = ?', (status,))
+            return cur.fetchone()[0]
+
     # rezerwacje
     def add_reservation(self, client_id, session_id, created_at, status="ACTIVE"):
         with self.connect() as conn:
@@ -204,10 +1651,298 @@ class Database:
             cur.execute('UPDATE reservations SET status = ? WHERE id = ?', (status, reservation_id))
             conn.commit()
 
-    def count_active_reservations(self, session_id):
+    def cancel_reservation(self, reservation_id):
+        """Anuluje rezerwację i w tej samej transakcji awansuje pierwszą osobę z listy oczekujących.
+
+        Zwraca id awansowanych klientów albo None, jeśli rezerwacja nie była aktywna.
+        """
+        with self.connect() as conn:
+            cur = conn.cursor()
+            # blokada zapisu od początku - równoległe anulowania nie awansują tej samej osoby
+            cur.execute('BEGIN IMMEDIATE')
+            cur.execute(
+                "UPDATE reservations SET status = 'CANCELLED' WHERE id = ? AND status = 'ACTIVE'",
+                (reservation_id,)
+            )
+            if cur.rowcount == 0:
+                conn.commit()
+                return None
+
+            cur.execute('SELECT session_id FROM reservations WHERE id = ?', (reservation_id,))
+            promoted = self._promote_waitlist(cur, cur.fetchone()[0])
+            conn.commit()
+        return promoted
+
+    @staticmethod
+    def _promote_waitlist(cur, session_id):
+        cur.execute('SELECT capacity, status FROM sessions WHERE id = ?', (session_id,))
+        row = cur.fetchone()
+        if not row or row[1] != 'ACTIVE':
+            return []
+
+        created_at = datetime.now().isoformat(sep=" ", timespec="seconds")
+        # trzymane miejsca (płatność w toku) też są zajęte
+        cur.execute('''
+            SELECT
+                (SELECT COUNT(*) FROM reservations WHERE session_id = ? AND status = 'ACTIVE')
+                + (SELECT COUNT(*) FROM seat_holds WHERE session_id = ? AND expires_at > ?)
+        ''', (session_id, session_id, created_at))
+        free = row[0] - cur.fetchone()[0]
+
+        promoted = []
+        while free > 0:
+            # głowa kolejki - jedno wyszukiwanie w idx_waitlist_queue
+            cur.execute('''
+                SELECT id, client_id FROM waitlist
+                WHERE session_id = ? AND status = 'WAITING'
+                ORDER BY id
+                LIMIT 1
+            ''', (session_id,))
+            head = cur.fetchone()
+            if not head:
+                break
+
+            waitlist_id, client_id = head
+            cur.execute(
+                "SELECT 1 FROM reservations WHERE client_id = ? AND session_id = ? AND status = 'ACTIVE'",
+                (client_id, session_id)
+            )
+            if cur.fetchone() or Database._client_conflicts(cur, client_id, session_id):
+                # klient ma już te lub nakładające się zajęcia - wypada z kolejki
+                cur.execute("UPDATE waitlist SET status = 'CANCELLED' WHERE id = ?", (waitlist_id,))
+                continue
+            cur.execute("UPDATE waitlist SET status = 'PROMOTED' WHERE id = ?", (waitlist_id,))
+
+            # jak przy zwykłym zapisie: wejście z karnetu, jeśli klient jeszcze je ma
+            Database._insert_reservation_with_credit(cur, client_id, session_id, created_at, only_if_available=True)
+            cur.execute('''
+                INSERT INTO notifications_outbox (user_id, session_id, kind, payload, created_at)
+                SELECT u.id, s.id, 'WAITLIST_PROMOTED',
+                       json_object('email', u.email, 'first_name', u.first_name, 'last_name', u.last_name,
+                                   'session_name', s.name, 'start_time', s.start_time,
+                                   'duration_min', s.duration_min),
+                       ?
+                FROM users u, sessions s
+                WHERE u.id = ? AND s.id = ?
+            ''', (created_at, client_id, session_id))
+            promoted.append(client_id)
+            free -= 1
+        return promoted
+
+    # trzymane miejsca
+    def place_hold(self, client_id, session_id, now, expires_at):
+        """Trzyma miejsce do expires_at (albo przedłuża istniejące); None, gdy brak wolnych miejsc.
+
+        Liczenie wolnych miejsc i zapis są pod jedną blokadą zapisu, więc
+        równoległe płatności nie zajmą więcej miejsc niż capacity.
+        """
+        with self.connect() as conn:
+            cur = conn.cursor()
+            cur.execute('BEGIN IMMEDIATE')
+            cur.execute('''
+                SELECT s.capacity
+                    - (SELECT COUNT(*) FROM reservations WHERE session_id = s.id AND status = 'ACTIVE')
+                    - (SELECT COUNT(*) FROM seat_holds h
+                       WHERE h.session_id = s.id AND h.expires_at > ? AND h.client_id != ?)
+                FROM sessions s
+                WHERE s.id = ? AND s.status = 'ACTIVE'
+            ''', (_normalize_ts(now), client_id, session_id))
+            row = cur.fetchone()
+            if not row or row[0] <= 0:
+                conn.commit()
+                return None
+            cur.execute('''
+                INSERT INTO seat_holds (session_id, client_id, created_at, expires_at) VALUES (?, ?, ?, ?)
+                ON CONFLICT (session_id, client_id) DO UPDATE SET
+                    created_at = excluded.created_at,
+                    expires_at = excluded.expires_at
+                RETURNING id
+            ''', (session_id, client_id, _normalize_ts(now), _normalize_ts(expires_at)))
+            hold_id = cur.fetchone()[0]
+            conn.commit()
+            return hold_id
+
+    def confirm_hold(self, client_id, session_id, now, created_at):
+        """Zamienia niewygasłe trzymane miejsce na rezerwację w jednej transakcji.
+
+        Jak przy zwykłym zapisie: kolizja z innymi zajęciami klienta blokuje
+        zapis, a płatne zajęcia zdejmują wejście z karnetu, jeśli klient je ma.
+        Zwraca None, gdy miejsce wygasło, (None, [id kolidujących sesji]) przy
+        kolizji albo (id rezerwacji, saldo karnetu albo None bez pobrania).
+        """
+        with self.connect() as conn:
+            cur = conn.cursor()
+            cur.execute('BEGIN IMMEDIATE')
+            cur.execute(
+                'SELECT id FROM seat_holds WHERE session_id = ? AND client_id = ? AND expires_at > ?',
+                (session_id, client_id, _normalize_ts(now))
+            )
+            if cur.fetchone() is None:
+                conn.commit()
+                return None
+            conflicts = self._client_conflicts(cur, client_id, session_id)
+            if conflicts:
+                conn.commit()
+                return None, conflicts
+            # trigger holds_reservations_ai usuwa trzymane miejsce
+            booked = self._insert_reservation_with_credit(
+                cur, client_id, session_id, created_at, only_if_available=True
+            )
+            conn.commit()
+            return booked
+
+    def release_hold(self, client_id, session_id):
+        with self.connect() as conn:
+            cur = conn.cursor()
+            cur.execute('DELETE FROM seat_holds WHERE session_id = ? AND client_id = ?', (session_id, client_id))
+            conn.commit()
+            return cur.rowcount > 0
+
+    def sweep_expired_holds(self, now, limit=1000):
+        # paczka najstarszych wygasłych po idx_seat_holds_expires
+        with self.connect() as conn:
+            cur = conn.cursor()
+            cur.execute('''
+                DELETE FROM seat_holds WHERE id IN (
+                    SELECT id FROM seat_holds WHERE expires_at <= ? ORDER BY expires_at LIMIT ?
+                )
+            ''', (_normalize_ts(now), int(limit)))
+            conn.commit()
+            return cur.rowcount
+
+    # lista oczekujących
+    def add_to_waitlist(self, client_id, session_id, created_at):
+        try:
+            with self.connect() as conn:
+                cur = conn.cursor()
+                cur.execute('''
+                    INSERT INTO waitlist (session_id, client_id, created_at, status)
+                    VALUES (?, ?, ?, 'WAITING')
+                ''', (session_id, client_id, created_at))
+                conn.commit()
+                return cur.lastrowid
+        except sqlite3.IntegrityError:
+            return None
+
+    def leave_waitlist(self, client_id, session_id):
         with self.connect() as conn:
             cur = conn.cursor()
-            cur.execute('SELECT COUNT(*) FROM reservations WHERE session_id = ? AND status = "ACTIVE"', (session_id,))
+            cur.execute('''
+                UPDATE waitlist SET status = 'CANCELLED'
+                WHERE session_id = ? AND client_id = ? AND status = 'WAITING'
+            ''', (session_id, client_id))
+            conn.commit()
+            return cur.rowcount > 0
+
+    def get_waitlist_position(self, client_id, session_id):
+        # 1 = następny do awansu, None = nie czeka
+        with self.connect() as conn:
+            cur = conn.cursor()
+            cur.execute('''
+                SELECT (
+                    SELECT COUNT(*) FROM waitlist o
+                    WHERE o.session_id = w.session_id AND o.status = 'WAITING' AND o.id <= w.id
+                )
+                FROM waitlist w
+                WHERE w.session_id = ? AND w.client_id = ? AND w.status = 'WAITING'
+            ''', (session_id, client_id))
+            row = cur.fetchone()
+            return row[0] if row else None
+
+    # aktywne rezerwacje klienta nachodzące na [start, end) - zakres po idx_reservations_client_time
+    _CLIENT_CONFLICTS_SQL = '''
+        SELECT session_id, starts_at, ends_at
+        FROM reservations
+        WHERE client_id = ? AND status = 'ACTIVE' AND ends_at > ? AND starts_at < ? AND session_id != ?
+        ORDER BY starts_at
+    '''
+
+    def find_client_conflicts(self, client_id, session_id):
+        with self.connect() as conn:
+            cur = conn.cursor()
+            return self._client_conflicts(cur, client_id, session_id)
+
+    @classmethod
+    def _client_conflicts(cls, cur, client_id, session_id):
+        cur.execute(
+            "SELECT start_time, datetime(start_time, '+' || duration_min || ' minutes') FROM sessions WHERE id = ?",
+            (session_id,)
+        )
+        row = cur.fetchone()
+        if not row:
+            return []
+        start, end = row
+        cur.execute(cls._CLIENT_CONFLICTS_SQL, (client_id, start, end, session_id))
+        return [r[0] for r in cur.fetchall()]
+
+    def get_client_intervals(self, client_id, start, end):
+        with self.connect() as conn:
+            cur = conn.cursor()
+            cur.execute(self._CLIENT_CONFLICTS_SQL, (client_id, _normalize_ts(start), _normalize_ts(end), -1))
+            return cur.fetchall()
+
+    def get_sessions_by_ids(self, session_ids, held_at=None, except_client_id=None):
+        # sesje z liczbą aktywnych rezerwacji (jak w SessionQuery) - jedno zapytanie dla całej serii;
+        # z held_at liczba obejmuje też niewygasłe trzymane miejsca (poza własnym klienta)
+        reserved = SessionQuery._RESERVED
+        params = []
+        if held_at is not None:
+            reserved = (
+                f"({reserved} + (SELECT COUNT(*) FROM seat_holds h "
+                "WHERE h.session_id = s.id AND h.expires_at > ? AND h.client_id IS NOT ?))"
+            )
+            params = [_normalize_ts(held_at), except_client_id]
+        with self.connect() as conn:
+            cur = conn.cursor()
+            cur.execute(f'''
+                SELECT s.*, {reserved} AS reserved
+                FROM sessions s
+                WHERE s.id IN (SELECT value FROM json_each(?))
+                ORDER BY s.start_time
+            ''', params + [json.dumps([int(i) for i in session_ids])])
+            return cur.fetchall()
+
+    def add_reservations(self, client_id, session_ids, created_at):
+        """Rezerwacje serii w jednej transakcji: (liczba rezerwacji, pobrane wejścia, saldo albo None).
+
+        Płatne zajęcia w kolejności session_ids zdejmują po wejściu z karnetu,
+        dopóki saldo na to pozwala; pozostałe są płatne za zajęcia.
+        """
+        used, balance = 0, None
+        with self.connect() as conn:
+            cur = conn.cursor()
+            cur.execute('BEGIN IMMEDIATE')
+            for sid in session_ids:
+                _reservation_id, after = self._insert_reservation_with_credit(
+                    cur, client_id, sid, created_at, only_if_available=True
+                )
+                if after is not None:
+                    used, balance = used + 1, after
+            conn.commit()
+        return len(session_ids), used, balance
+
+    def count_active_reservations(self, session_id, include_archived=False, held_at=None, except_client_id=None):
+        # held_at - doliczamy miejsca trzymane, które w tej chwili jeszcze nie wygasły (poza własnym klienta)
+        with self.connect() as conn:
+            cur = conn.cursor()
+            if held_at is not None:
+                cur.execute('''
+                    SELECT
+                        (SELECT COUNT(*) FROM reservations WHERE session_id = ? AND status = 'ACTIVE')
+                        + (SELECT COUNT(*) FROM seat_holds
+                           WHERE session_id = ? AND expires_at > ? AND client_id IS NOT ?)
+                ''', (session_id, session_id, _normalize_ts(held_at), except_client_id))
+            elif include_archived:
+                cur.execute('''
+                    SELECT
+                        (SELECT COUNT(*) FROM reservations WHERE session_id = ? AND status = "ACTIVE")
+                        + (SELECT COUNT(*) FROM reservations_archive WHERE session_id = ? AND status = "ACTIVE")
+                ''', (session_id, session_id))
+            else:
+                cur.execute(
+                    'SELECT COUNT(*) FROM reservations WHERE session_id = ? AND status = "ACTIVE"',
+                    (session_id,)
+                )
             return cur.fetchone()[0]
 
     def client_has_reservation(self, client_id, session_id):
@@ -219,26 +1954,69 @@ class Database:
             )
             return cur.fetchone()[0] > 0
 
-    def get_client_reservations_with_details(self, client_id):
+    def get_client_reservations_with_details(self, client_id, include_archived=False):
+        query = '''
+            SELECT
+                r.id,
+                r.created_at,
+                r.status,
+                s.start_time,
+                s.type,
+                s.name,
+                s.price,
+                s.trainer_id
+            FROM reservations r
+            JOIN sessions s ON r.session_id = s.id
+            WHERE r.client_id = ?
+        '''
+        params = [client_id]
+        if include_archived:
+            query += '''
+            UNION ALL
+            SELECT r.id, r.created_at, r.status, s.start_time, s.type, s.name, s.price, s.trainer_id
+            FROM reservations_archive r
+            JOIN sessions_archive s ON r.session_id = s.id
+            WHERE r.client_id = ?
+            '''
+            params.append(client_id)
+        query += ' ORDER BY 4 ASC'
+
         with self.connect() as conn:
             cur = conn.cursor()
-            cur.execute('''
-                SELECT
-                    r.id,
-                    r.created_at,
-                    r.status,
-                    s.start_time,
-                    s.type,
-                    s.name,
-                    s.price,
-                    s.trainer_id
-                FROM reservations r
-                JOIN sessions s ON r.session_id = s.id
-                WHERE r.client_id = ?
-                ORDER BY s.start_time ASC
-            ''', (client_id,))
+            cur.execute(query, params)
             return cur.fetchall()
 
+    def get_participants_version(self, trainer_id):
+        with self.connect() as conn:
+            cur = conn.cursor()
+            cur.execute('SELECT version FROM participant_versions WHERE trainer_id = ?', (trainer_id,))
+            row = cur.fetchone()
+            return row[0] if row else 0
+
+    def get_trainer_participants(self, trainer_id):
+        """Uczestnicy wszystkich aktywnych sesji trenera jednym zapytaniem.
+
+        Zwraca (wersja, {session_id: [(id, imię, nazwisko, email), ...]}) - wersja
+        czytana przed danymi, więc w najgorszym razie cache odświeży się raz za dużo.
+        """
+        with self.connect() as conn:
+            cur = conn.cursor()
+            cur.execute('SELECT version FROM participant_versions WHERE trainer_id = ?', (trainer_id,))
+            row = cur.fetchone()
+            version = row[0] if row else 0
+            cur.execute('''
+                SELECT r.session_id, u.id, u.first_name, u.last_name, u.email
+                FROM sessions s
+                JOIN reservations r ON r.session_id = s.id AND r.status = 'ACTIVE'
+                JOIN users u ON u.id = r.client_id
+                WHERE s.trainer_id = ? AND s.status = 'ACTIVE'
+                ORDER BY r.session_id, u.last_name, u.first_name
+            ''', (trainer_id,))
+            participants = {}
+            for session_id, *user in cur.fetchall():
+                participants.setdefault(session_id, []).append(tuple(user))
+            return version, participants
+
     def get_session_participants(self, session_id):
         with self.connect() as conn:
             cur = conn.cursor()
@@ -0,0 +1,260 @@
+from __future__ import annotations
+
+import functools
+import gc
+import json
+import os
+import sys
+import threading
+import time
+import traceback
+import tracemalloc
+from typing import Dict, Iterable, List, Optional
+
+# MYGYM_DIAG=ścieżka (albo 1) włącza diagnostykę UI, MYGYM_DIAG_LAG_MS - próg opóźnienia
+ENV_PATH = "MYGYM_DIAG"
+ENV_LAG_MS = "MYGYM_DIAG_LAG_MS"
+DEFAULT_PATH = "mygym_diag.jsonl"
+
+# MYGYM_MEMWATCH=ścieżka (albo 1) włącza obserwację pamięci, MYGYM_MEMWATCH_INTERVAL - co ile sekund
+ENV_MEM_PATH = "MYGYM_MEMWATCH"
+ENV_MEM_INTERVAL = "MYGYM_MEMWATCH_INTERVAL"
+DEFAULT_MEM_PATH = "mygym_memory.jsonl"
+
+
+class UiDiagnostics:
+    """Watchdog pętli zdarzeń Tk i profiler handlerów widoków.
+
+    Co interval_ms pętla Tk odpala tick przez after(); spóźnienie ticka to
+    opóźnienie, które widzi użytkownik. Osobny wątek pilnuje, kiedy był
+    ostatni tick - jeżeli pętla stoi dłużej niż próg, zapisuje stos wątku
+    głównego w trakcie blokady, więc w raporcie widać winną linię.
+    Raport to linie JSON: lag, stall, slow_call i summary przy zamknięciu.
+    """
+
+    def __init__(
+        self,
+        root,
+        path: str,
+        lag_threshold_ms: float = 200,
+        interval_ms: int = 50,
+        slow_call_ms: float = 50,
+    ):
+        self.root = root
+        self.path = path
+        self.lag_threshold = lag_threshold_ms / 1000
+        self.interval_ms = interval_ms
+        self.slow_call = slow_call_ms / 1000
+
+        self._lock = threading.Lock()
+        self._file = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._main_ident = threading.main_thread().ident
+        self._last_tick = time.perf_counter()
+        self._active: List[str] = []
+        self._stats: Dict[str, List[float]] = {}
+
+    @classmethod
+    def from_env(cls, root, classes: Iterable[type] = ()) -> Optional["UiDiagnostics"]:
+        path = os.environ.get(ENV_PATH)
+        if not path:
+            return None
+        diag = cls(
+            root,
+            DEFAULT_PATH if path == "1" else path,
+            lag_threshold_ms=float(os.environ.get(ENV_LAG_MS, 200)),
+        )
+        diag.instrument(classes)
+        diag.start()
+        return diag
+
+    # profiler
+    def instrument(self, classes: Iterable[type]):
+        # opakowuje __init__ i metody zdefiniowane w klasie - przed utworzeniem widoków,
+        # żeby command=self.handler przy przyciskach wskazywało już wersję mierzoną
+        for cls in classes:
+            for name, fn in list(vars(cls).items()):
+                if not callable(fn) or isinstance(fn, type) or getattr(fn, "_diag_wrapped", False):
+                    continue
+                if name.startswith("__") and name != "__init__":
+                    continue
+                setattr(cls, name, self._timed(f"{cls.__name__}.{name}", fn))
+
+    def _timed(self, label: str, fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            self._active.append(label)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                self._active.pop()
+                stats = self._stats.setdefault(label, [0, 0.0, 0.0])
+                stats[0] += 1
+                stats[1] += elapsed
+                stats[2] = max(stats[2], elapsed)
+                if elapsed >= self.slow_call:
+                    self._write({"event": "slow_call", "handler": label, "ms": round(elapsed * 1000, 1)})
+
+        wrapper._diag_wrapped = True
+        return wrapper
+
+    # watchdog
+    def start(self):
+        if self._thread is not None:
+            return
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._write({"event": "start", "lag_threshold_ms": self.lag_threshold * 1000})
+        self._stop.clear()
+        self._last_tick = time.perf_counter()
+        self.root.after(self.interval_ms, self._tick, self._last_tick)
+        self._thread = threading.Thread(target=self._watch, name="ui-watchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(1.0)
+        self._thread = None
+        self._write({"event": "summary", "handlers": self.summary()})
+        with self._lock:
+            self._file.close()
+            self._file = None
+
+    def summary(self) -> List[Dict]:
+        rows = [
+            {
+                "handler": label,
+                "calls": calls,
+                "total_ms": round(total * 1000, 1),
+                "max_ms": round(longest * 1000, 1),
+            }
+            for label, (calls, total, longest) in self._stats.items()
+        ]
+        rows.sort(key=lambda r: r["total_ms"], reverse=True)
+        return rows
+
+    def _tick(self, scheduled: float):
+        now = time.perf_counter()
+        lag = now - scheduled - self.interval_ms / 1000
+        self._last_tick = now
+        if lag >= self.lag_threshold:
+            self._write({"event": "lag", "ms": round(lag * 1000, 1)})
+        if not self._stop.is_set():
+            self.root.after(self.interval_ms, self._tick, now)
+
+    def _watch(self):
+        # próbka stosu co próg, dopóki pętla stoi - długa blokada da kilka próbek
+        last_sample = 0.0
+        while not self._stop.wait(self.lag_threshold / 4):
+            now = time.perf_counter()
+            stalled = now - self._last_tick - self.interval_ms / 1000
+            if stalled < self.lag_threshold or now - last_sample < self.lag_threshold:
+                continue
+            frame = sys._current_frames().get(self._main_ident)
+            if frame is None:
+                continue
+            last_sample = now
+            self._write({
+                "event": "stall",
+                "ms": round(stalled * 1000, 1),
+                "handler": (self._active[-1:] or [None])[0],
+                "stack": traceback.format_stack(frame),
+            })
+
+    def _write(self, record: Dict):
+        record["ts"] = time.strftime("%Y-%m-%d %H:%M:%S")
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._file.flush()
+
+
+def count_widgets(widget) -> int:
+    return 1 + sum(count_widgets(child) for child in widget.winfo_children())
+
+
+class MemoryMonitor:
+    """Okresowy raport pamięci dla aplikacji działającej cały dzień.
+
+    Co interval_s zapisuje pamięć śledzoną przez tracemalloc, liczbę widgetów,
+    liczbę komend Tcl (każdy callback Pythona to komenda - wyciek handlerów
+    widać jako ich przyrost) i obiektów gc, a także miejsca w kodzie, gdzie
+    alokacje najbardziej urosły od pierwszej próbki.
+    """
+
+    def __init__(self, root, path: str, interval_s: float = 60, top: int = 10, frames: int = 5):
+        self.root = root
+        self.path = path
+        self.interval_ms = int(interval_s * 1000)
+        self.top = top
+        self.frames = frames
+        self._baseline = None
+        self._first = None
+        self._job = None
+
+    @classmethod
+    def from_env(cls, root) -> Optional["MemoryMonitor"]:
+        path = os.environ.get(ENV_MEM_PATH)
+        if not path:
+            return None
+        monitor = cls(
+            root,
+            DEFAULT_MEM_PATH if path == "1" else path,
+            interval_s=float(os.environ.get(ENV_MEM_INTERVAL, 60)),
+        )
+        monitor.start()
+        return monitor
+
+    def start(self):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+        self.sample()
+        self._job = self.root.after(self.interval_ms, self._tick)
+
+    def stop(self):
+        if self._job is not None:
+            self.root.after_cancel(self._job)
+            self._job = None
+        self.sample()
+        tracemalloc.stop()
+
+    def _tick(self):
+        self.sample()
+        self._job = self.root.after(self.interval_ms, self._tick)
+
+    def sample(self) -> Dict:
+        current, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+        ))
+        record = {
+            "event": "memory",
+            "ts": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "traced_kb": current // 1024,
+            "peak_kb": peak // 1024,
+            "widgets": count_widgets(self.root),
+            "tcl_commands": len(self.root.tk.call("info", "commands")),
+            "gc_objects": len(gc.get_objects()),
+        }
+        if self._baseline is None:
+            self._baseline = snapshot
+            self._first = dict(record)
+        else:
+            record["growth"] = {
+                key: record[key] - self._first[key]
+                for key in ("traced_kb", "widgets", "tcl_commands", "gc_objects")
+            }
+            record["top_growth"] = [
+                {"where": str(stat.traceback[0]), "size_kb": round(stat.size_diff / 1024, 1), "count": stat.count_diff}
+                for stat in snapshot.compare_to(self._baseline, "lineno")[:self.top]
+                if stat.size_diff > 0
+            ]
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        return record
@@ -0,0 +1,70 @@
+from __future__ import annotations
+
+import csv
+from typing import Iterable, List, Sequence, Tuple
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+
+# (kolumna, typ w Parquet)
+RESERVATION_COLUMNS = [
+    ("reservation_id", "int64"), ("created_at", "string"), ("status", "string"),
+    ("client_id", "int64"), ("first_name", "string"), ("last_name", "string"), ("email", "string"),
+    ("session_id", "int64"), ("session_name", "string"), ("session_type", "string"),
+    ("start_time", "string"), ("duration_min", "int64"), ("price", "float64"), ("trainer_id", "int64"),
+]
+
+SESSION_COLUMNS = [
+    ("session_id", "int64"), ("type", "string"), ("name", "string"), ("description", "string"),
+    ("difficulty_level", "string"), ("price", "float64"), ("trainer_id", "int64"), ("start_time", "string"),
+    ("duration_min", "int64"), ("capacity", "int64"), ("status", "string"), ("reserved", "int64"),
+]
+
+
+def write_csv(chunks: Iterable[Sequence[tuple]], columns: List[Tuple[str, str]], out) -> int:
+    """Zapisuje paczki wierszy do CSV (ścieżka albo otwarty plik tekstowy). Zwraca liczbę wierszy."""
+    if isinstance(out, str):
+        with open(out, "w", newline="", encoding="utf-8") as f:
+            return write_csv(chunks, columns, f)
+
+    writer = csv.writer(out)
+    writer.writerow([name for name, _type in columns])
+    count = 0
+    for rows in chunks:
+        writer.writerows(rows)
+        count += len(rows)
+    return count
+
+
+def write_parquet(chunks: Iterable[Sequence[tuple]], columns: List[Tuple[str, str]], path: str) -> int:
+    # każda paczka z kursora to osobna grupa wierszy - w pamięci jest tylko jedna naraz
+    if pa is None:
+        raise RuntimeError("Eksport do Parquet wymaga pakietu pyarrow")
+
+    schema = pa.schema([(name, getattr(pa, type_)()) for name, type_ in columns])
+    count = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        for rows in chunks:
+            arrays = [pa.array([r[i] for r in rows], type=schema.field(i).type) for i in range(len(columns))]
+            writer.write_table(pa.Table.from_arrays(arrays, schema=schema))
+            count += len(rows)
+    return count
+
+
+def export_reservations(db, out, fmt="csv", **filters) -> int:
+    chunks = db.iter_reservations_export(**filters)
+    if fmt == "parquet":
+        return write_parquet(chunks, RESERVATION_COLUMNS, out)
+    return write_csv(chunks, RESERVATION_COLUMNS, out)
+
+
+def export_sessions(db, out, fmt="csv", **filters) -> int:
+    chunks = db.iter_sessions_export(**filters)
+    if fmt == "parquet":
+        return write_parquet(chunks, SESSION_COLUMNS, out)
+    return write_csv(chunks, SESSION_COLUMNS, out)
@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+import os
+import re
+from datetime import datetime, timezone
+from itertools import groupby
+from operator import itemgetter
+from typing import Iterable, Iterator, Optional, Tuple
+
+from scheduling import session_bounds
+
+PRODID = "-//MyGym//Kalendarz zajec//PL"
+
+FEED_NAMES = {"client": "MyGym - moje rezerwacje", "trainer": "MyGym - moje zajęcia"}
+
+_FILE_RE = re.compile(r"^(\d+)\.(\d+)\.ics$")
+
+
+def _escape(text: str) -> str:
+    return (
+        text.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\n", "\\n")
+    )
+
+
+def _fold(line: str) -> str:
+    # RFC 5545: linie dłuższe niż 75 bajtów łamiemy, kontynuacja zaczyna się spacją
+    if len(line.encode("utf-8")) <= 75:
+        return line + "\r\n"
+    parts = []
+    current = ""
+    limit = 75
+    for ch in line:
+        if len((current + ch).encode("utf-8")) > limit:
+            parts.append(current)
+            current = ""
+            limit = 74
+        current += ch
+    parts.append(current)
+    return "\r\n ".join(parts) + "\r\n"
+
+
+def _ical_time(value: datetime) -> str:
+    return value.strftime("%Y%m%dT%H%M%S")
+
+
+def iter_ics(events: Iterable[tuple], name: str, now: Optional[datetime] = None) -> Iterator[str]:
+    """Linie pliku .ics dla wierszy z Database.iter_feed_events (kolumna user_id jest pomijana)."""
+    stamp = (now or datetime.now(timezone.utc)).strftime("%Y%m%dT%H%M%SZ")
+    yield _fold("BEGIN:VCALENDAR")
+    yield _fold("VERSION:2.0")
+    yield _fold(f"PRODID:{PRODID}")
+    yield _fold(f"X-WR-CALNAME:{_escape(name)}")
+    for _user_id, uid, type_, session_name, description, start_time, duration in events:
+        start, end = session_bounds(start_time, duration)
+        summary = session_name or ("Trening personalny" if type_ == "pt" else "Zajęcia")
+        yield _fold("BEGIN:VEVENT")
+        yield _fold(f"UID:{uid}@mygym")
+        yield _fold(f"DTSTAMP:{stamp}")
+        yield _fold(f"DTSTART:{_ical_time(start)}")
+        yield _fold(f"DTEND:{_ical_time(end)}")
+        yield _fold(f"SUMMARY:{_escape(summary)}")
+        if description:
+            yield _fold(f"DESCRIPTION:{_escape(description)}")
+        yield _fold("END:VEVENT")
+    yield _fold("END:VCALENDAR")
+
+
+class FeedCache:
+    """Pliki .ics per użytkownik w katalogu, nazwane <user_id>.<wersja>.ics.
+
+    Wersję podbijają triggery w bazie przy każdej zmianie rezerwacji lub sesji
+    użytkownika, więc plik jest aktualny dokładnie wtedy, gdy istnieje plik
+    z bieżącą wersją - nie trzeba porównywać treści ani dat.
+    """
+
+    def __init__(self, db, directory: str):
+        self.db = db
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, user_id: int, version: int) -> str:
+        return os.path.join(self.directory, f"{user_id}.{version}.ics")
+
+    def _cached_versions(self):
+        versions = {}
+        for entry in os.listdir(self.directory):
+            m = _FILE_RE.match(entry)
+            if m:
+                versions.setdefault(int(m.group(1)), set()).add(int(m.group(2)))
+        return versions
+
+    def _write(self, user_id: int, version: int, role: str, events: Iterable[tuple], old_versions=()):
+        path = self._path(user_id, version)
+        tmp = path + ".tmp"
+        # zapis strumieniowy do pliku tymczasowego i podmiana - czytelnik nie zobaczy połowy pliku
+        with open(tmp, "w", encoding="utf-8", newline="") as f:
+            f.writelines(iter_ics(events, FEED_NAMES.get(role, "MyGym")))
+        os.replace(tmp, path)
+        for old in old_versions:
+            if old != version:
+                try:
+                    os.remove(self._path(user_id, old))
+                except FileNotFoundError:
+                    pass
+        return path
+
+    def feed_path(self, user_id: int, role: str) -> str:
+        """Ścieżka aktualnego pliku użytkownika; generuje go tylko po zmianie wersji."""
+        version = self.db.get_feed_version(user_id)
+        path = self._path(user_id, version)
+        if os.path.exists(path):
+            return path
+        old = self._cached_versions().get(user_id, ())
+        return self._write(user_id, version, role, self.db.iter_feed_events(role, [user_id]), old)
+
+    def refresh_all(self) -> Tuple[int, int]:
+        """Odświeża nieaktualne kalendarze wszystkich klientów i trenerów: (odświeżone, wszystkie).
+
+        Wersje i pliki w katalogu porównywane są w pamięci, a dane dla
+        nieaktualnych użytkowników jednej roli czyta jedno zapytanie.
+        """
+        cached = self._cached_versions()
+        stale = {"client": {}, "trainer": {}}
+        users = self.db.get_feed_versions()
+        for user_id, role, version in users:
+            if version not in cached.get(user_id, ()):
+                stale[role][user_id] = version
+        refreshed = sum(len(p) for p in stale.values())
+
+        for role, pending in stale.items():
+            if not pending:
+                continue
+            events = self.db.iter_feed_events(role, pending)
+            for user_id, rows in groupby(events, key=itemgetter(0)):
+                self._write(user_id, pending.pop(user_id), role, rows, cached.get(user_id, ()))
+            # użytkownicy bez zajęć dostają pusty kalendarz
+            for user_id, version in pending.items():
+                self._write(user_id, version, role, (), cached.get(user_id, ()))
+
+        return refreshed, len(users)
@@ -1,49 +1,72 @@
+import csv
+import io
+import json
+import os
+import tempfile
+import threading
 import unittest
+from datetime import date, datetime, timedelta
 
 from db import Database
-from models import UserService, ScheduleService, ReservationService
+from models import (
+    UserService, ScheduleService, ReservationService, ReportService, ParticipantsCache, BillingService, CreditService,
+    HoldSweeper,
+)
+from notifications import NotificationDispatcher, FileSink
+from feeds import FeedCache
+from checkin import CheckInService
+import export
 from utils import hash_password
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
-class TestFunctionalMyGym(unittest.TestCase):
-    def setUp(self):
-        self.test_db_path = "test.db"
-        self.db = Database(self.test_db_path)
-        self.db.create_tables()
 
-        with self.db.connect() as conn:
-            cur = conn.cursor()
-            cur.execute("DELETE FROM reservations")
-            cur.execute("DELETE FROM sessions")
-            cur.execute("DELETE FROM users")
-            conn.commit()
+_TEMPLATE = None
 
-        self.user_service = UserService(self.db)
-        self.schedule_service = ScheduleService(self.db)
-        self.reservation_service = ReservationService(self.db)
+
+def _template():
+    """Baza w pamięci ze schematem i danymi startowymi - budowana raz na proces."""
+    global _TEMPLATE
+    if _TEMPLATE is None:
+        db = Database(":memory:")
+        db.create_tables()
 
         # seed: manager + trainer
-        self.db.add_user("Marian", "Kowalski", "marian@mygym", hash_password("manager123"), "manager")
-        self.db.add_user("Tomasz", "Trener", "tomasz@mygym", hash_password("trainer123"), "trainer")
-        trainer_row = self.db.get_user("tomasz@mygym")
-        self.trainer_id = trainer_row[0]
+        db.add_user("Marian", "Kowalski", "marian@mygym", hash_password("manager123"), "manager")
+        trainer_id = db.add_user("Tomasz", "Trener", "tomasz@mygym", hash_password("trainer123"), "trainer")
 
         # sesja do rezerwacji
-        self.session_id = self.db.add_session(
+        session_id = db.add_session(
             session_type="group",
             name="Joga",
             description="Zajęcia relaksacyjne",
             difficulty_level="easy",
             price=None,
-            trainer_id=self.trainer_id,
+            trainer_id=trainer_id,
             start_time="2026-01-31 10:00:00",
             duration_min=60,
             capacity=2,
             status="ACTIVE",
         )
+        _TEMPLATE = (db, trainer_id, session_id)
+    return _TEMPLATE
+
+
+class TestFunctionalMyGym(unittest.TestCase):
+    def setUp(self):
+        # każdy test dostaje własną kopię szablonu - bez plików, więc testy można puszczać równolegle
+        template, self.trainer_id, self.session_id = _template()
+        self.db = template.clone()
+
+        self.user_service = UserService(self.db)
+        self.schedule_service = ScheduleService(self.db)
+        self.reservation_service = ReservationService(self.db)
 
     def tearDown(self):
-        pass
+        self.db.close()
 
     def test_register_client_creates_user_in_db(self):
         ok, msg = self.user_service.register_client(
@@ -148,6 +171,743 @@ class TestFunctionalMyGym(unittest.TestCase):
         self.assertFalse(ok)
         self.assertEqual(msg, "Brak wolnych miejsc")
 
+    def test_archive_moves_old_sessions_with_reservations(self):
+        ok, _ = self.user_service.register_client("Ewa", "Test", "ewa@example.com", "pass123")
+        self.assertTrue(ok)
+        ok, client = self.user_service.login("ewa@example.com", "pass123")
+        self.assertTrue(ok)
+
+        ok, _ = self.reservation_service.create_reservation(client, {"session_id": self.session_id, "capacity": 2})
+        self.assertTrue(ok)
+
+        future_id = self.db.add_session(
+            session_type="group",
+            name="Pilates",
+            description=None,
+            difficulty_level=None,
+            price=None,
+            trainer_id=self.trainer_id,
+            start_time="2026-03-01T10:00:00",
+            duration_min=60,
+            capacity=5,
+        )
+
+        sessions, reservations = self.db.archive_sessions_before("2026-02-01 00:00:00")
+        self.assertEqual((sessions, reservations), (1, 1))
+
+        hot_ids = [r[0] for r in self.db.get_all_sessions()]
+        self.assertEqual(hot_ids, [future_id])
+        self.assertIsNone(self.db.get_client_reservation(client.user_id, self.session_id))
+
+        all_ids = [r[0] for r in self.db.get_all_sessions(include_archived=True)]
+        self.assertIn(self.session_id, all_ids)
+        self.assertEqual(len(client.get_reservations(self.db)), 0)
+        self.assertEqual(len(client.get_reservations(self.db, include_archived=True)), 1)
+        self.assertEqual(self.db.count_active_reservations(self.session_id, include_archived=True), 1)
+
+    def test_search_sessions_by_name_and_description(self):
+        self.schedule_service.add_session(
+            session_type="group",
+            trainer_id=self.trainer_id,
+            start_time="2026-02-01 12:00:00",
+            duration_min=45,
+            capacity=10,
+            name="Pilates",
+            description="Core & mobility",
+        )
+
+        names = [s["name"] for s in self.schedule_service.search_sessions("jog")]
+        self.assertEqual(names, ["Joga"])
+
+        names = [s["name"] for s in self.schedule_service.search_sessions("CORE")]
+        self.assertEqual(names, ["Pilates"])
+
+        self.schedule_service.edit_session(self.session_id, name="Stretching")
+        self.assertEqual(self.schedule_service.search_sessions("joga"), [])
+        self.assertEqual(len(self.schedule_service.search_sessions("stretch")), 1)
+
+        self.schedule_service.remove_session(self.session_id)
+        self.assertEqual(self.schedule_service.search_sessions("stretch"), [])
+        self.assertEqual(self.schedule_service.search_sessions('" OR *'), [])
+
+    def test_find_sessions_filters_and_keyset_pagination(self):
+        for hour, session_type, price in [(8, "group", 30), (12, "pt", 150), (18, "group", 40)]:
+            self.schedule_service.add_session(
+                session_type=session_type,
+                trainer_id=self.trainer_id,
+                start_time=f"2026-02-02 {hour:02d}:00:00",
+                duration_min=60,
+                capacity=1,
+                name=f"Zajęcia {hour}",
+                price=price,
+            )
+
+        pts = self.schedule_service.find_sessions(session_type="pt")
+        self.assertEqual([s["name"] for s in pts], ["Zajęcia 12"])
+
+        evening = self.schedule_service.find_sessions(start_from="2026-02-02", hour_from=17, max_price=50)
+        self.assertEqual([s["name"] for s in evening], ["Zajęcia 18"])
+
+        page = self.schedule_service.find_sessions(limit=2)
+        self.assertEqual(len(page), 2)
+        last = page[-1]
+        rest = self.schedule_service.find_sessions(after=(last["start_time"], last["session_id"]))
+        self.assertEqual(len(page) + len(rest), 4)
+
+        ok, _ = self.user_service.register_client("Iga", "Test", "iga@example.com", "pass123")
+        ok, client = self.user_service.login("iga@example.com", "pass123")
+        pt = pts[0]
+        self.reservation_service.create_reservation(client, pt)
+        free = self.schedule_service.find_sessions(session_type="pt", min_free=1)
+        self.assertEqual(free, [])
+
+    def _client(self, i):
+        email = f"k{i}@example.com"
+        ok, _ = self.user_service.register_client(f"K{i}", "Test", email, "pass123")
+        self.assertTrue(ok)
+        ok, c = self.user_service.login(email, "pass123")
+        self.assertTrue(ok)
+        return c
+
+    def test_cancel_session_cancels_its_reservations(self):
+        c1, c2 = self._client(1), self._client(2)
+        session_dict = {"session_id": self.session_id, "capacity": 2}
+        self.reservation_service.create_reservation(c1, session_dict)
+        self.reservation_service.create_reservation(c2, session_dict)
+
+        ok, _ = self.schedule_service.remove_session(self.session_id)
+        self.assertTrue(ok)
+
+        self.assertEqual(self.db.count_active_reservations(self.session_id), 0)
+        statuses = [r[2] for r in c1.get_reservations(self.db)]
+        self.assertEqual(statuses, ["CANCELLED"])
+
+    def test_cancel_trainer_day_and_many_sessions(self):
+        other_day = self.db.add_session("group", "Rowery", None, None, None, self.trainer_id,
+                                        "2026-02-01 09:00:00", 60, 5)
+        same_day = self.db.add_session("group", "Crossfit", None, None, None, self.trainer_id,
+                                       "2026-01-31 18:00:00", 60, 5)
+        c1 = self._client(1)
+        self.reservation_service.create_reservation(c1, {"session_id": same_day, "capacity": 5})
+
+        ok, msg = self.schedule_service.cancel_trainer_day(self.trainer_id, date(2026, 1, 31))
+        self.assertTrue(ok)
+        self.assertEqual(msg, "Anulowano sesje: 2, rezerwacje: 1")
+        self.assertEqual([r[0] for r in self.db.get_all_sessions()], [other_day])
+
+        sessions, _ = self.db.cancel_sessions([other_day, same_day])
+        self.assertEqual(sessions, 1)
+        self.assertEqual(self.db.get_all_sessions(), [])
+
+    def test_cancel_and_edit_enqueue_notifications_for_participants(self):
+        c1, c2 = self._client(1), self._client(2)
+        session_dict = {"session_id": self.session_id, "capacity": 2}
+        self.reservation_service.create_reservation(c1, session_dict)
+        self.reservation_service.create_reservation(c2, session_dict)
+
+        self.schedule_service.edit_session(self.session_id, start_time="2026-01-31 11:00:00")
+        self.schedule_service.remove_session(self.session_id)
+        self.assertEqual(self.db.count_notifications("PENDING"), 4)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "out.jsonl")
+            dispatcher = NotificationDispatcher(self.db, [FileSink(path)], chunk_size=3)
+            self.assertEqual(dispatcher.dispatch_once(), 4)
+
+            with open(path, encoding="utf-8") as f:
+                sent = [json.loads(line) for line in f]
+
+        kinds = sorted(n["kind"] for n in sent)
+        self.assertEqual(kinds, ["SESSION_CANCELLED"] * 2 + ["SESSION_CHANGED"] * 2)
+        self.assertEqual(sent[0]["payload"]["start_time"], "2026-01-31 11:00:00")
+        self.assertEqual(self.db.count_notifications("SENT"), 4)
+
+    def test_failed_delivery_is_retried_then_marked_failed(self):
+        class BrokenSink:
+            def send_batch(self, notifications):
+                raise OSError("smtp down")
+
+        c1 = self._client(1)
+        self.reservation_service.create_reservation(c1, {"session_id": self.session_id, "capacity": 2})
+        self.schedule_service.remove_session(self.session_id)
+
+        dispatcher = NotificationDispatcher(self.db, [BrokenSink()], max_attempts=2)
+        with self.assertLogs("notifications", level="ERROR"):
+            self.assertEqual(dispatcher.dispatch_once(), 0)
+        self.assertEqual(self.db.count_notifications("PENDING"), 1)
+        with self.assertLogs("notifications", level="ERROR"):
+            dispatcher.dispatch_once()
+        self.assertEqual(self.db.count_notifications("FAILED"), 1)
+
+    def test_waitlist_promotes_first_client_on_cancellation(self):
+        c1, c2, c3, c4 = (self._client(i) for i in range(1, 5))
+        session_dict = {"session_id": self.session_id, "capacity": 2}
+        self.reservation_service.create_reservation(c1, session_dict)
+        self.reservation_service.create_reservation(c2, session_dict)
+
+        ok, msg = self.reservation_service.join_waitlist(c3, session_dict)
+        self.assertTrue(ok)
+        self.assertIn("pozycja 1", msg)
+        ok, _ = self.reservation_service.join_waitlist(c4, session_dict)
+        self.assertTrue(ok)
+        ok, msg = self.reservation_service.join_waitlist(c4, session_dict)
+        self.assertFalse(ok)
+        self.assertEqual(self.reservation_service.get_waitlist_position(c4, self.session_id), 2)
+
+        ok, _ = self.reservation_service.cancel_reservation(c1, session_dict)
+        self.assertTrue(ok)
+
+        self.assertTrue(self.db.client_has_reservation(c3.user_id, self.session_id))
+        self.assertFalse(self.db.client_has_reservation(c4.user_id, self.session_id))
+        self.assertEqual(self.reservation_service.get_waitlist_position(c4, self.session_id), 1)
+        self.assertEqual(self.db.count_active_reservations(self.session_id), 2)
+        self.assertEqual(self.db.count_notifications("PENDING"), 1)
+
+    def test_concurrent_cancellations_promote_each_waiter_once(self):
+        clients = [self._client(i) for i in range(1, 6)]
+        session_dict = {"session_id": self.session_id, "capacity": 2}
+        for c in clients[:2]:
+            self.reservation_service.create_reservation(c, session_dict)
+        for c in clients[2:]:
+            self.reservation_service.join_waitlist(c, session_dict)
+
+        ids = [self.db.get_client_reservation(c.user_id, self.session_id)[0] for c in clients[:2]]
+        threads = [threading.Thread(target=self.reservation_service.cancel_reservation_by_id, args=(i,)) for i in ids]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        participants = {row[0] for row in self.db.get_session_participants(self.session_id)}
+        self.assertEqual(participants, {clients[2].user_id, clients[3].user_id})
+        self.assertEqual(self.reservation_service.get_waitlist_position(clients[4], self.session_id), 1)
+
+    def test_trainer_overlap_rejected_on_add_edit_and_import(self):
+        ok, msg = self.schedule_service.add_session("group", self.trainer_id, "2026-01-31 10:30:00", 60, 5, name="Rowery")
+        self.assertFalse(ok)
+        self.assertEqual(msg, "Trener ma w tym czasie inne zajęcia")
+
+        ok, _ = self.schedule_service.add_session("group", self.trainer_id, "2026-01-31T11:00:00", 60, 5, name="Rowery")
+        self.assertTrue(ok)
+
+        ok, msg = self.schedule_service.edit_session(self.session_id, duration_min=90)
+        self.assertFalse(ok)
+        ok, _ = self.schedule_service.edit_session(self.session_id, duration_min=45)
+        self.assertTrue(ok)
+
+        entries = [
+            {"session_type": "group", "trainer_id": self.trainer_id, "start_time": "2026-01-31 09:30:00",
+             "duration_min": 60, "capacity": 5},
+            {"session_type": "group", "trainer_id": self.trainer_id, "start_time": "2026-02-01 09:00:00",
+             "duration_min": 60, "capacity": 5},
+            {"session_type": "group", "trainer_id": self.trainer_id, "start_time": "2026-02-01 09:45:00",
+             "duration_min": 30, "capacity": 5},
+            {"session_type": "yoga", "trainer_id": self.trainer_id, "start_time": "2026-02-02 09:00:00",
+             "duration_min": 30, "capacity": 5},
+            {"session_type": "pt", "trainer_id": self.trainer_id, "start_time": "2026-02-03 09:00:00",
+             "duration_min": 60, "capacity": 1, "price": "sto"},
+            {"session_type": "pt", "trainer_id": self.trainer_id, "start_time": "2026-02-04 09:00:00",
+             "duration_min": "godzina", "capacity": 1},
+        ]
+        errors = self.schedule_service.validate_schedule(entries)
+        self.assertEqual([i for i, _ in errors], [0, 2, 3, 4, 5])
+        self.assertIn((4, "Niepoprawna cena"), errors)
+
+        ok, msg = self.schedule_service.import_sessions([entries[1], dict(entries[4], price="120.50")])
+        self.assertTrue(ok)
+        self.assertEqual(len(self.db.get_sessions_for_trainer(self.trainer_id)), 4)
+
+    def test_find_pt_slots_skips_trainer_sessions(self):
+        slots = self.schedule_service.find_pt_slots(
+            date(2026, 1, 31), date(2026, 1, 31),
+            working_hours=(8, 13), step_min=60, now=datetime(2026, 1, 1),
+        )
+        starts = [s["start_time"][11:16] for s in slots if s["trainer_id"] == self.trainer_id]
+        self.assertEqual(starts, ["08:00", "09:00", "11:00", "12:00"])
+
+        slots = self.schedule_service.find_pt_slots(
+            date(2026, 1, 31), date(2026, 2, 1), trainer_id=self.trainer_id,
+            working_hours={self.trainer_id: (9, 12)}, now=datetime(2026, 1, 31, 11, 0),
+        )
+        self.assertEqual(
+            [s["start_time"] for s in slots],
+            ["2026-01-31 11:00:00", "2026-02-01 09:00:00", "2026-02-01 09:30:00",
+             "2026-02-01 10:00:00", "2026-02-01 10:30:00", "2026-02-01 11:00:00"],
+        )
+
+    def _other_trainer_session(self, name, start_time, duration_min=60, capacity=5):
+        trainer_id = self.db.get_user("marian@mygym")[0]
+        return self.db.add_session("group", name, None, None, None, trainer_id, start_time, duration_min, capacity)
+
+    def test_client_cannot_book_overlapping_classes(self):
+        c1 = self._client(1)
+        crossfit = self._other_trainer_session("Crossfit", "2026-01-31 10:30:00")
+        later = self._other_trainer_session("Sztangi", "2026-01-31 11:00:00")
+
+        ok, _ = self.reservation_service.create_reservation(c1, {"session_id": self.session_id, "capacity": 2})
+        self.assertTrue(ok)
+        ok, msg = self.reservation_service.create_reservation(c1, {"session_id": crossfit, "capacity": 5})
+        self.assertFalse(ok)
+        self.assertEqual(msg, "Masz w tym czasie inne zajęcia")
+        ok, _ = self.reservation_service.create_reservation(c1, {"session_id": later, "capacity": 5})
+        self.assertTrue(ok)
+
+        # przesunięcie zajęć aktualizuje czas w rezerwacjach
+        self.db.update_session(crossfit, start_time="2026-01-31 12:00:00")
+        ok, _ = self.reservation_service.create_reservation(c1, {"session_id": crossfit, "capacity": 5})
+        self.assertTrue(ok)
+
+    def test_series_booking_is_all_or_nothing(self):
+        c1 = self._client(1)
+        week2 = self._other_trainer_session("Joga", "2026-02-07 10:00:00")
+        week3 = self._other_trainer_session("Joga", "2026-02-14 10:00:00")
+        clash = self._other_trainer_session("Rowery", "2026-02-14 10:15:00")
+
+        ok, errors = self.reservation_service.create_reservations(c1, [self.session_id, week2, week3, clash])
+        self.assertFalse(ok)
+        self.assertEqual(errors, [(clash, "Zajęcia w serii nakładają się")])
+        self.assertEqual(c1.get_reservations(self.db), [])
+
+        ok, msg = self.reservation_service.create_reservations(c1, [self.session_id, week2, week3])
+        self.assertTrue(ok)
+        self.assertEqual(msg, "Zapisano na zajęcia: 3")
+
+        ok, errors = self.reservation_service.create_reservations(c1, [clash])
+        self.assertEqual(errors, [(clash, "Masz w tym czasie inne zajęcia")])
+
+    @unittest.skipIf(numpy is None, "analityka wymaga numpy")
+    def test_occupancy_report_heatmap_and_groups(self):
+        from analytics import OccupancyAnalytics
+
+        c1, c2 = self._client(1), self._client(2)
+        pilates = self._other_trainer_session("Pilates", "2026-02-02 18:00:00", capacity=4)
+        self.reservation_service.create_reservation(c1, {"session_id": self.session_id, "capacity": 2})
+        self.reservation_service.create_reservation(c2, {"session_id": self.session_id, "capacity": 2})
+        self.reservation_service.create_reservation(c1, {"session_id": pilates, "capacity": 4})
+        self.reservation_service.cancel_reservation(c1, {"session_id": pilates})
+
+        report = OccupancyAnalytics(self.db).report()
+
+        # 2026-01-31 to sobota, 2026-02-02 poniedziałek
+        self.assertEqual(report.fill_rate[5, 10], 1.0)
+        self.assertEqual(report.fill_rate[0, 18], 0.0)
+        self.assertEqual(report.capacity[0, 18], 4)
+        self.assertEqual(report.total_sessions, 2)
+        self.assertAlmostEqual(report.cancellation_rate, 1 / 3)
+
+        by_name = {row["key"]: row for row in report.groups["name"]}
+        self.assertEqual(by_name["Joga"]["fill_rate"], 1.0)
+        self.assertEqual(by_name["Pilates"]["cancellation_rate"], 1.0)
+        self.assertEqual(len(report.groups["trainer_id"]), 2)
+
+    def test_rollups_follow_reservations_and_match_rebuild(self):
+        c1, c2 = self._client(1), self._client(2)
+        self.db.update_session(self.session_id, price=30.0)
+        pt = self.db.add_session("pt", "Trening personalny", None, None, 150.0, self.trainer_id,
+                                 "2026-02-01 12:00:00", 60, 1)
+        self.reservation_service.create_reservation(c1, {"session_id": self.session_id, "capacity": 2})
+        self.reservation_service.create_reservation(c2, {"session_id": self.session_id, "capacity": 2})
+        self.reservation_service.create_reservation(c1, {"session_id": pt, "capacity": 1})
+        self.reservation_service.cancel_reservation(c2, {"session_id": self.session_id})
+
+        reports = ReportService(self.db)
+        totals = reports.daily_totals(date(2026, 1, 31), date(2026, 2, 1))
+        self.assertEqual(totals["2026-01-31"], {"sessions": 1, "bookings": 2, "cancellations": 1, "revenue": 30.0})
+
+        week = reports.trainer_week(date(2026, 1, 28), self.trainer_id)
+        self.assertEqual(week[0]["week_start"], "2026-01-26")
+        self.assertEqual((week[0]["bookings"], week[0]["revenue"]), (3, 180.0))
+
+        month = {r["client_id"]: r for r in reports.client_month("2026-02")}
+        self.assertEqual(month[c1.user_id]["revenue"], 150.0)
+
+        before = [reports.sessions_by_day(date(2026, 1, 1), date(2026, 3, 1)), reports.client_month("2026-01")]
+        reports.rebuild()
+        after = [reports.sessions_by_day(date(2026, 1, 1), date(2026, 3, 1)), reports.client_month("2026-01")]
+        self.assertEqual(before, after)
+
+    def _rollup_rows(self):
+        with self.db.connect() as conn:
+            return [
+                conn.execute(f"SELECT * FROM {table} ORDER BY 1, 2").fetchall()
+                for table, _keys, _exprs in Database.ROLLUPS
+            ]
+
+    def test_rollups_follow_session_edits(self):
+        c1, c2 = self._client(1), self._client(2)
+        other_trainer = self.db.add_user("Olga", "Trener", "olga@mygym", "x", "trainer")
+        self.db.update_session(self.session_id, price=50.0)
+        self.reservation_service.create_reservation(c1, {"session_id": self.session_id, "capacity": 2})
+        self.reservation_service.create_reservation(c2, {"session_id": self.session_id, "capacity": 2})
+        self.reservation_service.cancel_reservation(c2, {"session_id": self.session_id})
+
+        # nowy dzień, miesiąc, cena i trener - agregaty idą za sesją
+        self.schedule_service.edit_session(self.session_id, start_time="2026-02-02 10:00:00", price=60.0)
+        self.db.update_session(self.session_id, trainer_id=other_trainer)
+        self.reservation_service.cancel_reservation(c1, {"session_id": self.session_id})
+
+        rows = self._rollup_rows()
+        self.assertEqual(rows[0], [("2026-02-02", self.session_id, 2, 2, 0.0)])
+        ReportService(self.db).rebuild()
+        self.assertEqual(self._rollup_rows(), rows)
+
+    def test_rollups_are_backfilled_when_tables_are_added(self):
+        c1 = self._client(1)
+        self.db.update_session(self.session_id, price=50.0)
+        self.reservation_service.create_reservation(c1, {"session_id": self.session_id, "capacity": 2})
+        expected = self._rollup_rows()
+        # baza sprzed wprowadzenia agregatów
+        with self.db.connect() as conn:
+            triggers = conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'rollup%'")
+            for (name,) in triggers.fetchall():
+                conn.execute(f"DROP TRIGGER {name}")
+            for table, _keys, _exprs in Database.ROLLUPS:
+                conn.execute(f"DROP TABLE {table}")
+
+        self.db.create_tables()
+        self.assertEqual(self._rollup_rows(), expected)
+        self.reservation_service.cancel_reservation(c1, {"session_id": self.session_id})
+        self.assertEqual(self._rollup_rows()[0], [("2026-01-31", self.session_id, 1, 1, 0.0)])
+
+    def test_legacy_data_fixes_run_once(self):
+        with self.db.connect() as conn:
+            conn.execute("UPDATE sessions SET start_time = '2026-01-31T10:00:00' WHERE id = ?", (self.session_id,))
+            conn.commit()
+
+        self.db.create_tables()
+        self.assertEqual(self.db.get_session_by_id(self.session_id)[7], "2026-01-31T10:00:00")
+
+        # plik bazy sprzed wersjonowania
+        with self.db.connect() as conn:
+            conn.execute("PRAGMA user_version = 0")
+        self.db.create_tables()
+        self.assertEqual(self.db.get_session_by_id(self.session_id)[7], "2026-01-31 10:00:00")
+
+    def test_archived_reservations_get_session_times_on_upgrade(self):
+        c1 = self._client(1)
+        self.reservation_service.create_reservation(c1, {"session_id": self.session_id, "capacity": 2})
+        self.db.archive_sessions_before("2026-02-01 00:00:00")
+
+        # archiwum z pliku bazy sprzed kolumn starts_at/ends_at
+        with self.db.connect() as conn:
+            conn.execute("ALTER TABLE reservations_archive DROP COLUMN starts_at")
+            conn.execute("ALTER TABLE reservations_archive DROP COLUMN ends_at")
+            conn.commit()
+        self.db.create_tables()
+
+        with self.db.connect() as conn:
+            rows = conn.execute("SELECT starts_at, ends_at FROM reservations_archive").fetchall()
+        self.assertEqual(rows, [("2026-01-31 10:00:00", "2026-01-31 11:00:00")])
+
+    def test_import_clients_inserts_valid_rows_in_bulk(self):
+        self._client(1)
+        entries = [
+            {"first_name": "Klient", "last_name": "Nowy", "email": f"nowy{i}@example.com", "password": "pw"}
+            for i in range(50)
+        ]
+        entries.append({"first_name": "Stary", "last_name": "Klient", "email": "k1@example.com", "password": "pw"})
+
+        count, errors = self.user_service.import_clients(entries)
+
+        self.assertEqual(count, 50)
+        self.assertEqual(errors, [(50, "Email zajęty")])
+        ok, user = self.user_service.login("nowy7@example.com", "pw")
+        self.assertTrue(ok)
+        self.assertEqual(user.role, "client")
+
+    def test_ics_feeds_are_rebuilt_only_after_changes(self):
+        client = self._client(1)
+        other = self._client(2)
+        ok, _ = self.reservation_service.create_reservation(client, {"session_id": self.session_id, "capacity": 2})
+        self.assertTrue(ok)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = FeedCache(self.db, tmp)
+            path = cache.feed_path(client.user_id, "client")
+            with open(path, encoding="utf-8", newline="") as f:
+                content = f.read()
+            self.assertIn("BEGIN:VEVENT\r\n", content)
+            self.assertIn("DTSTART:20260131T100000", content)
+            self.assertEqual(cache.feed_path(client.user_id, "client"), path)
+
+            # trener + 2 klientów (manager nie ma kalendarza), plik pierwszego klienta już jest
+            self.assertEqual(cache.refresh_all(), (2, 3))
+            self.assertEqual(cache.refresh_all(), (0, 3))
+
+            self.schedule_service.edit_session(self.session_id, start_time="2026-01-31 12:00:00")
+            self.assertEqual(cache.refresh_all(), (2, 3))
+            new_path = cache.feed_path(client.user_id, "client")
+            self.assertNotEqual(new_path, path)
+            self.assertFalse(os.path.exists(path))
+            with open(new_path, encoding="utf-8") as f:
+                self.assertIn("DTSTART:20260131T120000", f.read())
+
+            with open(cache.feed_path(other.user_id, "client"), encoding="utf-8") as f:
+                self.assertNotIn("VEVENT", f.read())
+
+    def test_participants_cache_follows_reservation_changes(self):
+        c1, c2 = self._client(1), self._client(2)
+        session_dict = {"session_id": self.session_id, "capacity": 2}
+        self.reservation_service.create_reservation(c1, session_dict)
+
+        cache = ParticipantsCache(self.db, self.trainer_id)
+        self.assertEqual([p[0] for p in cache.get(self.session_id)], [c1.user_id])
+
+        self.reservation_service.create_reservation(c2, session_dict)
+        self.assertEqual({p[0] for p in cache.get(self.session_id)}, {c1.user_id, c2.user_id})
+
+        self.reservation_service.cancel_reservation(c1, session_dict)
+        self.assertEqual(cache.get(str(self.session_id)), self.db.get_session_participants(self.session_id))
+
+    def test_week_sessions_come_from_one_range_query(self):
+        self.db.add_session("group", "Rowery", None, None, None, self.trainer_id, "2026-02-01 18:00:00", 60, 5)
+        self.db.add_session("group", "Poza tygodniem", None, None, None, self.trainer_id, "2026-02-02 06:00:00", 60, 5)
+
+        week = self.schedule_service.get_week_sessions(date(2026, 1, 26))
+
+        self.assertEqual([s["name"] for s in week[5][10]], ["Joga"])
+        self.assertEqual(week[5][10][0]["available"], 2)
+        self.assertEqual([s["name"] for s in week[6][18]], ["Rowery"])
+        self.assertEqual(sum(len(v) for day in week.values() for v in day.values()), 2)
+
+    def test_overview_aggregates_days_and_hours(self):
+        self.db.add_session("group", "Rowery", None, None, None, self.trainer_id, "2026-01-31 10:30:00", 30, 8)
+        self.db.add_session("group", "Pilates", None, None, None, self.trainer_id, "2026-01-31 18:00:00", 60, 10)
+        self.reservation_service.create_reservation(self._client(1), {"session_id": self.session_id, "capacity": 2})
+
+        overview = self.schedule_service.get_overview(date(2026, 1, 26), date(2026, 2, 1))
+
+        self.assertEqual(len(overview), 7)
+        day = overview[date(2026, 1, 31)]
+        self.assertEqual((day["sessions"], day["capacity"], day["reserved"]), (3, 20, 1))
+        self.assertEqual(day["hours"][10]["sessions"], 2)
+        self.assertAlmostEqual(day["hours"][10]["fill_rate"], 0.1)
+        self.assertEqual(overview[date(2026, 2, 1)]["sessions"], 0)
+
+    def test_export_reservations_streams_filtered_csv(self):
+        c1, c2 = self._client(1), self._client(2)
+        later = self.db.add_session("group", "Rowery", None, None, 35.0, self.trainer_id,
+                                    "2026-02-10 09:00:00", 60, 5)
+        self.reservation_service.create_reservation(c1, {"session_id": self.session_id, "capacity": 2})
+        self.reservation_service.create_reservation(c2, {"session_id": self.session_id, "capacity": 2})
+        self.reservation_service.create_reservation(c1, {"session_id": later, "capacity": 5})
+
+        chunks = list(self.db.iter_reservations_export(chunk_size=2))
+        self.assertEqual([len(c) for c in chunks], [2, 1])
+
+        out = io.StringIO()
+        count = export.export_reservations(self.db, out, start="2026-02-01", end="2026-03-01")
+        self.assertEqual(count, 1)
+        rows = list(csv.DictReader(io.StringIO(out.getvalue())))
+        self.assertEqual(rows[0]["session_name"], "Rowery")
+        self.assertEqual(rows[0]["email"], "k1@example.com")
+
+        out = io.StringIO()
+        self.assertEqual(export.export_sessions(self.db, out, trainer_id=self.trainer_id), 2)
+
+        # liczba rezerwacji sesji z archiwum liczona z reservations_archive
+        self.db.archive_sessions_before("2026-02-01 00:00:00")
+        rows = [row for chunk in self.db.iter_sessions_export(include_archived=True) for row in chunk]
+        self.assertEqual([(row[0], row[-1]) for row in rows], [(self.session_id, 2), (later, 1)])
+
+    def test_checkin_index_syncs_changes_and_batches_attendance(self):
+        c1, c2 = self._client(1), self._client(2)
+        session_dict = {"session_id": self.session_id, "capacity": 2}
+        self.reservation_service.create_reservation(c1, session_dict)
+
+        service = CheckInService(self.db, day=date(2026, 1, 31))
+        service.start()
+        now = datetime(2026, 1, 31, 9, 45)
+        self.assertEqual(len(service.index), 1)
+
+        ok, msg = service.check_in("K1@example.com ", now=now)
+        self.assertTrue(ok)
+        self.assertEqual(msg, "Witaj, K1! Joga o 10:00")
+        self.assertEqual(service.check_in(str(c1.user_id), now=now), (False, "Wejście już zarejestrowane"))
+        self.assertEqual(service.check_in("k2@example.com", now=now), (False, "Brak rezerwacji na dziś"))
+
+        # nowa rezerwacja i anulowanie docierają przez dziennik zmian, bez ponownego load()
+        self.reservation_service.create_reservation(c2, session_dict)
+        self.reservation_service.cancel_reservation(c1, session_dict)
+        self.assertEqual(service.refresh(), 2)
+        self.assertEqual(service.refresh(), 0)
+        self.assertEqual(len(service.index), 1)
+        self.assertEqual(service.check_in(str(c2.user_id), now=datetime(2026, 1, 31, 9, 0))[1],
+                         "Zajęcia zaczynają się o 10:00 - zapraszamy później")
+        self.assertTrue(service.check_in(str(c2.user_id), now=now)[0])
+
+        service.stop()
+        self.assertEqual(service.writer.written, 2)
+        attendance = self.db.get_session_attendance(self.session_id)
+        self.assertEqual([row[0] for row in attendance], [c1.user_id, c2.user_id])
+
+    def test_billing_run_invoices_paid_sessions_once(self):
+        c1, c2, c3 = self._client(1), self._client(2), self._client(3)
+        pt = self.db.add_session("pt", "Trening", None, None, 120.0, self.trainer_id, "2026-01-20 08:00:00", 60, 1)
+        paid = self.db.add_session("group", "Rowery", None, None, 30.0, self.trainer_id, "2026-01-21 18:00:00", 60, 5)
+        february = self.db.add_session("group", "Rowery", None, None, 30.0, self.trainer_id,
+                                       "2026-02-04 18:00:00", 60, 5)
+        self.reservation_service.create_reservation(c1, {"session_id": pt, "capacity": 1})
+        self.reservation_service.create_reservation(c1, {"session_id": paid, "capacity": 5})
+        self.reservation_service.create_reservation(c1, {"session_id": february, "capacity": 5})
+        # bezpłatna Joga i anulowane zajęcia nie trafiają na fakturę
+        self.reservation_service.create_reservation(c2, {"session_id": self.session_id, "capacity": 2})
+        self.reservation_service.create_reservation(c3, {"session_id": paid, "capacity": 5})
+        self.reservation_service.cancel_reservation(c3, {"session_id": paid, "capacity": 5})
+
+        service = BillingService(self.db)
+        ok, msg = service.run("2026-01", chunk_size=1)
+        self.assertTrue(ok)
+        self.assertEqual(msg, "Wystawiono faktury za 2026-01: 1")
+
+        invoices = service.get_invoices("2026-01")
+        self.assertEqual(len(invoices), 1)
+        self.assertEqual(invoices[0]["client_id"], c1.user_id)
+        self.assertEqual((invoices[0]["items"], invoices[0]["pt_items"], invoices[0]["amount"]), (2, 1, 150.0))
+        self.assertEqual(self.db.get_billing_run("2026-01")[1:4], ("DONE", c3.user_id, 1))
+
+        self.assertEqual(service.run("2026-01")[1], "Rozliczenie za 2026-01 już zakończone (faktury: 1)")
+        self.assertFalse(service.run("2026-13")[0])
+
+    def test_pass_credits_are_debited_and_refunded_with_reservation(self):
+        c1 = self._client(1)
+        paid = self.db.add_session("group", "Rowery", None, None, 30.0, self.trainer_id, "2026-01-21 18:00:00", 60, 5)
+        other = self.db.add_session("group", "Rowery", None, None, 30.0, self.trainer_id, "2026-01-22 18:00:00", 60, 5)
+        credits = CreditService(self.db)
+        self.assertEqual(credits.buy_pass(c1.user_id, 1), (True, "Dodano wejścia: 1, saldo: 1"))
+
+        # bezpłatne zajęcia nie zużywają wejścia
+        self.assertEqual(self.reservation_service.create_reservation(c1, {"session_id": self.session_id, "capacity": 2}),
+                         (True, "Zapisano na zajęcia"))
+        ok, msg = self.reservation_service.create_reservation(c1, {"session_id": paid, "capacity": 5})
+        self.assertEqual(msg, "Zapisano na zajęcia - wykorzystano wejście z karnetu (zostało: 0)")
+        self.assertEqual(self.db.add_reservation_with_credit(c1.user_id, other, "2026-01-01 10:00:00"), None)
+        self.assertFalse(self.db.client_has_reservation(c1.user_id, other))
+        self.assertEqual(self.reservation_service.create_reservation(c1, {"session_id": other, "capacity": 5}),
+                         (True, "Zapisano na zajęcia"))
+
+        # zajęcia z karnetu nie trafiają na fakturę
+        BillingService(self.db).run("2026-01")
+        self.assertEqual(BillingService(self.db).get_invoices("2026-01")[0]["amount"], 30.0)
+
+        self.reservation_service.cancel_reservation(c1, {"session_id": paid, "capacity": 5})
+        self.reservation_service.cancel_reservation(c1, {"session_id": paid, "capacity": 5})
+        self.assertEqual(credits.get_balance(c1.user_id), 1)
+        self.assertEqual([h["reason"] for h in credits.get_history(c1.user_id)], ["REFUND", "BOOKING", "PURCHASE"])
+        self.assertEqual(credits.adjust(c1.user_id, -2), (False, "Za mało wejść na karnecie"))
+
+    def test_waitlist_promotion_uses_pass_entry(self):
+        c1, c2, c3 = self._client(1), self._client(2), self._client(3)
+        paid = self.db.add_session("group", "Rowery", None, None, 30.0, self.trainer_id, "2026-01-21 18:00:00", 60, 1)
+        paid_dict = {"session_id": paid, "capacity": 1}
+        self.db.add_credits(c2.user_id, 2, "2026-01-01 10:00:00")
+        self.reservation_service.create_reservation(c1, paid_dict)
+        self.reservation_service.join_waitlist(c2, paid_dict)
+        self.reservation_service.join_waitlist(c3, paid_dict)
+
+        self.reservation_service.cancel_reservation(c1, paid_dict)
+        self.assertTrue(self.db.client_has_reservation(c2.user_id, paid))
+        self.assertEqual(self.db.get_credit_balance(c2.user_id), 1)
+
+        # bez karnetu awans jest płatny za zajęcia
+        self.reservation_service.cancel_reservation(c2, paid_dict)
+        self.assertTrue(self.db.client_has_reservation(c3.user_id, paid))
+        self.assertEqual(self.db.get_credit_balance(c2.user_id), 2)
+        self.assertEqual(self.db.get_credit_balance(c3.user_id), 0)
+
+    def test_series_booking_uses_pass_entries_while_they_last(self):
+        c1 = self._client(1)
+        series = [
+            self.db.add_session("group", "Rowery", None, None, 30.0, self.trainer_id,
+                                f"2026-02-{d:02d} 18:00:00", 60, 5)
+            for d in (17, 3, 10)
+        ]
+        self.db.add_credits(c1.user_id, 2, "2026-01-01 10:00:00")
+
+        ok, msg = self.reservation_service.create_reservations(c1, [self.session_id] + series)
+        self.assertTrue(ok)
+        self.assertEqual(msg, "Zapisano na zajęcia: 4 - wykorzystano wejść z karnetu: 2 (zostało: 0)")
+        # wejścia poszły na dwie najwcześniejsze płatne zajęcia, ostatnie są płatne za zajęcia
+        history = CreditService(self.db).get_history(c1.user_id)
+        debited = {h["reservation_id"] for h in history if h["reason"] == "BOOKING"}
+        self.assertEqual(
+            sorted(self.db.get_client_reservation(c1.user_id, sid)[0] for sid in series[1:]),
+            sorted(debited),
+        )
+
+    def test_concurrent_bookings_never_overdraw_pass(self):
+        c1 = self._client(1)
+        sessions = [
+            self.db.add_session("group", "Rowery", None, None, 30.0, self.trainer_id,
+                                f"2026-02-{day:02d} 18:00:00", 60, 5)
+            for day in range(1, 9)
+        ]
+        self.db.add_credits(c1.user_id, 3, "2026-01-01 10:00:00")
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda sid=sid: results.append(
+                self.db.add_reservation_with_credit(c1.user_id, sid, "2026-01-01 10:00:00")))
+            for sid in sessions
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(sum(r is not None for r in results), 3)
+        self.assertEqual(self.db.get_credit_balance(c1.user_id), 0)
+        self.assertEqual(len(self.db.get_client_intervals(c1.user_id, "2026-02-01", "2026-03-01")), 3)
+
+    def test_seat_holds_take_capacity_until_confirmed_or_expired(self):
+        c1, c2, c3 = self._client(1), self._client(2), self._client(3)
+        session_dict = {"session_id": self.session_id, "capacity": 2}
+
+        ok, msg = self.reservation_service.hold_seat(c1, session_dict)
+        self.assertTrue(ok, msg)
+        self.assertTrue(self.reservation_service.hold_seat(c2, session_dict)[0])
+        self.assertEqual(self.schedule_service.get_available_slots(self.session_id), 0)
+        self.assertEqual(self.reservation_service.hold_seat(c3, session_dict), (False, "Brak wolnych miejsc"))
+        self.assertEqual(self.reservation_service.create_reservation(c3, session_dict), (False, "Brak wolnych miejsc"))
+
+        # potwierdzenie zamienia trzymane miejsce na rezerwację, zwolnienie oddaje miejsce
+        self.assertEqual(self.reservation_service.confirm_hold(c1, session_dict), (True, "Zapisano na zajęcia"))
+        self.assertTrue(self.db.client_has_reservation(c1.user_id, self.session_id))
+        self.assertEqual(self.schedule_service.get_available_slots(self.session_id), 0)
+        self.assertTrue(self.reservation_service.release_hold(c2, session_dict)[0])
+        self.assertEqual(self.schedule_service.get_available_slots(self.session_id), 1)
+
+        # wygasłe miejsce nie blokuje innych i nie da się go potwierdzić
+        self.reservation_service.hold_seat(c2, session_dict, now=datetime.now() - timedelta(minutes=15))
+        self.assertEqual(self.schedule_service.get_available_slots(self.session_id), 1)
+        self.assertFalse(self.reservation_service.confirm_hold(c2, session_dict)[0])
+        self.assertEqual(self.reservation_service.create_reservation(c3, session_dict), (True, "Zapisano na zajęcia"))
+        self.assertEqual(HoldSweeper(self.db, batch_size=1).sweep_once(), 1)
+        self.assertEqual(HoldSweeper(self.db).sweep_once(), 0)
+
+    def test_confirmed_hold_is_not_sold_twice_and_uses_pass(self):
+        c1, c2 = self._client(1), self._client(2)
+        single = self.db.add_session("group", "Rowery", None, None, 30.0, self.trainer_id, "2026-02-03 18:00:00", 60, 1)
+        clash = self.db.add_session("group", "Pilates", None, None, 30.0, self.trainer_id,
+                                    "2026-02-03 18:30:00", 60, 5)
+        single_dict = {"session_id": single, "capacity": 1}
+        self.db.add_credits(c1.user_id, 3, "2026-01-01 10:00:00")
+
+        self.assertTrue(self.reservation_service.hold_seat(c1, single_dict)[0])
+        ok, errors = self.reservation_service.create_reservations(c2, [single])
+        self.assertFalse(ok)
+        self.assertEqual(errors, [(single, "Brak wolnych miejsc")])
+
+        # kolizja sprawdzana także przy potwierdzeniu - miejsce zostaje trzymane
+        self.db.add_reservation(c1.user_id, clash, "2026-01-01 10:00:00")
+        self.assertEqual(self.reservation_service.confirm_hold(c1, single_dict),
+                         (False, "Masz w tym czasie inne zajęcia"))
+        self.reservation_service.cancel_reservation(c1, {"session_id": clash, "capacity": 5})
+
+        self.assertEqual(self.reservation_service.confirm_hold(c1, single_dict),
+                         (True, "Zapisano na zajęcia - wykorzystano wejście z karnetu (zostało: 2)"))
+        self.assertEqual(self.db.count_active_reservations(single), 1)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,191 @@
+import argparse
+import csv
+import json
+
+import export
+from db import Database
+from feeds import FeedCache
+from models import (
+    UserService, ScheduleService, ReportService, BillingService, CreditService, HoldSweeper,
+    ARCHIVE_HORIZON_DAYS, BILLING_CHUNK, PASS_ENTRIES,
+)
+
+
+def archive(args):
+    db = Database(args.db)
+    db.create_tables()
+
+    ok, msg = ScheduleService(db).archive_past_sessions(args.days)
+    print(msg)
+    return 0 if ok else 1
+
+
+def import_sessions(args):
+    db = Database(args.db)
+    db.create_tables()
+
+    with open(args.file, newline='', encoding='utf-8') as f:
+        # konwersje pól (także ceny) sprawdza validate_schedule - zły wiersz trafia do listy błędów
+        entries = [{k: (v or None) for k, v in row.items()} for row in csv.DictReader(f)]
+
+    ok, result = ScheduleService(db).import_sessions(entries)
+    if ok:
+        print(result)
+        return 0
+
+    for i, error in result:
+        # +2: nagłówek CSV i numeracja wierszy od 1
+        print(f'Wiersz {i + 2}: {error}')
+    return 1
+
+
+def import_clients(args):
+    db = Database(args.db)
+    db.create_tables()
+
+    with open(args.file, newline='', encoding='utf-8') as f:
+        if args.file.lower().endswith('.json'):
+            entries = json.load(f)
+        else:
+            entries = list(csv.DictReader(f))
+
+    count, errors = UserService(db).import_clients(entries, workers=args.workers)
+    for i, error in errors:
+        # w CSV +2: nagłówek i numeracja od 1
+        line = i + 1 if args.file.lower().endswith('.json') else i + 2
+        print(f'Wiersz {line}: {error}')
+    print(f'Dodano klientów: {count}')
+    return 0 if not errors else 1
+
+
+def rebuild_rollups(args):
+    db = Database(args.db)
+    db.create_tables()
+
+    ok, msg = ReportService(db).rebuild()
+    print(msg)
+    return 0 if ok else 1
+
+
+def export_data(args):
+    db = Database(args.db)
+    db.create_tables()
+
+    filters = {
+        'start': args.date_from,
+        'end': args.date_to,
+        'trainer_id': args.trainer,
+        'include_archived': args.archived,
+    }
+    if args.what == 'reservations':
+        count = export.export_reservations(db, args.out, fmt=args.format, **filters)
+    else:
+        count = export.export_sessions(db, args.out, fmt=args.format, **filters)
+    print(f'Wyeksportowano wierszy: {count} -> {args.out}')
+    return 0
+
+
+def refresh_feeds(args):
+    db = Database(args.db)
+    db.create_tables()
+
+    refreshed, total = FeedCache(db, args.dir).refresh_all()
+    print(f'Odświeżone kalendarze: {refreshed} z {total}')
+    return 0
+
+
+def bill(args):
+    db = Database(args.db)
+    db.create_tables()
+
+    ok, msg = BillingService(db).run(args.month, chunk_size=args.chunk)
+    print(msg)
+    return 0 if ok else 1
+
+
+def add_credits(args):
+    db = Database(args.db)
+    db.create_tables()
+
+    user = db.get_user_by_id(args.client)
+    if user is None or user[5] != 'client':
+        print('Nie znaleziono klienta')
+        return 1
+    service = CreditService(db)
+    if args.adjust:
+        ok, msg = service.adjust(args.client, args.entries)
+    else:
+        ok, msg = service.buy_pass(args.client, args.entries)
+    print(msg)
+    return 0 if ok else 1
+
+
+def sweep_holds(args):
+    db = Database(args.db)
+    db.create_tables()
+
+    removed = HoldSweeper(db).sweep_once()
+    print(f'Usunięte wygasłe miejsca: {removed}')
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Zadania administracyjne MyGym')
+    parser.add_argument('--db', default='mygym.db', help='ścieżka do bazy danych')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('archive', help='przenieś stare sesje i rezerwacje do archiwum')
+    p.add_argument('--days', type=int, default=ARCHIVE_HORIZON_DAYS,
+                   help='archiwizuj sesje starsze niż tyle dni')
+    p.set_defaults(func=archive)
+
+    p = sub.add_parser('import-sessions', help='zaimportuj grafik z CSV (po sprawdzeniu kolizji)')
+    p.add_argument('file', help='CSV z kolumnami session_type, trainer_id, start_time, duration_min, capacity, ...')
+    p.set_defaults(func=import_sessions)
+
+    p = sub.add_parser('import-clients', help='zarejestruj klientów z CSV lub JSON')
+    p.add_argument('file', help='CSV/JSON z polami first_name, last_name, email, password')
+    p.add_argument('--workers', type=int, help='liczba procesów do hashowania haseł')
+    p.set_defaults(func=import_clients)
+
+    p = sub.add_parser('rebuild-rollups', help='przelicz od nowa tabele agregatów do raportów')
+    p.set_defaults(func=rebuild_rollups)
+
+    p = sub.add_parser('export', help='eksport rezerwacji lub grafiku do CSV/Parquet')
+    p.add_argument('what', choices=['reservations', 'sessions'])
+    p.add_argument('out', help='plik wynikowy')
+    p.add_argument('--format', choices=['csv', 'parquet'], default='csv')
+    p.add_argument('--from', dest='date_from', help='od daty (YYYY-MM-DD), włącznie')
+    p.add_argument('--to', dest='date_to', help='do daty (YYYY-MM-DD), bez tej daty')
+    p.add_argument('--trainer', type=int, help='tylko sesje tego trenera (ID)')
+    p.add_argument('--archived', action='store_true', help='dołącz dane z archiwum')
+    p.set_defaults(func=export_data)
+
+    p = sub.add_parser('refresh-feeds', help='wygeneruj nieaktualne kalendarze .ics klientów i trenerów')
+    p.add_argument('--dir', default='feeds', help='katalog z plikami .ics')
+    p.set_defaults(func=refresh_feeds)
+
+    p = sub.add_parser('bill', help='wystaw miesięczne faktury (przerwany przebieg wznawia się od miejsca przerwania)')
+    p.add_argument('--month', help='miesiąc RRRR-MM, domyślnie poprzedni')
+    p.add_argument('--chunk', type=int, default=BILLING_CHUNK, help='liczba klientów na transakcję')
+    p.set_defaults(func=bill)
+
+    p = sub.add_parser('add-credits', help='dopisz klientowi wejścia z karnetu')
+    p.add_argument('client', type=int, help='ID klienta')
+    p.add_argument('entries', type=int, nargs='?', default=PASS_ENTRIES, help='liczba wejść')
+    p.add_argument('--adjust', action='store_true', help='korekta (może być ujemna) zamiast zakupu karnetu')
+    p.set_defaults(func=add_credits)
+
+    p = sub.add_parser('sweep-holds', help='usuń wygasłe miejsca trzymane na czas płatności')
+    p.set_defaults(func=sweep_holds)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
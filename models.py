@@ -1,11 +1,43 @@
 from __future__ import annotations
+import logging
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
 from dataclasses import dataclass, field
 from datetime import datetime, date, timedelta
 from enum import Enum
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
 
+from db import SessionQuery
+from scheduling import IntervalIndex, session_bounds, format_ts, free_intervals, split_into_slots
 from utils import hash_password
 
+logger = logging.getLogger(__name__)
+
+# sesje starsze niż tyle dni trafiają do archiwum
+ARCHIVE_HORIZON_DAYS = 30
+
+# poniżej tylu haseł pula procesów kosztuje więcej niż samo hashowanie
+PARALLEL_HASH_MIN = 5000
+
+EMAIL_RE = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+
+# tylu klientów rozlicza jedna transakcja przebiegu rozliczeń
+BILLING_CHUNK = 5000
+
+# liczba wejść na standardowym karnecie
+PASS_ENTRIES = 10
+
+# na tyle minut trzymamy miejsce na czas płatności online
+HOLD_MINUTES = 10
+
+MONTH_RE = re.compile(r"^\d{4}-(0[1-9]|1[0-2])$")
+
+# godziny pracy trenerów (od, do) - jak w grafiku tygodniowym
+WORKING_HOURS = (6, 21)
+
 
 class SessionStatus(str, Enum):
     ACTIVE = "ACTIVE"
@@ -33,8 +65,8 @@ class User:
 
 @dataclass
 class Client(User):
-    def get_reservations(self, db):
-        return db.get_client_reservations_with_details(self.user_id)
+    def get_reservations(self, db, include_archived: bool = False):
+        return db.get_client_reservations_with_details(self.user_id, include_archived=include_archived)
 
     def create_reservation(self, session: Dict[str, Any], reservation_service: "ReservationService"):
         return reservation_service.create_reservation(self, session)
@@ -90,6 +122,60 @@ class UserService:
         self.db.add_user(first_name, last_name, email, password_hash, role="client")
         return True, "Konto utworzone"
 
+    @staticmethod
+    def _hash_passwords(passwords: List[str], workers: Optional[int] = None) -> List[str]:
+        if len(passwords) < PARALLEL_HASH_MIN:
+            return [hash_password(p) for p in passwords]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            return list(pool.map(hash_password, passwords, chunksize=1000))
+
+    def import_clients(self, entries: List[Dict[str, Any]], workers: Optional[int] = None):
+        """Masowa rejestracja klientów: (liczba dodanych, [(indeks wpisu, błąd)]).
+
+        Poprawne wiersze są dodawane, błędne tylko raportowane. Zajęte adresy
+        sprawdza jedno zapytanie, a zapis to jeden executemany w transakcji.
+        """
+        errors = []
+        valid = []
+        seen = set()
+        for i, e in enumerate(entries):
+            if not isinstance(e, dict):
+                errors.append((i, "Niepoprawny wiersz"))
+                continue
+            values = [e.get("first_name"), e.get("last_name"), e.get("email"), e.get("password")]
+            # JSON może mieć liczby zamiast tekstu - nie zgadujemy, co autor pliku miał na myśli
+            if any(v is not None and not isinstance(v, str) for v in values):
+                errors.append((i, "Pola muszą być tekstem"))
+                continue
+            first, last, email, password = (v.strip() if v is not None else "" for v in values)
+            first, last, email = first.title(), last.title(), email.lower()
+            if not all([first, last, email, password]):
+                errors.append((i, "Wypełnij wszystkie pola"))
+            elif not EMAIL_RE.match(email):
+                errors.append((i, "Niepoprawny email"))
+            elif email in seen:
+                errors.append((i, "Email powtórzony w pliku"))
+            else:
+                seen.add(email)
+                valid.append((i, first, last, email, password))
+
+        taken = self.db.find_existing_emails(seen) if seen else set()
+        rows = []
+        for i, first, last, email, password in valid:
+            if email in taken:
+                errors.append((i, "Email zajęty"))
+            else:
+                rows.append((first, last, email, password))
+
+        hashes = self._hash_passwords([r[3] for r in rows], workers)
+        count = self.db.add_users([
+            (first, last, email, password_hash, "client")
+            for (first, last, email, _), password_hash in zip(rows, hashes)
+        ]) if rows else 0
+
+        errors.sort()
+        return count, errors
+
     def login(self, email, password):
         existing = self.db.get_user(email)
         if not existing:
@@ -153,41 +239,124 @@ class ScheduleService:
             return 0
 
         capacity = row["capacity"] if isinstance(row, dict) else row[9]
-        reserved = self.db.count_active_reservations(session_id)
+        # rezerwacje + miejsca trzymane na czas płatności
+        reserved = self.db.count_active_reservations(session_id, held_at=format_ts(datetime.now()))
         return max(0, int(capacity) - int(reserved))
 
     def get_sessions_for_date(self, target_date: date):
-        rows = self.db.get_all_sessions()
-        sessions = []
-        for r in rows:
-            s = self._row_to_session_dict(r)
-            if s["date"] != target_date:
-                continue
-            sessions.append(s)
-        return sessions
+        query = SessionQuery().starting_between(target_date, target_date + timedelta(days=1))
+        return self.fetch_sessions(query)
 
     def get_week_sessions(self, monday: date):
+        # jedno zapytanie zakresowe po idx_sessions_status_start zamiast 7 przebiegów po wszystkich sesjach
         week = {day: {} for day in range(7)}
-        for i in range(7):
-            day_date = monday + timedelta(days=i)
-            sessions = self.get_sessions_for_date(day_date)
-            for s in sessions:
-                hour = s["hour"]
-                week[i].setdefault(hour, []).append(s)
+        query = SessionQuery().starting_between(monday, monday + timedelta(days=7))
+        for s in self.fetch_sessions(query):
+            week[(s["date"] - monday).days].setdefault(s["hour"], []).append(s)
         return week
 
-    def get_all_sessions(self) -> List[Dict[str, Any]]:
-        rows = self.db.get_all_sessions()
+    def get_overview(self, first_day: date, last_day: date) -> Dict[date, Dict[str, Any]]:
+        """Sumy dla każdego dnia zakresu (włącznie) i jego godzin: sesje, miejsca, zapisani, obłożenie.
+
+        Dni bez zajęć też są w wyniku (z zerami), więc widok miesiąca nie musi
+        niczego uzupełniać.
+        """
+        def totals():
+            return {"sessions": 0, "capacity": 0, "reserved": 0, "fill_rate": 0.0}
+
+        overview = {}
+        day = first_day
+        while day <= last_day:
+            overview[day] = dict(totals(), hours={})
+            day += timedelta(days=1)
+
+        for day_str, hour, sessions, capacity, reserved in self.db.get_schedule_overview(
+            first_day, last_day + timedelta(days=1)
+        ):
+            day_totals = overview[date.fromisoformat(day_str)]
+            hour_totals = day_totals["hours"].setdefault(hour, totals())
+            for t in (day_totals, hour_totals):
+                t["sessions"] += sessions
+                t["capacity"] += capacity
+                t["reserved"] += reserved
+
+        for day_totals in overview.values():
+            for t in [day_totals, *day_totals["hours"].values()]:
+                t["fill_rate"] = t["reserved"] / t["capacity"] if t["capacity"] else 0.0
+        return overview
+
+    def get_all_sessions(self, include_archived: bool = False) -> List[Dict[str, Any]]:
+        rows = self.db.get_all_sessions(include_archived=include_archived)
         out = []
         for r in rows:
             s = self._row_to_session_dict(r)
-            reserved = self.db.count_active_reservations(s["session_id"])
+            reserved = self.db.count_active_reservations(s["session_id"], include_archived=include_archived)
             s["reserved"] = reserved
             s["available"] = max(0, s["capacity"] - reserved)
             out.append(s)
         out.sort(key=lambda x: x["start_time"])
         return out
 
+    def session_query(self) -> SessionQuery:
+        return SessionQuery()
+
+    def fetch_sessions(self, query: SessionQuery) -> List[Dict[str, Any]]:
+        out = []
+        for r in self.db.query_sessions(query):
+            s = self._row_to_session_dict(r[:11])
+            s["reserved"] = r[11]
+            s["available"] = max(0, s["capacity"] - r[11])
+            out.append(s)
+        return out
+
+    def find_sessions(
+        self,
+        session_type: str = None,
+        difficulty_level: str = None,
+        min_price: float = None,
+        max_price: float = None,
+        trainer_id: int = None,
+        start_from: str = None,
+        start_to: str = None,
+        hour_from: int = None,
+        hour_to: int = None,
+        min_free: int = None,
+        after: tuple = None,
+        limit: int = None,
+        offset: int = None,
+    ) -> List[Dict[str, Any]]:
+        q = self.session_query()
+        if session_type:
+            q.of_type(session_type)
+        if difficulty_level:
+            q.difficulty(difficulty_level)
+        q.price_between(min_price, max_price)
+        if trainer_id is not None:
+            q.trainer(trainer_id)
+        q.starting_between(start_from, start_to)
+        q.hours_between(hour_from, hour_to)
+        if min_free is not None:
+            q.with_free_places(min_free)
+        if after is not None:
+            q.after(*after)
+        if limit is not None:
+            q.limit(limit)
+        if offset is not None:
+            q.offset(offset)
+        return self.fetch_sessions(q)
+
+    def search_sessions(self, text: str, limit: int = 50) -> List[Dict[str, Any]]:
+        # wyniki w kolejności trafności (bm25), nie po dacie
+        rows = self.db.search_sessions(text, limit=limit)
+        out = []
+        for r in rows:
+            s = self._row_to_session_dict(r)
+            reserved = self.db.count_active_reservations(s["session_id"])
+            s["reserved"] = reserved
+            s["available"] = max(0, s["capacity"] - reserved)
+            out.append(s)
+        return out
+
     # trener
     def get_sessions_for_trainer(self, trainer_id: int) -> List[Dict[str, Any]]:
         rows = self.db.get_sessions_for_trainer(trainer_id)
@@ -202,6 +371,18 @@ class ScheduleService:
         return out
 
     # manager
+    @staticmethod
+    def _validate_session_fields(session_type, start_time, duration_min, capacity) -> Optional[str]:
+        if not session_type or session_type not in ("group", "pt"):
+            return "Niepoprawny typ sesji"
+        if int(capacity) <= 0 or int(duration_min) <= 0:
+            return "Pojemność i czas trwania muszą być > 0"
+        try:
+            datetime.fromisoformat(start_time)
+        except Exception:
+            return "Niepoprawny format daty (użyj YYYY-MM-DD HH:MM:SS)"
+        return None
+
     def add_session(
         self,
         session_type: str,
@@ -214,18 +395,17 @@ class ScheduleService:
         difficulty_level: str = None,
         price: float = None
     ):
-        if not session_type or session_type not in ("group", "pt"):
-            return False, "Niepoprawny typ sesji"
-        if int(capacity) <= 0 or int(duration_min) <= 0:
-            return False, "Pojemność i czas trwania muszą być > 0"
-        try:
-            datetime.fromisoformat(start_time)
-        except Exception:
-            return False, "Niepoprawny format daty (użyj YYYY-MM-DD HH:MM:SS)"
+        error = self._validate_session_fields(session_type, start_time, duration_min, capacity)
+        if error:
+            return False, error
 
         if name and self.db.session_exists(name, start_time):
             return False, "Taka sesja już istnieje"
 
+        start, end = session_bounds(start_time, duration_min)
+        if self.db.find_trainer_conflicts(trainer_id, format_ts(start), format_ts(end)):
+            return False, "Trener ma w tym czasie inne zajęcia"
+
         self.db.add_session(
             session_type=session_type,
             name=name,
@@ -258,16 +438,388 @@ class ScheduleService:
             except Exception:
                 return False, "Niepoprawny format daty (użyj YYYY-MM-DD HH:MM:SS)"
 
-        ok = self.db.update_session(session_id, **filtered)
+        if "start_time" in filtered or "duration_min" in filtered:
+            row = self.db.get_session_by_id(session_id)
+            if not row:
+                return False, "Nie znaleziono sesji"
+            current = self._row_to_session_dict(row)
+            start, end = session_bounds(
+                filtered.get("start_time", current["start_time"]),
+                filtered.get("duration_min", current["duration_min"]),
+            )
+            if self.db.find_trainer_conflicts(
+                current["trainer_id"], format_ts(start), format_ts(end), exclude_session_id=session_id
+            ):
+                return False, "Trener ma w tym czasie inne zajęcia"
+
+        ok = self.db.update_session(session_id, notify=True, **filtered)
         return (True, "Zaktualizowano sesję") if ok else (False, "Nie udało się zaktualizować")
 
+    def validate_schedule(self, entries: List[Dict[str, Any]]) -> List[Tuple[int, str]]:
+        """Sprawdza cały importowany grafik: (indeks wpisu, błąd) dla każdego problemu.
+
+        Na trenera jest jedno zapytanie o istniejące sesje w zakresie importu,
+        a kolizje (z bazą i między wpisami) wyszukuje IntervalIndex.
+        """
+        errors = []
+        by_trainer: Dict[int, List[Tuple[int, datetime, datetime]]] = {}
+
+        for i, e in enumerate(entries):
+            try:
+                error = self._validate_session_fields(
+                    e.get("session_type"), e.get("start_time"), e.get("duration_min"), e.get("capacity")
+                )
+                trainer_id = int(e.get("trainer_id"))
+            except (TypeError, ValueError):
+                error = "Brak wymaganych pól sesji"
+            if not error and e.get("price") is not None:
+                try:
+                    float(e["price"])
+                except (TypeError, ValueError):
+                    error = "Niepoprawna cena"
+            if error:
+                errors.append((i, error))
+                continue
+            start, end = session_bounds(e["start_time"], e["duration_min"])
+            by_trainer.setdefault(trainer_id, []).append((i, start, end))
+
+        for trainer_id, items in by_trainer.items():
+            span_start = min(start for _, start, _ in items)
+            span_end = max(end for _, _, end in items)
+            existing = IntervalIndex(
+                session_bounds(start_time, duration) + (session_id,)
+                for session_id, start_time, duration in self.db.get_trainer_intervals(
+                    trainer_id, format_ts(span_start), format_ts(span_end)
+                )
+            )
+            imported = IntervalIndex()
+            for i, start, end in sorted(items, key=lambda it: it[1]):
+                if existing.overlapping(start, end):
+                    errors.append((i, "Trener ma w tym czasie inne zajęcia"))
+                elif imported.overlapping(start, end):
+                    errors.append((i, "Kolizja z innym wpisem importu"))
+                else:
+                    imported.add(start, end, i)
+
+        errors.sort()
+        return errors
+
+    def import_sessions(self, entries: List[Dict[str, Any]]):
+        errors = self.validate_schedule(entries)
+        if errors:
+            return False, errors
+
+        count = self.db.add_sessions([
+            (
+                e["session_type"],
+                e.get("name"),
+                e.get("description"),
+                e.get("difficulty_level"),
+                float(e["price"]) if e.get("price") is not None else None,
+                int(e["trainer_id"]),
+                e["start_time"],
+                int(e["duration_min"]),
+                int(e["capacity"]),
+                SessionStatus.ACTIVE.value,
+            )
+            for e in entries
+        ])
+        return True, f"Zaimportowano sesje: {count}"
+
+    def find_pt_slots(
+        self,
+        first_day: date,
+        last_day: date,
+        trainer_id: Optional[int] = None,
+        slot_min: int = 60,
+        step_min: int = 30,
+        working_hours=WORKING_HOURS,
+        now: Optional[datetime] = None,
+    ) -> List[Dict[str, Any]]:
+        """Wolne terminy treningu personalnego od first_day do last_day włącznie.
+
+        working_hours to (od, do) dla wszystkich albo słownik {trainer_id: (od, do)}.
+        Zajętość wszystkich trenerów pobiera jedno zapytanie; wolne okna dnia
+        liczone są tylko z sesji wyciągniętych z IntervalIndex trenera.
+        """
+        now = now or datetime.now()
+        range_start = datetime.combine(first_day, datetime.min.time())
+        range_end = datetime.combine(last_day + timedelta(days=1), datetime.min.time())
+
+        if trainer_id is not None:
+            trainer_ids = [int(trainer_id)]
+        else:
+            trainer_ids = [t[0] for t in self.db.get_users_by_role("trainer")]
+
+        # jeden indeks na trenera - dla każdego dnia bierzemy z niego tylko sesje z okna pracy
+        busy: Dict[int, IntervalIndex] = {t: IntervalIndex() for t in trainer_ids}
+        for t_id, start_time, duration in self.db.get_busy_intervals(
+            format_ts(range_start), format_ts(range_end), trainer_id
+        ):
+            if t_id in busy:
+                busy[t_id].add(*session_bounds(start_time, duration))
+
+        slots = []
+        for t_id in trainer_ids:
+            hours = working_hours.get(t_id, WORKING_HOURS) if isinstance(working_hours, dict) else working_hours
+            index = busy[t_id]
+            day = first_day
+            while day <= last_day:
+                day_start = datetime.combine(day, datetime.min.time())
+                window_start = max(day_start + timedelta(hours=hours[0]), now)
+                window_end = day_start + timedelta(hours=hours[1])
+                day_busy = index.spans(window_start, window_end)
+                for gap_start, gap_end in free_intervals(day_busy, window_start, window_end):
+                    for start, end in split_into_slots(gap_start, gap_end, slot_min, step_min):
+                        slots.append({
+                            "trainer_id": t_id,
+                            "start_time": format_ts(start),
+                            "end_time": format_ts(end),
+                            "date": start.date(),
+                            "hour": start.hour,
+                        })
+                day += timedelta(days=1)
+
+        slots.sort(key=lambda x: (x["start_time"], x["trainer_id"]))
+        return slots
+
     def remove_session(self, session_id: int):
         self.db.cancel_session(session_id)
         return True, "Sesja anulowana"
 
+    def remove_sessions(self, session_ids):
+        ids = [int(i) for i in session_ids]
+        if not ids:
+            return False, "Nie wybrano sesji"
+        sessions, reservations = self.db.cancel_sessions(ids)
+        return True, f"Anulowano sesje: {sessions}, rezerwacje: {reservations}"
+
+    def cancel_trainer_day(self, trainer_id: int, day: date):
+        start = datetime.combine(day, datetime.min.time())
+        sessions, reservations = self.db.cancel_trainer_sessions_between(
+            trainer_id,
+            start.isoformat(sep=" "),
+            (start + timedelta(days=1)).isoformat(sep=" "),
+        )
+        return True, f"Anulowano sesje: {sessions}, rezerwacje: {reservations}"
+
+    def close_gym(self, first_day: date, last_day: date):
+        # zamknięcie klubu - wszystkie sesje od first_day do last_day włącznie
+        if last_day < first_day:
+            return False, "Niepoprawny zakres dat"
+        start = datetime.combine(first_day, datetime.min.time())
+        end = datetime.combine(last_day + timedelta(days=1), datetime.min.time())
+        sessions, reservations = self.db.cancel_sessions_between(start.isoformat(sep=" "), end.isoformat(sep=" "))
+        return True, f"Anulowano sesje: {sessions}, rezerwacje: {reservations}"
+
+    def archive_past_sessions(self, horizon_days: int = ARCHIVE_HORIZON_DAYS, now: Optional[datetime] = None):
+        if int(horizon_days) < 0:
+            return False, "Horyzont archiwizacji musi być >= 0"
+
+        now = now or datetime.now()
+        cutoff = (now - timedelta(days=int(horizon_days))).isoformat(sep=" ", timespec="seconds")
+        sessions, reservations = self.db.archive_sessions_before(cutoff)
+        # dziennik zmian dla kiosku rośnie z każdą rezerwacją - kiosk potrzebuje najwyżej wczorajszego
+        yesterday = datetime.combine(now.date() - timedelta(days=1), datetime.min.time())
+        self.db.prune_reservation_changes(min(cutoff, yesterday.isoformat(sep=" ")))
+        return True, f"Zarchiwizowano sesje: {sessions}, rezerwacje: {reservations}"
+
+
+class WeekLoader:
+    """Tygodnie grafiku z małym LRU i wczytywaniem sąsiednich tygodni w tle.
+
+    get() zwraca tydzień z cache, czeka na trwające pobieranie w tle albo
+    czyta go od razu; prefetch() zleca wczytanie tygodni jednemu wątkowi
+    roboczemu. Wątek dotyka tylko bazy - nigdy widgetów Tk.
+
+    Wpis jest ważny ttl sekund (zmiany z innych stanowisk), a po zmianie
+    z tego widoku invalidate() usuwa tydzień od razu - także wtedy, gdy
+    jego wczytywanie w tle jeszcze trwa.
+    """
+
+    def __init__(self, schedule_service: "ScheduleService", size: int = 5, ttl: float = 30.0):
+        self.schedule_service = schedule_service
+        self.size = size
+        self.ttl = ttl
+        self._weeks: "OrderedDict[date, Tuple[float, Dict]]" = OrderedDict()
+        self._pending: Dict[date, Future] = {}
+        # numer unieważnienia tygodnia - wynik wczytany przed invalidate() nie trafia do cache
+        self._generations: Dict[date, int] = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="week-prefetch")
+
+    @staticmethod
+    def monday_of(day: date) -> date:
+        return day - timedelta(days=day.weekday())
+
+    def _load(self, monday: date, generation: int) -> Dict:
+        loaded_at = time.monotonic()
+        try:
+            week = self.schedule_service.get_week_sessions(monday)
+        finally:
+            with self._lock:
+                if self._generations.get(monday, 0) == generation:
+                    self._pending.pop(monday, None)
+        with self._lock:
+            if self._generations.get(monday, 0) == generation:
+                self._weeks[monday] = (loaded_at, week)
+                self._weeks.move_to_end(monday)
+                while len(self._weeks) > self.size:
+                    self._weeks.popitem(last=False)
+        return week
+
+    def _fresh(self, monday: date) -> Optional[Dict]:
+        entry = self._weeks.get(monday)
+        if entry is None:
+            return None
+        loaded_at, week = entry
+        if time.monotonic() - loaded_at > self.ttl:
+            del self._weeks[monday]
+            return None
+        self._weeks.move_to_end(monday)
+        return week
+
+    def get(self, monday: date) -> Dict:
+        with self._lock:
+            week = self._fresh(monday)
+            if week is not None:
+                return week
+            pending = self._pending.get(monday)
+            generation = self._generations.get(monday, 0)
+        if pending is not None:
+            return pending.result()
+        return self._load(monday, generation)
+
+    def prefetch(self, *mondays: date):
+        with self._lock:
+            for monday in mondays:
+                if self._fresh(monday) is None and monday not in self._pending:
+                    generation = self._generations.get(monday, 0)
+                    self._pending[monday] = self._pool.submit(self._load, monday, generation)
+
+    def invalidate(self, *days: date):
+        """Usuwa tygodnie zawierające podane dni (np. po zapisie albo wypisaniu)."""
+        with self._lock:
+            for monday in {self.monday_of(d) for d in days}:
+                self._weeks.pop(monday, None)
+                self._pending.pop(monday, None)
+                self._generations[monday] = self._generations.get(monday, 0) + 1
+
+    def close(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+class ReportService:
+    """Raporty czytane z tabel agregatów (rollup_*), bez skanowania rezerwacji."""
+
+    def __init__(self, db):
+        self.db = db
+
+    @staticmethod
+    def _to_dicts(rows, key_names):
+        return [
+            dict(zip(key_names + ("bookings", "cancellations", "revenue"), row))
+            for row in rows
+        ]
+
+    def sessions_by_day(self, first_day: date, last_day: date) -> List[Dict[str, Any]]:
+        return self._to_dicts(self.db.get_session_day_rollup(first_day, last_day), ("day", "session_id"))
+
+    def daily_totals(self, first_day: date, last_day: date) -> Dict[str, Dict[str, Any]]:
+        totals: Dict[str, Dict[str, Any]] = {}
+        for row in self.sessions_by_day(first_day, last_day):
+            t = totals.setdefault(row["day"], {"sessions": 0, "bookings": 0, "cancellations": 0, "revenue": 0.0})
+            t["sessions"] += 1
+            t["bookings"] += row["bookings"]
+            t["cancellations"] += row["cancellations"]
+            t["revenue"] += row["revenue"]
+        return totals
+
+    def trainer_week(self, week_start: date, trainer_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        week_start = week_start - timedelta(days=week_start.weekday())
+        return self._to_dicts(self.db.get_trainer_week_rollup(week_start, trainer_id), ("trainer_id", "week_start"))
+
+    def client_month(self, month: str, client_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        return self._to_dicts(self.db.get_client_month_rollup(month, client_id), ("client_id", "month"))
+
+    def rebuild(self):
+        self.db.rebuild_rollups()
+        return True, "Przeliczono agregaty"
+
+
+class BillingService:
+    """Miesięczne faktury z aktywnych rezerwacji płatnych zajęć.
+
+    Przebieg idzie paczkami klientów po id; każda paczka to jedno zapytanie
+    INSERT ... SELECT z grupowaniem w bazie, zapisane razem z kursorem
+    przebiegu - przerwany run() wystarczy uruchomić ponownie.
+    """
+
+    def __init__(self, db):
+        self.db = db
+
+    @staticmethod
+    def previous_month(today: Optional[date] = None) -> str:
+        first = (today or date.today()).replace(day=1)
+        return (first - timedelta(days=1)).strftime("%Y-%m")
+
+    def run(self, month: Optional[str] = None, chunk_size: int = BILLING_CHUNK, now: Optional[datetime] = None):
+        month = month or self.previous_month()
+        if not MONTH_RE.match(month):
+            return False, "Miesiąc w formacie RRRR-MM"
+        if int(chunk_size) <= 0:
+            return False, "Rozmiar paczki musi być > 0"
+
+        now = now or datetime.now()
+        status, last_client_id, invoices = self.db.start_billing_run(month, format_ts(now))
+        if status == "DONE":
+            return True, f"Rozliczenie za {month} już zakończone (faktury: {invoices})"
+
+        created_at = format_ts(now)
+        while True:
+            last_client_id, billed = self.db.bill_clients_after(month, last_client_id, chunk_size, created_at)
+            if last_client_id is None:
+                break
+            invoices += billed
+        self.db.finish_billing_run(month, format_ts(datetime.now()))
+        return True, f"Wystawiono faktury za {month}: {invoices}"
+
+    def get_invoices(self, month: str, client_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        keys = ("id", "client_id", "month", "items", "pt_items", "amount", "created_at")
+        return [dict(zip(keys, row)) for row in self.db.get_invoices(month, client_id)]
+
+
+class CreditService:
+    """Karnety wejściowe: zakup, korekty i saldo klienta (czytane z credit_accounts)."""
+
+    def __init__(self, db):
+        self.db = db
+
+    def get_balance(self, client_id: int) -> int:
+        return self.db.get_credit_balance(client_id)
+
+    def buy_pass(self, client_id: int, entries: int = PASS_ENTRIES):
+        if int(entries) <= 0:
+            return False, "Liczba wejść musi być > 0"
+        balance = self.db.add_credits(client_id, int(entries), format_ts(datetime.now()))
+        return True, f"Dodano wejścia: {int(entries)}, saldo: {balance}"
+
+    def adjust(self, client_id: int, delta: int):
+        # ręczna korekta managera, np. zwrot za odwołany karnet
+        if int(delta) == 0:
+            return False, "Korekta musi być różna od zera"
+        balance = self.db.add_credits(client_id, int(delta), format_ts(datetime.now()), reason="ADJUST")
+        if balance is None:
+            return False, "Za mało wejść na karnecie"
+        return True, f"Saldo: {balance}"
+
+    def get_history(self, client_id: int, limit: int = 50) -> List[Dict[str, Any]]:
+        keys = ("id", "delta", "reason", "reservation_id", "created_at")
+        return [dict(zip(keys, row)) for row in self.db.get_credit_history(client_id, limit)]
+
 
 from datetime import datetime
-from typing import Any, Optional, Tuple
+from typing import Any, List, Optional, Tuple
 
 
 class ReservationService:
@@ -343,12 +895,26 @@ class ReservationService:
         if self.db.client_has_reservation(client_id, session_id):
             return False, "Masz już rezerwację na te zajęcia"
 
-        # brak miejsc
-        reserved = self.db.count_active_reservations(session_id)
+        # brak miejsc - trzymane przez innych też się liczą, własne klient właśnie wykorzystuje
+        created_at = datetime.now().isoformat(sep=" ", timespec="seconds")
+        reserved = self.db.count_active_reservations(session_id, held_at=created_at, except_client_id=client_id)
         if reserved >= capacity:
             return False, "Brak wolnych miejsc"
 
-        created_at = datetime.now().isoformat(sep=" ", timespec="seconds")
+        # inne zajęcia w tym samym czasie
+        if self.db.find_client_conflicts(client_id, session_id):
+            return False, "Masz w tym czasie inne zajęcia"
+
+        # z wejściami na karnecie płatne zajęcia zdejmują jedno wejście; gdy w międzyczasie
+        # karnet się wyczerpał, rezerwacja idzie zwykłą ścieżką (płatność za zajęcia)
+        if self.db.get_credit_balance(client_id) > 0:
+            booked = self.db.add_reservation_with_credit(client_id, session_id, created_at)
+            if booked is not None:
+                _reservation_id, balance = booked
+                if balance is not None:
+                    return True, f"Zapisano na zajęcia - wykorzystano wejście z karnetu (zostało: {balance})"
+                return True, "Zapisano na zajęcia"
+
         self.db.add_reservation(
             client_id=client_id,
             session_id=session_id,
@@ -357,6 +923,75 @@ class ReservationService:
         )
         return True, "Zapisano na zajęcia"
 
+    def create_reservations(self, client: Any, sessions: List[Any]):
+        """Zapis na serię zajęć - wszystkie albo żadne.
+
+        Zwraca (True, komunikat) albo (False, [(session_id, błąd), ...]).
+        Sesje i istniejące rezerwacje klienta w zakresie serii pobierane są
+        dwoma zapytaniami, niezależnie od długości serii.
+        """
+        client_id = self._extract_client_id(client)
+        session_ids = []
+        for session in sessions:
+            sid = session if isinstance(session, int) else self._extract_session_fields(session)[0]
+            if sid is None:
+                return False, [(None, "Błędne dane sesji")]
+            session_ids.append(sid)
+
+        if client_id is None or not session_ids:
+            return False, [(None, "Błędne dane sesji")]
+
+        created_at = datetime.now().isoformat(sep=" ", timespec="seconds")
+        # trzymane przez innych miejsca też są zajęte
+        rows = {
+            r[0]: r
+            for r in self.db.get_sessions_by_ids(session_ids, held_at=created_at, except_client_id=client_id)
+        }
+        errors = []
+        planned = []
+        for sid in dict.fromkeys(session_ids):
+            row = rows.get(sid)
+            if row is None or row[10] != SessionStatus.ACTIVE.value:
+                errors.append((sid, "Nie znaleziono sesji"))
+                continue
+            if row[11] >= row[9]:
+                errors.append((sid, "Brak wolnych miejsc"))
+                continue
+            start, end = session_bounds(row[7], row[8])
+            planned.append((sid, start, end))
+
+        if planned:
+            span_start = min(p[1] for p in planned)
+            span_end = max(p[2] for p in planned)
+            booked = IntervalIndex(
+                (datetime.fromisoformat(starts_at), datetime.fromisoformat(ends_at), sid)
+                for sid, starts_at, ends_at in self.db.get_client_intervals(
+                    client_id, format_ts(span_start), format_ts(span_end)
+                )
+            )
+            series = IntervalIndex()
+            for sid, start, end in sorted(planned, key=lambda p: p[1]):
+                clash = booked.overlapping(start, end)
+                if sid in clash:
+                    errors.append((sid, "Masz już rezerwację na te zajęcia"))
+                elif clash:
+                    errors.append((sid, "Masz w tym czasie inne zajęcia"))
+                elif series.overlapping(start, end):
+                    errors.append((sid, "Zajęcia w serii nakładają się"))
+                else:
+                    series.add(start, end, sid)
+
+        if errors:
+            return False, errors
+
+        # wejścia z karnetu idą na najwcześniejsze zajęcia serii
+        count, used, balance = self.db.add_reservations(
+            client_id, [p[0] for p in sorted(planned, key=lambda p: p[1])], created_at
+        )
+        if used:
+            return True, f"Zapisano na zajęcia: {count} - wykorzystano wejść z karnetu: {used} (zostało: {balance})"
+        return True, f"Zapisano na zajęcia: {count}"
+
     def cancel_reservation(self, client: Any, session: Any) -> Tuple[bool, str]:
         client_id = self._extract_client_id(client)
         session_id, _capacity = self._extract_session_fields(session)
@@ -369,7 +1004,7 @@ class ReservationService:
             return False, "Nie masz rezerwacji na te zajęcia"
 
         reservation_id = res[0]
-        self.db.update_reservation_status(reservation_id, "CANCELLED")
+        self.db.cancel_reservation(reservation_id)
         return True, "Rezerwacja anulowana"
 
     def cancel_reservation_by_id(self, reservation_id: Any) -> Tuple[bool, str]:
@@ -382,9 +1017,100 @@ class ReservationService:
         if not r:
             return False, "Nie znaleziono rezerwacji"
 
-        self.db.update_reservation_status(reservation_id, "CANCELLED")
+        self.db.cancel_reservation(reservation_id)
         return True, "Rezerwacja anulowana"
 
+    def hold_seat(self, client: Any, session: Any, minutes: int = HOLD_MINUTES,
+                  now: Optional[datetime] = None) -> Tuple[bool, str]:
+        """Trzyma miejsce na czas płatności; potwierdzenie przez confirm_hold() przed wygaśnięciem."""
+        client_id = self._extract_client_id(client)
+        session_id, _capacity = self._extract_session_fields(session)
+
+        if client_id is None or session_id is None:
+            return False, "Błędne dane sesji"
+
+        if self.db.client_has_reservation(client_id, session_id):
+            return False, "Masz już rezerwację na te zajęcia"
+
+        if self.db.find_client_conflicts(client_id, session_id):
+            return False, "Masz w tym czasie inne zajęcia"
+
+        now = now or datetime.now()
+        expires = now + timedelta(minutes=int(minutes))
+        if self.db.place_hold(client_id, session_id, format_ts(now), format_ts(expires)) is None:
+            return False, "Brak wolnych miejsc"
+        return True, f"Miejsce czeka na płatność do {expires:%H:%M}"
+
+    def confirm_hold(self, client: Any, session: Any, now: Optional[datetime] = None) -> Tuple[bool, str]:
+        client_id = self._extract_client_id(client)
+        session_id, _capacity = self._extract_session_fields(session)
+
+        if client_id is None or session_id is None:
+            return False, "Błędne dane sesji"
+
+        now = now or datetime.now()
+        created_at = format_ts(datetime.now())
+        booked = self.db.confirm_hold(client_id, session_id, format_ts(now), created_at)
+        if booked is None:
+            return False, "Czas na płatność minął - zarezerwuj miejsce ponownie"
+        reservation_id, balance = booked
+        if reservation_id is None:
+            return False, "Masz w tym czasie inne zajęcia"
+        if balance is not None:
+            return True, f"Zapisano na zajęcia - wykorzystano wejście z karnetu (zostało: {balance})"
+        return True, "Zapisano na zajęcia"
+
+    def release_hold(self, client: Any, session: Any) -> Tuple[bool, str]:
+        client_id = self._extract_client_id(client)
+        session_id, _capacity = self._extract_session_fields(session)
+
+        if client_id is None or session_id is None:
+            return False, "Błędne dane sesji"
+
+        if not self.db.release_hold(client_id, session_id):
+            return False, "Nie masz trzymanego miejsca"
+        return True, "Miejsce zwolnione"
+
+    def join_waitlist(self, client: Any, session: Any) -> Tuple[bool, str]:
+        client_id = self._extract_client_id(client)
+        session_id, capacity = self._extract_session_fields(session)
+
+        if client_id is None or session_id is None or capacity is None:
+            return False, "Błędne dane sesji"
+
+        if self.db.client_has_reservation(client_id, session_id):
+            return False, "Masz już rezerwację na te zajęcia"
+
+        created_at = datetime.now().isoformat(sep=" ", timespec="seconds")
+        if self.db.count_active_reservations(session_id, held_at=created_at) < capacity:
+            return False, "Są wolne miejsca - zapisz się na zajęcia"
+        if self.db.add_to_waitlist(client_id, session_id, created_at) is None:
+            return False, "Jesteś już na liście oczekujących"
+
+        position = self.db.get_waitlist_position(client_id, session_id)
+        return True, f"Dodano do listy oczekujących (pozycja {position})"
+
+    def leave_waitlist(self, client: Any, session: Any) -> Tuple[bool, str]:
+        client_id = self._extract_client_id(client)
+        session_id, _capacity = self._extract_session_fields(session)
+
+        if client_id is None or session_id is None:
+            return False, "Błędne dane sesji"
+
+        if not self.db.leave_waitlist(client_id, session_id):
+            return False, "Nie jesteś na liście oczekujących"
+        return True, "Usunięto z listy oczekujących"
+
+    def get_waitlist_position(self, client: Any, session_id: Any) -> Optional[int]:
+        client_id = self._extract_client_id(client)
+        try:
+            session_id = int(session_id)
+        except Exception:
+            return None
+        if client_id is None:
+            return None
+        return self.db.get_waitlist_position(client_id, session_id)
+
     def get_participants(self, session_id: Any):
         try:
             session_id = int(session_id)
@@ -393,5 +1119,76 @@ class ReservationService:
         return self.db.get_session_participants(session_id)
 
 
+class ParticipantsCache:
+    """Uczestnicy wszystkich sesji trenera trzymani w pamięci widoku.
+
+    Całość ładuje jedno zapytanie; przy każdym odczycie sprawdzany jest tylko
+    licznik zmian rezerwacji trenera (odczyt po kluczu głównym) i dopiero gdy
+    się zmienił, dane są pobierane ponownie.
+    """
+
+    def __init__(self, db, trainer_id: int):
+        self.db = db
+        self.trainer_id = trainer_id
+        self._version = None
+        self._participants: Dict[int, List[tuple]] = {}
 
+    def invalidate(self):
+        self._version = None
 
+    def get(self, session_id: Any) -> List[tuple]:
+        try:
+            session_id = int(session_id)
+        except (TypeError, ValueError):
+            return []
+        if self._version is None or self.db.get_participants_version(self.trainer_id) != self._version:
+            self._version, self._participants = self.db.get_trainer_participants(self.trainer_id)
+        return self._participants.get(session_id, [])
+
+
+class HoldSweeper:
+    """Usuwa wygasłe trzymane miejsca w tle.
+
+    Wygasłe miejsca i tak nie liczą się do pojemności (zapytania porównują
+    expires_at z bieżącym czasem) - sweeper tylko utrzymuje tabelę małą,
+    kasując paczki po indeksie na expires_at.
+    """
+
+    def __init__(self, db, interval: float = 60.0, batch_size: int = 1000):
+        self.db = db
+        self.interval = interval
+        self.batch_size = batch_size
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def sweep_once(self, now: Optional[datetime] = None) -> int:
+        now = format_ts(now or datetime.now())
+        removed = 0
+        while True:
+            count = self.db.sweep_expired_holds(now, self.batch_size)
+            removed += count
+            if count < self.batch_size:
+                return removed
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="hold-sweeper", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.sweep_once()
+            except Exception:
+                # np. baza chwilowo zablokowana - następna próba za interval
+                logger.exception("Sprzątanie trzymanych miejsc nie powiodło się")
+            self._stop.wait(self.interval)
@@ -1,10 +1,14 @@
 import ttkbootstrap as ttk
 from ttkbootstrap.constants import *
 
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, date, timedelta
 
 from db import Database
-from models import UserService, ReservationService, ScheduleService
+from checkin import CheckInService
+from diagnostics import UiDiagnostics, MemoryMonitor
+from models import UserService, ReservationService, ScheduleService, ParticipantsCache, WeekLoader, HoldSweeper
+from notifications import NotificationDispatcher, FileSink
 
 
 class App(ttk.Window):
@@ -13,6 +17,13 @@ class App(ttk.Window):
         self.title('MyGym')
         self.resizable(False, False)
 
+        # opcjonalnie (MYGYM_DIAG): opóźnienia pętli Tk i czasy konstruktorów/handlerów widoków
+        self.diagnostics = UiDiagnostics.from_env(self, [
+            cls for cls in globals().values() if isinstance(cls, type) and issubclass(cls, ttk.Frame)
+        ])
+        # opcjonalnie (MYGYM_MEMWATCH): okresowy raport przyrostu pamięci i widgetów
+        self.memory_monitor = MemoryMonitor.from_env(self)
+
         self.container = ttk.Frame(self)
         self.container.pack(fill='both', expand=True, padx=30, pady=30)
 
@@ -22,6 +33,12 @@ class App(ttk.Window):
         self.user_service = UserService(self.db)
         self.current_user = None
 
+        self.notifier = NotificationDispatcher(self.db, [FileSink('notifications.log')])
+        self.notifier.start()
+        self.hold_sweeper = HoldSweeper(self.db)
+        self.hold_sweeper.start()
+        self.protocol('WM_DELETE_WINDOW', self.on_close)
+
         self.frames = {}
         for F in (LoginForm, RegisterForm, ClientHome, TrainerHome, ManagerHome):
             frame = F(self.container, self, self.user_service)
@@ -36,6 +53,15 @@ class App(ttk.Window):
         if hasattr(frame, 'on_show'):
             frame.on_show()
 
+    def on_close(self):
+        self.notifier.stop()
+        self.hold_sweeper.stop()
+        if self.diagnostics:
+            self.diagnostics.stop()
+        if self.memory_monitor:
+            self.memory_monitor.stop()
+        self.destroy()
+
 
 
 
@@ -216,12 +242,19 @@ class MyReservationsView(ttk.Frame):
     def __init__(self, parent, controller, user_service):
         super().__init__(parent)
 
-        user = controller.current_user
-        db = user_service.db
+        self.user = controller.current_user
+        self.db = user_service.db
 
         ttk.Label(self, text='Moje rezerwacje',
                   font=('Helvetica', 12, 'bold')).pack(pady=10)
 
+        self.credits = ttk.Label(self, text='')
+        self.credits.pack(anchor='w')
+
+        self.show_archived = ttk.BooleanVar(value=False)
+        ttk.Checkbutton(self, text='Pokaż archiwum', variable=self.show_archived,
+                        command=self._reload).pack(anchor='w', pady=5)
+
         cols = ('date', 'type', 'name', 'trainer', 'status')
         self.tree = ttk.Treeview(self, columns=cols, show='headings')
         self.tree.pack(fill='both', expand=True)
@@ -229,9 +262,17 @@ class MyReservationsView(ttk.Frame):
         for c in cols:
             self.tree.heading(c, text=c.capitalize())
 
-        for r in user.get_reservations(db):
+        self._reload()
+
+    def _reload(self):
+        for i in self.tree.get_children():
+            self.tree.delete(i)
+
+        self.credits.config(text=f'Wejścia na karnecie: {self.db.get_credit_balance(self.user.user_id)}')
+
+        for r in self.user.get_reservations(self.db, include_archived=self.show_archived.get()):
             dt = datetime.fromisoformat(r[3]).strftime('%d.%m.%Y %H:%M')
-            trainer = db.get_user_by_id(r[7])
+            trainer = self.db.get_user_by_id(r[7])
             trainer_name = f'{trainer[1]} {trainer[2]}' if trainer else '—'
             self.tree.insert('', 'end', values=(dt, r[4], r[5], trainer_name, r[2]))
 
@@ -246,25 +287,98 @@ class WeeklyScheduleView(ttk.Frame):
 
         today = date.today()
         self.monday = today - timedelta(days=today.weekday())
+        self.week_loader = WeekLoader(schedule_service)
 
         ttk.Label(self, text='Grafik tygodniowy',
                   font=('Helvetica', 12, 'bold')).pack(pady=10)
 
+        nav = ttk.Frame(self)
+        nav.pack(fill='x', pady=5)
+        ttk.Button(nav, text='◀ Poprzedni', command=lambda: self.change_week(-1)).pack(side='left')
+        ttk.Button(nav, text='Następny ▶', command=lambda: self.change_week(1)).pack(side='right')
+        ttk.Button(nav, text='Dziś', command=self.go_to_today).pack(side='right', padx=5)
+        self.week_label = ttk.Label(nav, font=('Helvetica', 10, 'bold'))
+        self.week_label.pack(side='left', expand=True)
+
+        search_bar = ttk.Frame(self)
+        search_bar.pack(fill='x', pady=5)
+        self.search_entry = ttk.Entry(search_bar)
+        self.search_entry.pack(side='left', fill='x', expand=True)
+        self.search_entry.bind('<Return>', lambda _e: self.search())
+        ttk.Button(search_bar, text='Szukaj', command=self.search).pack(side='left', padx=5)
+
+        cols = ('start', 'name', 'available')
+        self.results = ttk.Treeview(self, columns=cols, show='headings', height=5)
+        for c, h, w in [('start', 'Start', 150), ('name', 'Nazwa', 200), ('available', 'Wolne', 60)]:
+            self.results.heading(c, text=h)
+            self.results.column(c, width=w, anchor='center')
+        self.results.bind('<Double-1>', self._open_search_result)
+        self.search_results = {}
+
         self.grid_frame = ttk.Frame(self)
         self.grid_frame.pack(fill='both', expand=True)
 
+        # jeden komunikat na widok - aktualizowany, a nie dokładany przy każdej akcji
+        self.status = ttk.Label(self, text='')
+        self.status.pack(pady=5)
+
         self.draw_grid()
 
+    def _set_status(self, ok, msg):
+        self.status.config(text=msg, foreground='green' if ok else 'red')
+
+    def search(self):
+        for i in self.results.get_children():
+            self.results.delete(i)
+        self.search_results = {}
+
+        text = self.search_entry.get().strip()
+        if not text:
+            self.results.pack_forget()
+            return
+
+        for s in self.schedule_service.search_sessions(text):
+            iid = self.results.insert('', 'end', values=(s['start_time'], s['name'], s['available']))
+            self.search_results[iid] = s
+        self.results.pack(fill='x', pady=5, before=self.grid_frame)
+
+    def _open_search_result(self, _evt):
+        sel = self.results.selection()
+        if sel and sel[0] in self.search_results:
+            self.open_session_details(self.search_results[sel[0]])
 
 
+
+    def change_week(self, offset):
+        self.monday += timedelta(weeks=offset)
+        self.draw_grid()
+
+    def go_to_today(self):
+        today = date.today()
+        self.monday = today - timedelta(days=today.weekday())
+        self.draw_grid()
+
+    def destroy(self):
+        self.week_loader.close()
+        super().destroy()
+
     def draw_grid(self):
+        for w in self.grid_frame.winfo_children():
+            w.destroy()
+
+        sunday = self.monday + timedelta(days=6)
+        self.week_label.config(text=f"{self.monday:%d.%m} – {sunday:%d.%m.%Y}")
+
         days = ['Poniedziałek', 'Wtorek', 'Środa', 'Czwartek', 'Piątek', 'Sobota', 'Niedziela']
         ttk.Label(self.grid_frame, text='Godzina').grid(row=0, column=0)
 
         for i, d in enumerate(days):
-            ttk.Label(self.grid_frame, text=d).grid(row=0, column=i + 1)
+            day = self.monday + timedelta(days=i)
+            ttk.Label(self.grid_frame, text=f"{d} {day:%d.%m}").grid(row=0, column=i + 1)
 
-        week = self.schedule_service.get_week_sessions(self.monday)
+        week = self.week_loader.get(self.monday)
+        # sąsiednie tygodnie wczytują się w tle, zanim użytkownik kliknie strzałkę
+        self.week_loader.prefetch(self.monday - timedelta(weeks=1), self.monday + timedelta(weeks=1))
 
         for hour in range(6, 21):
             ttk.Label(self.grid_frame, text=f'{hour}:00').grid(row=hour - 5, column=0)
@@ -283,29 +397,44 @@ class WeeklyScheduleView(ttk.Frame):
         ok, msg = self.reservation_service.create_reservation(
             self.controller.current_user, session
         )
-        ttk.Label(self, text=msg,
-                  foreground='green' if ok else 'red').pack(pady=5)
+        self._set_status(ok, msg)
+        self._refresh_week(session)
 
     def unsubscribe(self, session):
         ok, msg = self.reservation_service.cancel_reservation(
             self.controller.current_user,
             session
         )
+        self._set_status(ok, msg)
+        self._refresh_week(session)
 
-        ttk.Label(self, text=msg, foreground='green' if ok else 'red').pack(pady=5)
+    def _refresh_week(self, session):
+        # liczba zapisanych w cache tygodnia jest już nieaktualna
+        self.week_loader.invalidate(session['date'])
+        self.draw_grid()
 
     def _signup_and_close(self, session, win):
-        self.reservation_service.create_reservation(
+        self.sign_up(session)
+        win.destroy()
+
+    def _unsubscribe_and_close(self, session, win):
+        self.unsubscribe(session)
+        win.destroy()
+
+    def _join_waitlist_and_close(self, session, win):
+        ok, msg = self.reservation_service.join_waitlist(
             self.controller.current_user,
             session
         )
+        self._set_status(ok, msg)
         win.destroy()
 
-    def _unsubscribe_and_close(self, session, win):
-        self.reservation_service.cancel_reservation(
+    def _leave_waitlist_and_close(self, session, win):
+        ok, msg = self.reservation_service.leave_waitlist(
             self.controller.current_user,
             session
         )
+        self._set_status(ok, msg)
         win.destroy()
 
     def open_session_details(self, session):
@@ -337,6 +466,10 @@ class WeeklyScheduleView(ttk.Frame):
             user, session['session_id']
         )
 
+        position = None
+        if not is_registered:
+            position = self.reservation_service.get_waitlist_position(user, session['session_id'])
+
         if is_registered:
             ttk.Button(
                 win,
@@ -344,6 +477,21 @@ class WeeklyScheduleView(ttk.Frame):
                 bootstyle=DANGER,
                 command=lambda: self._unsubscribe_and_close(session, win)
             ).pack(pady=10)
+        elif position is not None:
+            ttk.Label(win, text=f'Pozycja na liście oczekujących: {position}').pack()
+            ttk.Button(
+                win,
+                text='Opuść listę oczekujących',
+                bootstyle=WARNING,
+                command=lambda: self._leave_waitlist_and_close(session, win)
+            ).pack(pady=10)
+        elif available == 0:
+            ttk.Button(
+                win,
+                text='Zapisz na listę oczekujących',
+                bootstyle=INFO,
+                command=lambda: self._join_waitlist_and_close(session, win)
+            ).pack(pady=10)
         else:
             ttk.Button(
                 win,
@@ -467,11 +615,29 @@ class ManagerHome(HomeBaseFrame):
             command=lambda: self.show_content(ManagerSessionsView)
         ).grid(row=0, column=0, padx=5)
 
+        ttk.Button(
+            bar,
+            text="Statystyki",
+            command=lambda: self.show_content(OccupancyView)
+        ).grid(row=0, column=1, padx=5)
+
+        ttk.Button(
+            bar,
+            text="Kalendarz",
+            command=lambda: self.show_content(MonthOverviewView)
+        ).grid(row=0, column=2, padx=5)
+
+        ttk.Button(
+            bar,
+            text="Recepcja",
+            command=lambda: self.show_content(CheckInView)
+        ).grid(row=0, column=3, padx=5)
+
         ttk.Button(
             bar,
             text="Edytuj dane",
             command=lambda: self.show_content(EditProfileView)
-        ).grid(row=0, column=1, padx=5)
+        ).grid(row=0, column=4, padx=5)
 
     def on_show(self):
         self.show_content(ManagerSessionsView)
@@ -529,6 +695,7 @@ class TrainerSessionsView(ttk.Frame):
 
         trainer = self.controller.current_user
         sessions = self.schedule_service.get_sessions_for_trainer(trainer.user_id)
+        self.participants_cache = ParticipantsCache(self.schedule_service.db, trainer.user_id)
 
         for s in sessions:
             self.tree.insert(
@@ -556,7 +723,7 @@ class TrainerSessionsView(ttk.Frame):
         for i in self.participants.get_children():
             self.participants.delete(i)
 
-        rows = self.reservation_service.get_participants(session_id)
+        rows = self.participants_cache.get(session_id)
         for (_uid, first, last, email) in rows:
             self.participants.insert("", "end", values=(first, last, email))
 
@@ -587,6 +754,22 @@ class ManagerSessionsView(ttk.Frame):
             self.tree.column(c, width=w, anchor="center")
         self.tree.pack(padx=10, pady=5, fill="x")
 
+        search_bar = ttk.Frame(self)
+        search_bar.pack(padx=10, fill="x")
+        self.search_entry = ttk.Entry(search_bar)
+        self.search_entry.pack(side="left", fill="x", expand=True)
+        self.search_entry.bind("<Return>", lambda _e: self._reload())
+        ttk.Button(search_bar, text="Szukaj", command=self._reload).pack(side="left", padx=5)
+
+        self.type_filter = ttk.Combobox(search_bar, values=["wszystkie", "group", "pt"], width=10, state="readonly")
+        self.type_filter.current(0)
+        self.type_filter.bind("<<ComboboxSelected>>", lambda _e: self._reload())
+        self.type_filter.pack(side="left", padx=5)
+
+        self.free_only = ttk.BooleanVar(value=False)
+        ttk.Checkbutton(search_bar, text="Tylko wolne", variable=self.free_only,
+                        command=self._reload).pack(side="left", padx=5)
+
         btns = ttk.Frame(self)
         btns.pack(pady=10)
 
@@ -604,7 +787,15 @@ class ManagerSessionsView(ttk.Frame):
         for i in self.tree.get_children():
             self.tree.delete(i)
 
-        sessions = self.schedule_service.get_all_sessions()
+        query = self.search_entry.get().strip()
+        if query:
+            sessions = self.schedule_service.search_sessions(query)
+        else:
+            session_type = self.type_filter.get()
+            sessions = self.schedule_service.find_sessions(
+                session_type=None if session_type == "wszystkie" else session_type,
+                min_free=1 if self.free_only.get() else None,
+            )
         for s in sessions:
             self.tree.insert(
                 "",
@@ -731,21 +922,268 @@ class ManagerSessionsView(ttk.Frame):
             )
             msg.config(text=info, foreground=("green" if ok else "red"))
             if ok:
+                self.controller.notifier.wake()
                 self._reload()
 
         ttk.Button(form, text="Zapisz zmiany", command=save).grid(row=5, column=0, columnspan=2, pady=10)
 
     def _cancel(self):
-        session_id = self._selected_session_id()
-        if session_id is None:
+        session_ids = [int(self.tree.item(i)["values"][0]) for i in self.tree.selection()]
+        if not session_ids:
             self.msg.config(text="Wybierz sesję do anulowania", foreground="red")
             return
 
-        ok, info = self.schedule_service.remove_session(session_id)
+        if len(session_ids) == 1:
+            ok, info = self.schedule_service.remove_session(session_ids[0])
+        else:
+            ok, info = self.schedule_service.remove_sessions(session_ids)
+        self.controller.notifier.wake()
         self.msg.config(text=info, foreground=("green" if ok else "red"))
         self._reload()
 
 
 
+class OccupancyView(ttk.Frame):
+    """Raport obłożenia - liczony w wątku roboczym, okno nie zamarza przy otwieraniu."""
+
+    GROUPINGS = {"Nazwa": "name", "Poziom": "difficulty_level", "Trener(ID)": "trainer_id"}
+    DAYS = ["Pn", "Wt", "Śr", "Cz", "Pt", "So", "Nd"]
+    POLL_MS = 100
+
+    def __init__(self, parent, controller, user_service):
+        super().__init__(parent)
+        from analytics import OccupancyAnalytics
+
+        self.analytics = OccupancyAnalytics(user_service.db)
+        self.report = None
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="occupancy")
+        self._pending = None
+        self._job = None
+
+        ttk.Label(self, text="Obłożenie zajęć", font=("Helvetica", 12, "bold")).pack(pady=10)
+
+        self.summary = ttk.Label(self, text="")
+        self.summary.pack(pady=5)
+
+        cols = ["hour"] + [f"d{i}" for i in range(7)]
+        self.heatmap = ttk.Treeview(self, columns=cols, show="headings", height=15)
+        self.heatmap.heading("hour", text="Godzina")
+        self.heatmap.column("hour", width=70, anchor="center")
+        for i, d in enumerate(self.DAYS):
+            self.heatmap.heading(f"d{i}", text=d)
+            self.heatmap.column(f"d{i}", width=60, anchor="center")
+        self.heatmap.pack(padx=10, pady=5, fill="x")
+
+        bar = ttk.Frame(self)
+        bar.pack(pady=5)
+        ttk.Label(bar, text="Grupuj wg").pack(side="left", padx=5)
+        self.grouping = ttk.Combobox(bar, values=list(self.GROUPINGS.keys()), width=12, state="readonly")
+        self.grouping.current(0)
+        self.grouping.bind("<<ComboboxSelected>>", lambda _e: self._fill_groups())
+        self.grouping.pack(side="left", padx=5)
+        self.reload_button = ttk.Button(bar, text="Odśwież", command=self._reload)
+        self.reload_button.pack(side="left", padx=5)
+
+        gcols = ("key", "sessions", "fill", "cancel")
+        self.groups = ttk.Treeview(self, columns=gcols, show="headings", height=6)
+        for c, h, w in [
+            ("key", "Grupa", 160),
+            ("sessions", "Sesje", 70),
+            ("fill", "Obłożenie", 90),
+            ("cancel", "Anulacje", 90),
+        ]:
+            self.groups.heading(c, text=h)
+            self.groups.column(c, width=w, anchor="center")
+        self.groups.pack(padx=10, pady=5, fill="x")
+
+        self._reload()
+
+    def _reload(self):
+        if self._pending is not None:
+            return
+        self.summary.config(text="Liczenie obłożenia...")
+        self.reload_button.config(state="disabled")
+        # wątek dotyka tylko bazy i numpy - wynik odbiera pętla Tk przez after()
+        self._pending = self._pool.submit(self.analytics.report)
+        self._job = self.after(self.POLL_MS, self._poll)
+
+    def _poll(self):
+        if not self._pending.done():
+            self._job = self.after(self.POLL_MS, self._poll)
+            return
+        future, self._pending, self._job = self._pending, None, None
+        self.reload_button.config(state="normal")
+        try:
+            self.report = future.result()
+        except Exception as exc:
+            self.summary.config(text=f"Nie udało się policzyć obłożenia: {exc}")
+            return
+        self._show_report()
+
+    def _show_report(self):
+        self.summary.config(
+            text=f"Sesje: {self.report.total_sessions}, rezerwacje: {self.report.total_reservations}, "
+                 f"anulowane: {self.report.cancellation_rate:.0%}"
+        )
+
+        for i in self.heatmap.get_children():
+            self.heatmap.delete(i)
+        for hour in range(6, 21):
+            values = [f"{hour}:00"]
+            for day in range(7):
+                if self.report.capacity[day, hour] > 0:
+                    values.append(f"{self.report.fill_rate[day, hour]:.0%}")
+                else:
+                    values.append("")
+            self.heatmap.insert("", "end", values=values)
+
+        self._fill_groups()
+
+    def _fill_groups(self):
+        for i in self.groups.get_children():
+            self.groups.delete(i)
+        if self.report is None:
+            return
+        key = self.GROUPINGS[self.grouping.get()]
+        for row in self.report.groups.get(key, []):
+            self.groups.insert("", "end", values=(
+                row["key"] or "—",
+                row["sessions"],
+                f"{row['fill_rate']:.0%}",
+                f"{row['cancellation_rate']:.0%}",
+            ))
+
+    def destroy(self):
+        if self._job is not None:
+            self.after_cancel(self._job)
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        super().destroy()
+
+
+class MonthOverviewView(ttk.Frame):
+    """Miesiąc jako siatka dni - jedna etykieta na dzień z sumami z get_overview()."""
+
+    DAYS = ["Pn", "Wt", "Śr", "Cz", "Pt", "So", "Nd"]
+
+    def __init__(self, parent, controller, user_service):
+        super().__init__(parent)
+        self.schedule_service = ScheduleService(user_service.db)
+        self.month = date.today().replace(day=1)
+        self.overview = {}
+
+        ttk.Label(self, text="Kalendarz miesiąca", font=("Helvetica", 12, "bold")).pack(pady=10)
+
+        nav = ttk.Frame(self)
+        nav.pack(fill="x", pady=5)
+        ttk.Button(nav, text="◀", command=lambda: self.change_month(-1)).pack(side="left")
+        ttk.Button(nav, text="▶", command=lambda: self.change_month(1)).pack(side="right")
+        self.month_label = ttk.Label(nav, font=("Helvetica", 10, "bold"))
+        self.month_label.pack(side="left", expand=True)
+
+        grid = ttk.Frame(self)
+        grid.pack(padx=10, pady=5)
+        for i, d in enumerate(self.DAYS):
+            ttk.Label(grid, text=d).grid(row=0, column=i)
+        # stałe 6 x 7 etykiet - przy zmianie miesiąca zmienia się tylko ich treść
+        self.cells = []
+        for week in range(6):
+            for day in range(7):
+                cell = ttk.Label(grid, width=11, anchor="center", relief="solid", padding=4)
+                cell.grid(row=week + 1, column=day, sticky="nsew")
+                cell.bind("<Button-1>", lambda _e, i=len(self.cells): self._show_day(i))
+                self.cells.append(cell)
+
+        hcols = ("hour", "sessions", "reserved", "fill")
+        self.hours = ttk.Treeview(self, columns=hcols, show="headings", height=8)
+        for c, h, w in [("hour", "Godzina", 80), ("sessions", "Zajęcia", 70),
+                        ("reserved", "Zapisani / miejsca", 130), ("fill", "Obłożenie", 90)]:
+            self.hours.heading(c, text=h)
+            self.hours.column(c, width=w, anchor="center")
+        self.hours.pack(padx=10, pady=5, fill="x")
+
+        self._reload()
+
+    def change_month(self, offset):
+        year, month = divmod(self.month.year * 12 + self.month.month - 1 + offset, 12)
+        self.month = date(year, month + 1, 1)
+        self._reload()
+
+    def _reload(self):
+        first = self.month - timedelta(days=self.month.weekday())
+        self.days = [first + timedelta(days=i) for i in range(42)]
+        self.overview = self.schedule_service.get_overview(self.days[0], self.days[-1])
+        self.month_label.config(text=f"{self.month:%m.%Y}")
+
+        for cell, day in zip(self.cells, self.days):
+            t = self.overview[day]
+            text = f"{day.day}"
+            if t["sessions"]:
+                text += f"\n{t['sessions']} zaj.\n{t['fill_rate']:.0%}"
+            if t["fill_rate"] >= 0.9:
+                color = "red"
+            elif t["fill_rate"] >= 0.6:
+                color = "orange"
+            else:
+                color = "green" if t["sessions"] else ""
+            cell.config(text=text, foreground=color if day.month == self.month.month else "gray")
+
+        for i in self.hours.get_children():
+            self.hours.delete(i)
+
+    def _show_day(self, index):
+        for i in self.hours.get_children():
+            self.hours.delete(i)
+        for hour, t in sorted(self.overview[self.days[index]]["hours"].items()):
+            self.hours.insert("", "end", values=(
+                f"{hour}:00", t["sessions"], f"{t['reserved']} / {t['capacity']}", f"{t['fill_rate']:.0%}"
+            ))
+
+
+class CheckInView(ttk.Frame):
+    """Tryb kiosku przy wejściu: skan karty (ID klienta) albo email + Enter."""
+
+    SYNC_MS = 3000
+
+    def __init__(self, parent, controller, user_service):
+        super().__init__(parent)
+        self.service = CheckInService(user_service.db)
+        self.service.start()
+
+        ttk.Label(self, text="Wejście na zajęcia", font=("Helvetica", 14, "bold")).pack(pady=10)
+
+        self.code_entry = ttk.Entry(self, font=("Helvetica", 14))
+        self.code_entry.pack(fill="x", padx=20, pady=10)
+        self.code_entry.bind("<Return>", lambda _e: self.scan())
+        self.code_entry.focus_set()
+
+        self.result = ttk.Label(self, text="", font=("Helvetica", 16, "bold"))
+        self.result.pack(pady=15)
+
+        self.info = ttk.Label(self, text="")
+        self.info.pack(pady=5)
+
+        self._job = self.after(self.SYNC_MS, self._sync)
+        self._update_info()
+
+    def scan(self):
+        ok, msg = self.service.check_in(self.code_entry.get())
+        self.result.config(text=msg, foreground="green" if ok else "red")
+        self.code_entry.delete(0, "end")
+
+    def _sync(self):
+        # zmiany rezerwacji z innych stanowisk - zwykle pusta odpowiedź z indeksu po id
+        self.service.refresh()
+        self._update_info()
+        self._job = self.after(self.SYNC_MS, self._sync)
+
+    def _update_info(self):
+        self.info.config(text=f"Rezerwacje na dziś: {len(self.service.index)}")
+
+    def destroy(self):
+        self.after_cancel(self._job)
+        self.service.stop()
+        super().destroy()
+
+
 if __name__ == '__main__':
     App().mainloop()
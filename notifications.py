@@ -0,0 +1,174 @@
+from __future__ import annotations
+
+import json
+import logging
+import smtplib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from email.message import EmailMessage
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Notification:
+    notification_id: int
+    user_id: int
+    session_id: int
+    kind: str
+    payload: Dict[str, Any]
+    created_at: str
+
+
+SUBJECTS = {
+    "SESSION_CANCELLED": "Zajęcia odwołane",
+    "SESSION_CHANGED": "Zmiana w zajęciach",
+    "WAITLIST_PROMOTED": "Zwolniło się miejsce - jesteś zapisany",
+}
+
+
+def render_text(n: Notification) -> str:
+    p = n.payload
+    return (
+        f"{p.get('first_name', '')}, {SUBJECTS.get(n.kind, n.kind).lower()}: "
+        f"{p.get('session_name') or 'Zajęcia'} ({p.get('start_time')})"
+    )
+
+
+# odbiorcy (sinki) - każdy ma send_batch(list[Notification]) i rzuca wyjątek przy błędzie
+class FileSink:
+    """Zapisuje powiadomienia jako linie JSON - lokalny zamiennik maila do testów."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def send_batch(self, notifications: List[Notification]):
+        lines = [
+            json.dumps({
+                "id": n.notification_id,
+                "user_id": n.user_id,
+                "kind": n.kind,
+                "text": render_text(n),
+                "payload": n.payload,
+            }, ensure_ascii=False)
+            for n in notifications
+        ]
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+
+class SmtpSink:
+    def __init__(self, host: str = "localhost", port: int = 25, sender: str = "noreply@mygym"):
+        self.host = host
+        self.port = port
+        self.sender = sender
+
+    def send_batch(self, notifications: List[Notification]):
+        # jedno połączenie SMTP na paczkę
+        with smtplib.SMTP(self.host, self.port, timeout=10) as smtp:
+            for n in notifications:
+                msg = EmailMessage()
+                msg["From"] = self.sender
+                msg["To"] = n.payload.get("email")
+                msg["Subject"] = SUBJECTS.get(n.kind, n.kind)
+                msg.set_content(render_text(n))
+                smtp.send_message(msg)
+
+
+class NotificationDispatcher:
+    """Wysyła powiadomienia z notifications_outbox w tle.
+
+    Wątek dispatchera pobiera paczki PENDING, dzieli je na części i oddaje
+    do puli wątków. Dostarczenie jest co najmniej jednokrotne: jeżeli któryś
+    sink rzuci wyjątek, cała część wraca do kolejki.
+    """
+
+    def __init__(
+        self,
+        db,
+        sinks,
+        workers: int = 4,
+        batch_size: int = 200,
+        chunk_size: int = 50,
+        poll_interval: float = 1.0,
+        max_attempts: int = 5,
+    ):
+        self.db = db
+        self.sinks = list(sinks)
+        self.workers = workers
+        self.batch_size = batch_size
+        self.chunk_size = chunk_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self.db.reset_stuck_notifications()
+        self._stop.clear()
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="notify")
+        self._thread = threading.Thread(target=self._run, name="notify-dispatcher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._wake.set()
+        self._thread.join(timeout)
+        self._pool.shutdown(wait=True)
+        self._thread = None
+        self._pool = None
+
+    def wake(self):
+        # po zmianie w UI - nie czekamy na kolejny poll
+        self._wake.set()
+
+    def dispatch_once(self) -> int:
+        rows = self.db.claim_notifications(self.batch_size)
+        if not rows:
+            return 0
+
+        batch = [
+            Notification(nid, user_id, session_id, kind, json.loads(payload), created_at)
+            for (nid, user_id, session_id, kind, payload, created_at) in rows
+        ]
+        chunks = [batch[i:i + self.chunk_size] for i in range(0, len(batch), self.chunk_size)]
+
+        if self._pool is None:
+            results = [self._deliver(c) for c in chunks]
+        else:
+            results = list(self._pool.map(self._deliver, chunks))
+        return sum(results)
+
+    def _deliver(self, chunk: List[Notification]) -> int:
+        ids = [n.notification_id for n in chunk]
+        try:
+            for sink in self.sinks:
+                sink.send_batch(chunk)
+        except Exception:
+            logger.exception("Nie udało się wysłać powiadomień (%d), wracają do kolejki", len(ids))
+            self.db.release_notifications(ids, self.max_attempts)
+            return 0
+        self.db.mark_notifications_sent(ids)
+        return len(ids)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                sent = self.dispatch_once()
+            except Exception:
+                logger.exception("Wysyłka powiadomień nie powiodła się")
+                sent = 0
+            if sent:
+                continue
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
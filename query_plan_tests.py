@@ -0,0 +1,272 @@
+"""Testy planów zapytań: każde zapytanie Database na wypełnionej bazie musi
+trafiać w indeks - pełny SCAN po sessions albo reservations jest błędem.
+
+Podgląd planów (np. dla nowego zapytania w review):
+    python query_plan_tests.py --show [nazwa_metody ...]
+"""
+import os
+import re
+import sys
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+
+from db import Database, SessionQuery
+
+CHECKED_TABLES = {"sessions", "reservations"}
+
+# metody, które z założenia czytają całe tabele: eksport, analityka i przeliczenie agregatów
+FULL_SCAN_ALLOWED = {
+    "rebuild_rollups",
+    "iter_reservation_statuses",
+    "iter_reservations_export",
+    "iter_sessions_export",
+}
+
+# metody bez własnych zapytań do sprawdzania
+NOT_QUERIES = {"connect", "close", "clone", "create_tables"}
+
+_SQL_KEYWORDS = {
+    "on", "where", "join", "left", "inner", "cross", "order", "group", "set", "using",
+    "limit", "union", "values", "select", "natural", "as", "window", "having",
+}
+_ALIAS_RE = re.compile(r"\b(?:FROM|JOIN|UPDATE|INTO)\s+(\w+)(?:\s+(?:AS\s+)?(\w+))?", re.IGNORECASE)
+_SCAN_RE = re.compile(r"^SCAN (\w+)")
+
+
+class TracingDatabase(Database):
+    """Database, która zapamiętuje każde wykonane polecenie SQL (z wstawionymi parametrami)."""
+
+    def __init__(self, db_path):
+        super().__init__(db_path)
+        self.statements = []
+
+    def connect(self):
+        conn = super().connect()
+        conn.set_trace_callback(self.statements.append)
+        return conn
+
+
+def _is_query(sql):
+    return sql.lstrip().split(None, 1)[0].upper() in {"SELECT", "WITH", "INSERT", "UPDATE", "DELETE"}
+
+
+def explain(conn, sql):
+    return [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql)]
+
+
+def full_scans(sql, plan):
+    """Nazwy (aliasy) sprawdzanych tabel, które plan czyta w całości."""
+    names = set(CHECKED_TABLES)
+    for table, alias in _ALIAS_RE.findall(sql):
+        if table.lower() in CHECKED_TABLES and alias and alias.lower() not in _SQL_KEYWORDS:
+            names.add(alias)
+    return [m.group(1) for m in map(_SCAN_RE.match, plan) if m and m.group(1) in names]
+
+
+def populate(db):
+    """Schemat z danymi w skali małej siłowni - na pustych tabelach planista nie musi używać indeksów."""
+    db.create_tables()
+    trainers = [db.add_user(f"T{i}", "Trener", f"t{i}@mygym", "x", "trainer") for i in range(5)]
+    db.add_users([(f"K{i}", "Klient", f"k{i}@mygym", "x", "client") for i in range(300)])
+    clients = [row[0] for row in db.get_users_by_role("client")]
+
+    base = datetime(2026, 3, 2, 6, 0)
+    db.add_sessions([
+        ("group", f"Zajęcia {i % 7}", "opis", "easy", 30.0, trainers[i % 5],
+         (base + timedelta(days=i // 14, hours=i % 14)).isoformat(sep=" "), 60, 20, "ACTIVE")
+        for i in range(14 * 60)
+    ])
+    old = datetime(2025, 1, 6, 8, 0)
+    db.add_sessions([
+        ("group", "Stare", None, None, 20.0, trainers[0], (old + timedelta(days=i)).isoformat(sep=" "), 60, 20,
+         "ACTIVE")
+        for i in range(30)
+    ])
+
+    sessions = [row[0] for row in db.get_all_sessions()]
+    for n, client in enumerate(clients):
+        db.add_reservations(client, sessions[n % 37::97][:8], "2026-01-01 12:00:00")
+    db.archive_sessions_before("2025-06-01 00:00:00")
+
+    return {
+        "trainer": trainers[1],
+        "client": clients[3],
+        "other_client": clients[4],
+        "session": sessions[-1],
+        "sessions": sessions[-3:],
+        "reservation": db.get_client_reservations_with_details(clients[3])[0][0],
+    }
+
+
+# (metoda, wywołanie) - każda publiczna metoda Database ma tu co najmniej jeden wpis
+CALLS = [
+    ("rebuild_rollups", lambda db, f: db.rebuild_rollups()),
+    ("get_session_day_rollup", lambda db, f: db.get_session_day_rollup("2026-03-02", "2026-03-08")),
+    ("get_trainer_week_rollup", lambda db, f: db.get_trainer_week_rollup("2026-03-02", f["trainer"])),
+    ("get_trainer_week_rollup", lambda db, f: db.get_trainer_week_rollup("2026-03-02")),
+    ("get_client_month_rollup", lambda db, f: db.get_client_month_rollup("2026-03", f["client"])),
+    ("add_user", lambda db, f: db.add_user("Nowy", "Klient", "nowy@mygym", "x", "client")),
+    ("get_user", lambda db, f: db.get_user("k1@mygym")),
+    ("find_existing_emails", lambda db, f: db.find_existing_emails(["k1@mygym", "brak@mygym"])),
+    ("add_users", lambda db, f: db.add_users([("A", "B", "ab@mygym", "x", "client")])),
+    ("get_user_by_id", lambda db, f: db.get_user_by_id(f["client"])),
+    ("update_user", lambda db, f: db.update_user(f["client"], first_name="Kasia")),
+    ("get_users_by_role", lambda db, f: db.get_users_by_role("trainer")),
+    ("add_session", lambda db, f: db.add_session(
+        "pt", "PT", None, None, 100.0, f["trainer"], "2026-06-01 10:00:00", 60, 1)),
+    ("get_all_sessions", lambda db, f: db.get_all_sessions(include_archived=True)),
+    ("get_session_by_id", lambda db, f: db.get_session_by_id(f["session"])),
+    ("get_sessions_for_trainer", lambda db, f: db.get_sessions_for_trainer(f["trainer"], include_archived=True)),
+    ("update_session", lambda db, f: db.update_session(f["session"], notify=True, capacity=25)),
+    ("cancel_session", lambda db, f: db.cancel_session(f["sessions"][0])),
+    ("cancel_sessions", lambda db, f: db.cancel_sessions(f["sessions"][1:])),
+    ("cancel_trainer_sessions_between", lambda db, f: db.cancel_trainer_sessions_between(
+        f["trainer"], "2026-04-01 00:00:00", "2026-04-02 00:00:00")),
+    ("cancel_sessions_between", lambda db, f: db.cancel_sessions_between(
+        "2026-04-03 00:00:00", "2026-04-04 00:00:00")),
+    ("session_exists", lambda db, f: db.session_exists("Zajęcia 1", "2026-03-02 07:00:00")),
+    ("get_trainer_intervals", lambda db, f: db.get_trainer_intervals(
+        f["trainer"], "2026-03-02 00:00:00", "2026-03-09 00:00:00", exclude_session_id=f["session"])),
+    ("get_busy_intervals", lambda db, f: db.get_busy_intervals("2026-03-02 00:00:00", "2026-03-09 00:00:00")),
+    ("get_busy_intervals", lambda db, f: db.get_busy_intervals(
+        "2026-03-02 00:00:00", "2026-03-09 00:00:00", trainer_id=f["trainer"])),
+    ("find_trainer_conflicts", lambda db, f: db.find_trainer_conflicts(
+        f["trainer"], "2026-03-02 07:00:00", "2026-03-02 08:00:00")),
+    ("add_sessions", lambda db, f: db.add_sessions([
+        ("group", "Nowe", None, None, None, f["trainer"], "2026-07-01 10:00:00", 60, 10, "ACTIVE")])),
+    ("query_sessions", lambda db, f: db.query_sessions(
+        SessionQuery().of_type("group").starting_between("2026-03-02", "2026-03-09").with_free_places())),
+    ("query_sessions", lambda db, f: db.query_sessions(
+        SessionQuery().trainer(f["trainer"]).after("2026-03-05 10:00:00", 0).limit(20))),
+    ("search_sessions", lambda db, f: db.search_sessions("zaj")),
+    ("get_schedule_overview", lambda db, f: db.get_schedule_overview("2026-03-01", "2026-04-01")),
+    ("archive_sessions_before", lambda db, f: db.archive_sessions_before("2025-06-01 00:00:00")),
+    ("get_sessions_for_analytics", lambda db, f: db.get_sessions_for_analytics("2026-03-01", "2026-04-01")),
+    ("iter_reservation_statuses", lambda db, f: list(db.iter_reservation_statuses("2026-03-01", "2026-04-01"))),
+    ("iter_reservations_export", lambda db, f: list(db.iter_reservations_export(include_archived=True))),
+    ("iter_sessions_export", lambda db, f: list(db.iter_sessions_export(include_archived=True))),
+    ("get_feed_version", lambda db, f: db.get_feed_version(f["client"])),
+    ("get_feed_versions", lambda db, f: db.get_feed_versions()),
+    ("iter_feed_events", lambda db, f: list(db.iter_feed_events("client", [f["client"], f["other_client"]]))),
+    ("iter_feed_events", lambda db, f: list(db.iter_feed_events("trainer", [f["trainer"]]))),
+    ("get_checkin_snapshot", lambda db, f: db.get_checkin_snapshot("2026-03-05 00:00:00", "2026-03-06 00:00:00")),
+    ("get_checkin_changes", lambda db, f: db.get_checkin_changes(0, limit=50)),
+    ("add_attendance", lambda db, f: db.add_attendance([(f["reservation"], f["client"], f["session"], "2026-03-05")])),
+    ("get_session_attendance", lambda db, f: db.get_session_attendance(f["session"])),
+    ("prune_reservation_changes", lambda db, f: db.prune_reservation_changes("2000-01-01 00:00:00")),
+    ("start_billing_run", lambda db, f: db.start_billing_run("2026-03", "2026-04-01 02:00:00")),
+    ("get_billing_run", lambda db, f: db.get_billing_run("2026-03")),
+    ("bill_clients_after", lambda db, f: db.bill_clients_after("2026-03", 0, 100, "2026-04-01 02:00:00")),
+    ("finish_billing_run", lambda db, f: db.finish_billing_run("2026-03", "2026-04-01 02:05:00")),
+    ("get_invoices", lambda db, f: db.get_invoices("2026-03", f["client"])),
+    ("get_invoices", lambda db, f: db.get_invoices("2026-03")),
+    ("add_credits", lambda db, f: db.add_credits(f["other_client"], 10, "2026-03-01 09:00:00")),
+    ("get_credit_balance", lambda db, f: db.get_credit_balance(f["other_client"])),
+    ("get_credit_history", lambda db, f: db.get_credit_history(f["other_client"])),
+    ("add_reservation_with_credit", lambda db, f: db.add_reservation_with_credit(
+        f["other_client"], f["sessions"][0], "2026-03-01 09:00:00")),
+    ("claim_notifications", lambda db, f: db.claim_notifications(10)),
+    ("mark_notifications_sent", lambda db, f: db.mark_notifications_sent([1, 2])),
+    ("release_notifications", lambda db, f: db.release_notifications([3], 5)),
+    ("reset_stuck_notifications", lambda db, f: db.reset_stuck_notifications()),
+    ("count_notifications", lambda db, f: db.count_notifications()),
+    ("add_reservation", lambda db, f: db.add_reservation(f["other_client"], f["session"], "2026-01-02 10:00:00")),
+    ("get_client_reservation", lambda db, f: db.get_client_reservation(f["client"], f["session"])),
+    ("get_reservation_by_id", lambda db, f: db.get_reservation_by_id(f["reservation"])),
+    ("update_reservation_status", lambda db, f: db.update_reservation_status(f["reservation"], "ACTIVE")),
+    ("place_hold", lambda db, f: db.place_hold(
+        f["other_client"], f["sessions"][1], "2026-03-01 09:00:00", "2026-03-01 09:10:00")),
+    ("confirm_hold", lambda db, f: db.confirm_hold(
+        f["other_client"], f["sessions"][1], "2026-03-01 09:05:00", "2026-03-01 09:05:00")),
+    ("release_hold", lambda db, f: db.release_hold(f["other_client"], f["sessions"][1])),
+    ("sweep_expired_holds", lambda db, f: db.sweep_expired_holds("2026-03-01 09:00:00")),
+    ("add_to_waitlist", lambda db, f: db.add_to_waitlist(f["client"], f["session"], "2026-01-02 10:00:00")),
+    ("get_waitlist_position", lambda db, f: db.get_waitlist_position(f["client"], f["session"])),
+    ("leave_waitlist", lambda db, f: db.leave_waitlist(f["client"], f["session"])),
+    ("cancel_reservation", lambda db, f: db.cancel_reservation(f["reservation"])),
+    ("find_client_conflicts", lambda db, f: db.find_client_conflicts(f["client"], f["session"])),
+    ("get_client_intervals", lambda db, f: db.get_client_intervals(
+        f["client"], "2026-03-02 00:00:00", "2026-03-09 00:00:00")),
+    ("get_sessions_by_ids", lambda db, f: db.get_sessions_by_ids(f["sessions"])),
+    ("get_sessions_by_ids", lambda db, f: db.get_sessions_by_ids(
+        f["sessions"], held_at="2026-03-01 09:00:00", except_client_id=f["client"])),
+    ("add_reservations", lambda db, f: db.add_reservations(f["other_client"], f["sessions"], "2026-01-02 10:00:00")),
+    ("count_active_reservations", lambda db, f: db.count_active_reservations(f["session"], include_archived=True)),
+    ("count_active_reservations", lambda db, f: db.count_active_reservations(
+        f["session"], held_at="2026-03-01 09:00:00", except_client_id=f["client"])),
+    ("client_has_reservation", lambda db, f: db.client_has_reservation(f["client"], f["session"])),
+    ("get_client_reservations_with_details", lambda db, f: db.get_client_reservations_with_details(
+        f["client"], include_archived=True)),
+    ("get_participants_version", lambda db, f: db.get_participants_version(f["trainer"])),
+    ("get_trainer_participants", lambda db, f: db.get_trainer_participants(f["trainer"])),
+    ("get_session_participants", lambda db, f: db.get_session_participants(f["session"])),
+]
+
+
+def traced_plans(db, call, fixtures):
+    """(sql, plan) dla każdego zapytania wykonanego przez wywołanie."""
+    db.statements.clear()
+    call(db, fixtures)
+    # trace powtarza polecenie dla każdego odpalonego triggera - zostawiamy jedno
+    statements = [sql for sql in dict.fromkeys(db.statements) if not sql.startswith("--") and _is_query(sql)]
+    with Database.connect(db) as conn:
+        return [(sql, explain(conn, sql)) for sql in statements]
+
+
+class TestQueryPlans(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.db = TracingDatabase(os.path.join(cls.tmp.name, "plans.db"))
+        cls.fixtures = populate(cls.db)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    def test_every_database_method_is_covered(self):
+        public = {
+            name for name in vars(Database)
+            if not name.startswith("_") and callable(getattr(Database, name)) and name not in NOT_QUERIES
+        }
+        covered = {name for name, _ in CALLS}
+        self.assertEqual(public - covered, set(), "dodaj wywołanie nowej metody do CALLS")
+
+    def test_full_scan_is_detected(self):
+        sql = "SELECT * FROM reservations r WHERE r.created_at > '2026-01-01'"
+        with Database.connect(self.db) as conn:
+            self.assertEqual(full_scans(sql, explain(conn, sql)), ["r"])
+
+    def test_queries_use_indexes(self):
+        for name, call in CALLS:
+            if name in FULL_SCAN_ALLOWED:
+                continue
+            with self.subTest(method=name):
+                plans = traced_plans(self.db, call, self.fixtures)
+                for sql, plan in plans:
+                    scans = full_scans(sql, plan)
+                    self.assertEqual(scans, [], f"{name}: pełny SCAN\n{sql}\n" + "\n".join(plan))
+
+
+def show_plans(names=()):
+    with tempfile.TemporaryDirectory() as tmp:
+        db = TracingDatabase(os.path.join(tmp, "plans.db"))
+        fixtures = populate(db)
+        for name, call in CALLS:
+            if names and name not in names:
+                continue
+            for sql, plan in traced_plans(db, call, fixtures):
+                print(f"== {name}")
+                print(" ".join(sql.split()))
+                for line in plan:
+                    marker = "  !! " if full_scans(sql, [line]) else "     "
+                    print(marker + line)
+                print()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--show":
+        show_plans(sys.argv[2:])
+    else:
+        unittest.main()
@@ -0,0 +1,82 @@
+from __future__ import annotations
+
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+from typing import Any, Iterable, List, Tuple
+
+
+class IntervalIndex:
+    """Przedziały półotwarte [start, end) posortowane po początku.
+
+    Kolizje szukamy bisekcją: kandydaci mają start < end zapytania oraz
+    start > start zapytania - najdłuższy przedział, więc koszt to
+    O(log n + k) zamiast przeglądania całego kalendarza.
+    """
+
+    def __init__(self, intervals: Iterable[Tuple[datetime, datetime, Any]] = ()):
+        self._items = sorted(((start, end, key) for start, end, key in intervals), key=lambda i: (i[0], i[1]))
+        self._starts = [item[0] for item in self._items]
+        self._max_len = max((end - start for start, end, _ in self._items), default=timedelta(0))
+
+    def __len__(self):
+        return len(self._items)
+
+    def add(self, start: datetime, end: datetime, key: Any = None):
+        pos = bisect_right(self._starts, start)
+        self._items.insert(pos, (start, end, key))
+        self._starts.insert(pos, start)
+        self._max_len = max(self._max_len, end - start)
+
+    def overlapping(self, start: datetime, end: datetime) -> List[Any]:
+        return [key for _s, _e, key in self._within(start, end)]
+
+    def spans(self, start: datetime, end: datetime) -> List[Tuple[datetime, datetime]]:
+        """Przedziały nachodzące na [start, end), posortowane po początku - wejście dla free_intervals."""
+        return [(s, e) for s, e, _key in self._within(start, end)]
+
+    def _within(self, start: datetime, end: datetime):
+        lo = bisect_right(self._starts, start - self._max_len)
+        hi = bisect_left(self._starts, end)
+        return [item for item in self._items[lo:hi] if item[1] > start and item[0] < end]
+
+    def __iter__(self):
+        return iter(self._items)
+
+
+def session_bounds(start_time: str, duration_min: int) -> Tuple[datetime, datetime]:
+    start = datetime.fromisoformat(start_time)
+    return start, start + timedelta(minutes=int(duration_min))
+
+
+# wspólne dla wszystkich serwisów - format zapisu start_time w bazie
+def format_ts(value: datetime) -> str:
+    return value.isoformat(sep=" ", timespec="seconds")
+
+
+def free_intervals(busy: Iterable[Tuple[datetime, datetime]], window_start: datetime, window_end: datetime):
+    """Wolne przedziały w oknie: jedno przejście po zajętych przedziałach posortowanych po początku."""
+    cursor = window_start
+    for start, end in busy:
+        if end <= cursor:
+            continue
+        if start >= window_end:
+            break
+        if start > cursor:
+            yield cursor, start
+        cursor = max(cursor, end)
+        if cursor >= window_end:
+            return
+    if cursor < window_end:
+        yield cursor, window_end
+
+
+def split_into_slots(start: datetime, end: datetime, slot_min: int, step_min: int):
+    # sloty zaczynają się na pełnych wielokrotnościach step_min od północy
+    step = timedelta(minutes=step_min)
+    length = timedelta(minutes=slot_min)
+    midnight = start.replace(hour=0, minute=0, second=0, microsecond=0)
+    offset = (start - midnight) % step
+    t = start if not offset else start + (step - offset)
+    while t + length <= end:
+        yield t, t + length
+        t += step
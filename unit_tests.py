@@ -1,7 +1,20 @@
+import json
+import os
+import sqlite3
+import tempfile
+import time
 import unittest
+from datetime import date, datetime
 from unittest.mock import MagicMock
 
-from models import UserService, ScheduleService, ReservationService
+from db import SessionQuery
+from models import (
+    UserService, ScheduleService, ReservationService, ParticipantsCache, WeekLoader, BillingService, HoldSweeper,
+)
+from checkin import AttendanceWriter
+from notifications import NotificationDispatcher
+from diagnostics import UiDiagnostics, MemoryMonitor
+from scheduling import IntervalIndex, free_intervals, split_into_slots
 
 
 class TestUserService(unittest.TestCase):
@@ -27,6 +40,52 @@ class TestUserService(unittest.TestCase):
         self.assertEqual(msg, "Email zajęty")
         db.add_user.assert_not_called()
 
+    def test_import_clients_reports_row_errors(self):
+        db = MagicMock()
+        db.find_existing_emails.return_value = {"zajety@mail.pl"}
+        db.add_users.side_effect = lambda rows: len(rows)
+
+        count, errors = UserService(db).import_clients([
+            {"first_name": "anna", "last_name": "kowalska", "email": " Anna@Mail.pl ", "password": "x"},
+            {"first_name": "Jan", "last_name": "Nowak", "email": "bez-malpy", "password": "x"},
+            {"first_name": "Ewa", "last_name": "Lis", "email": "anna@mail.pl", "password": "x"},
+            {"first_name": "Ola", "last_name": "Maj", "email": "zajety@mail.pl", "password": "x"},
+            {"first_name": "Piotr", "last_name": "", "email": "p@mail.pl", "password": "x"},
+        ])
+
+        self.assertEqual(count, 1)
+        self.assertEqual(errors, [
+            (1, "Niepoprawny email"),
+            (2, "Email powtórzony w pliku"),
+            (3, "Email zajęty"),
+            (4, "Wypełnij wszystkie pola"),
+        ])
+        db.find_existing_emails.assert_called_once()
+        (rows,), _ = db.add_users.call_args
+        self.assertEqual(rows[0][:3], ("Anna", "Kowalska", "anna@mail.pl"))
+        self.assertEqual(rows[0][4], "client")
+
+    def test_import_clients_reports_non_text_json_values(self):
+        db = MagicMock()
+        db.find_existing_emails.return_value = set()
+        db.add_users.side_effect = lambda rows: len(rows)
+
+        count, errors = UserService(db).import_clients([
+            {"first_name": "Jan", "last_name": None, "email": "jan@mail.pl", "password": "x"},
+            {"first_name": "Ola", "last_name": "Maj", "email": 12345, "password": "x"},
+            {"first_name": "Ewa", "last_name": "Lis", "email": "ewa@mail.pl", "password": 1234},
+            ["nie", "słownik"],
+            {"first_name": "Piotr", "last_name": "Nowak", "email": "piotr@mail.pl", "password": "x"},
+        ])
+
+        self.assertEqual(count, 1)
+        self.assertEqual(errors, [
+            (0, "Wypełnij wszystkie pola"),
+            (1, "Pola muszą być tekstem"),
+            (2, "Pola muszą być tekstem"),
+            (3, "Niepoprawny wiersz"),
+        ])
+
 
 class TestScheduleService(unittest.TestCase):
     def test_get_available_slots(self):
@@ -48,6 +107,137 @@ class TestScheduleService(unittest.TestCase):
 
         self.assertEqual(result, 0)
 
+    def test_archive_past_sessions_uses_horizon_cutoff(self):
+        db = MagicMock()
+        db.archive_sessions_before.return_value = (3, 7)
+
+        service = ScheduleService(db)
+        ok, msg = service.archive_past_sessions(30, now=datetime(2026, 3, 31, 12, 0, 0))
+
+        self.assertTrue(ok)
+        self.assertIn("3", msg)
+        db.archive_sessions_before.assert_called_once_with("2026-03-01 12:00:00")
+        db.prune_reservation_changes.assert_called_once_with("2026-03-01 12:00:00")
+
+    def test_archive_keeps_change_log_the_kiosk_still_needs(self):
+        db = MagicMock()
+        db.archive_sessions_before.return_value = (0, 0)
+
+        ScheduleService(db).archive_past_sessions(0, now=datetime(2026, 3, 31, 12, 0, 0))
+
+        db.prune_reservation_changes.assert_called_once_with("2026-03-30 00:00:00")
+
+
+class TestBillingService(unittest.TestCase):
+    def test_interrupted_run_resumes_after_last_billed_client(self):
+        db = MagicMock()
+        db.start_billing_run.return_value = ("RUNNING", 40, 3)
+        db.bill_clients_after.side_effect = [(80, 2), (None, 0)]
+
+        ok, msg = BillingService(db).run("2026-01", chunk_size=40)
+
+        self.assertTrue(ok)
+        self.assertEqual(msg, "Wystawiono faktury za 2026-01: 5")
+        self.assertEqual([c.args[1] for c in db.bill_clients_after.call_args_list], [40, 80])
+        db.finish_billing_run.assert_called_once()
+
+    def test_previous_month(self):
+        self.assertEqual(BillingService.previous_month(date(2026, 1, 15)), "2025-12")
+
+
+class TestHoldSweeper(unittest.TestCase):
+    def test_failed_sweep_is_logged_and_loop_keeps_running(self):
+        db = MagicMock()
+        db.sweep_expired_holds.side_effect = [sqlite3.OperationalError("database is locked"), 0, 0, 0, 0]
+        sweeper = HoldSweeper(db, interval=0.01)
+
+        with self.assertLogs("models", level="ERROR"):
+            sweeper.start()
+            deadline = time.monotonic() + 2
+            while db.sweep_expired_holds.call_count < 2 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            sweeper.stop()
+        self.assertGreaterEqual(db.sweep_expired_holds.call_count, 2)
+
+
+
+class TestNotificationDispatcher(unittest.TestCase):
+    def test_failed_dispatch_is_logged_and_loop_keeps_running(self):
+        db = MagicMock()
+        db.claim_notifications.side_effect = [sqlite3.OperationalError("database is locked")] + [[]] * 100
+        dispatcher = NotificationDispatcher(db, [], poll_interval=0.01)
+
+        with self.assertLogs("notifications", level="ERROR"):
+            dispatcher.start()
+            deadline = time.monotonic() + 2
+            while db.claim_notifications.call_count < 2 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            dispatcher.stop()
+        self.assertGreaterEqual(db.claim_notifications.call_count, 2)
+
+class TestAttendanceWriter(unittest.TestCase):
+    def test_failed_batch_is_kept_and_written_with_next_one(self):
+        db = MagicMock()
+        db.add_attendance.side_effect = [sqlite3.OperationalError("database is locked")] * 3 + [2]
+        writer = AttendanceWriter(db, flush_interval=0.01)
+
+        with self.assertLogs("checkin", level="ERROR"):
+            writer.start()
+            writer.submit((1, 10, 100, "2026-01-31 09:45:00"))
+            deadline = time.monotonic() + 2
+            while not writer.pending and time.monotonic() < deadline:
+                time.sleep(0.01)
+        writer.submit((2, 11, 100, "2026-01-31 09:46:00"))
+        writer.stop()
+
+        self.assertEqual(writer.written, 2)
+        self.assertEqual(writer.pending, [])
+        self.assertEqual([r[0] for r in db.add_attendance.call_args.args[0]], [1, 2])
+
+    def test_failed_batch_is_retried_without_new_scans_and_on_stop(self):
+        db = MagicMock()
+        db.add_attendance.side_effect = [sqlite3.OperationalError("database is locked")] * 3 + [1]
+        writer = AttendanceWriter(db, flush_interval=0.01)
+
+        with self.assertLogs("checkin", level="ERROR"):
+            writer.start()
+            writer.submit((1, 10, 100, "2026-01-31 09:45:00"))
+            deadline = time.monotonic() + 2
+            while writer.written == 0 and time.monotonic() < deadline:
+                time.sleep(0.01)
+        self.assertEqual(writer.written, 1)
+        self.assertEqual(writer.pending, [])
+
+        writer.stop()
+
+        # zaległa paczka z nieudanego zapisu, a pierwsze z kolejki jest już zatrzymanie
+        db.add_attendance.side_effect = None
+        db.add_attendance.return_value = 1
+        writer.pending = [(2, 11, 100, "2026-01-31 09:46:00")]
+        writer.submit(None)
+        writer._run()
+        self.assertEqual(writer.written, 2)
+        self.assertEqual(writer.pending, [])
+
+
+class TestSessionQuery(unittest.TestCase):
+    def test_compile_is_parameterized(self):
+        sql, params = (
+            SessionQuery()
+            .of_type("pt")
+            .difficulty("easy", "mid")
+            .price_between(10, 50)
+            .after("2026-01-31T10:00:00", 4)
+            .limit(20)
+            .compile()
+        )
+
+        self.assertIn("s.type = ?", sql)
+        self.assertIn("s.difficulty_level IN (?, ?)", sql)
+        self.assertIn("(s.start_time, s.id) > (?, ?)", sql)
+        self.assertNotIn("easy", sql)
+        self.assertEqual(params, ["pt", "easy", "mid", 10.0, 50.0, "2026-01-31 10:00:00", 4, 20, 0])
+
 
 class FakeClient:
     user_id = 1
@@ -87,6 +277,8 @@ class TestReservationService(unittest.TestCase):
         db = MagicMock()
         db.client_has_reservation.return_value = False
         db.count_active_reservations.return_value = 0
+        db.find_client_conflicts.return_value = []
+        db.get_credit_balance.return_value = 0
         db.add_reservation.return_value = 123
 
         service = ReservationService(db)
@@ -97,11 +289,41 @@ class TestReservationService(unittest.TestCase):
         self.assertEqual(msg, "Zapisano na zajęcia")
         db.add_reservation.assert_called_once()
 
+    def test_create_reservation_falls_back_when_pass_runs_out(self):
+        db = MagicMock()
+        db.client_has_reservation.return_value = False
+        db.count_active_reservations.return_value = 0
+        db.find_client_conflicts.return_value = []
+        db.get_credit_balance.return_value = 1
+        # ostatnie wejście zużyła w międzyczasie inna rezerwacja
+        db.add_reservation_with_credit.return_value = None
+
+        ok, msg = ReservationService(db).create_reservation(FakeClient(), {"session_id": 10, "capacity": 5})
+
+        self.assertTrue(ok)
+        self.assertEqual(msg, "Zapisano na zajęcia")
+        db.add_reservation.assert_called_once()
+
+    def test_create_reservation_overlapping_class(self):
+        db = MagicMock()
+        db.client_has_reservation.return_value = False
+        db.count_active_reservations.return_value = 0
+        db.find_client_conflicts.return_value = [11]
+
+        service = ReservationService(db)
+
+        ok, msg = service.create_reservation(FakeClient(), {"session_id": 10, "capacity": 5})
+
+        self.assertFalse(ok)
+        self.assertEqual(msg, "Masz w tym czasie inne zajęcia")
+        db.add_reservation.assert_not_called()
+
 class TestManagerFeatures(unittest.TestCase):
     def test_manager_add_session_calls_db(self):
         db = MagicMock()
 
         db.session_exists.return_value = False
+        db.find_trainer_conflicts.return_value = []
         db.add_session.return_value = 1
 
         service = ScheduleService(db)
@@ -123,6 +345,83 @@ class TestManagerFeatures(unittest.TestCase):
 
         db.add_session.assert_called_once()
 
+    def test_manager_add_session_rejects_trainer_overlap(self):
+        db = MagicMock()
+        db.session_exists.return_value = False
+        db.find_trainer_conflicts.return_value = [3]
+
+        service = ScheduleService(db)
+        ok, msg = service.add_session("group", 5, "2026-01-31T10:30:00", 60, 12, name="Joga")
+
+        self.assertFalse(ok)
+        self.assertEqual(msg, "Trener ma w tym czasie inne zajęcia")
+        db.find_trainer_conflicts.assert_called_once_with(5, "2026-01-31 10:30:00", "2026-01-31 11:30:00")
+        db.add_session.assert_not_called()
+
+
+class TestWeekLoader(unittest.TestCase):
+    def test_prefetched_weeks_are_served_from_cache(self):
+        service = MagicMock()
+        service.get_week_sessions.side_effect = lambda monday: {"monday": monday}
+        loader = WeekLoader(service, size=2)
+        try:
+            m1, m2, m3 = date(2026, 3, 2), date(2026, 3, 9), date(2026, 3, 16)
+            loader.prefetch(m1, m2)
+            self.assertEqual(loader.get(m2), {"monday": m2})
+            self.assertEqual(loader.get(m1), {"monday": m1})
+            self.assertEqual(service.get_week_sessions.call_count, 2)
+
+            # LRU na 2 tygodnie: m2 był używany najdawniej
+            loader.get(m3)
+            loader.get(m1)
+            loader.get(m2)
+            self.assertEqual(service.get_week_sessions.call_count, 4)
+        finally:
+            loader.close()
+
+    def test_invalidated_and_expired_weeks_are_reloaded(self):
+        service = MagicMock()
+        service.get_week_sessions.side_effect = lambda monday: {"monday": monday}
+        loader = WeekLoader(service)
+        try:
+            monday = date(2026, 3, 2)
+            loader.get(monday)
+            loader.get(monday)
+            self.assertEqual(service.get_week_sessions.call_count, 1)
+
+            # zapis na czwartkowe zajęcia unieważnia cały tydzień
+            loader.invalidate(date(2026, 3, 5))
+            loader.get(monday)
+            self.assertEqual(service.get_week_sessions.call_count, 2)
+
+            loader.ttl = -1
+            loader.get(monday)
+            self.assertEqual(service.get_week_sessions.call_count, 3)
+        finally:
+            loader.close()
+
+
+class TestIntervalIndex(unittest.TestCase):
+    def test_overlapping_uses_half_open_intervals(self):
+        t = lambda h, m=0: datetime(2026, 1, 31, h, m)
+        index = IntervalIndex([(t(8), t(9), "a"), (t(10), t(12), "b"), (t(11), t(11, 30), "c")])
+
+        self.assertEqual(index.overlapping(t(9), t(10)), [])
+        self.assertEqual(index.overlapping(t(11, 15), t(11, 20)), ["b", "c"])
+        index.add(t(9, 30), t(10, 30), "d")
+        self.assertEqual(index.overlapping(t(8, 30), t(9, 45)), ["a", "d"])
+        self.assertEqual(index.spans(t(9), t(10, 15)), [(t(9, 30), t(10, 30)), (t(10), t(12))])
+
+    def test_free_intervals_and_slots(self):
+        t = lambda h, m=0: datetime(2026, 1, 31, h, m)
+        busy = [(t(7), t(9)), (t(8), t(10)), (t(12), t(13))]
+
+        gaps = list(free_intervals(busy, t(8), t(15)))
+        self.assertEqual(gaps, [(t(10), t(12)), (t(13), t(15))])
+
+        slots = list(split_into_slots(t(10, 10), t(12), 60, 30))
+        self.assertEqual(slots, [(t(10, 30), t(11, 30)), (t(11), t(12))])
+
 
 class TestTrainerFeatures(unittest.TestCase):
     def test_trainer_get_sessions_for_trainer_calls_db(self):
@@ -141,6 +440,72 @@ class TestTrainerFeatures(unittest.TestCase):
         self.assertEqual(len(sessions), 2)
         db.get_sessions_for_trainer.assert_called_once_with(7)
 
+    def test_participants_cache_loads_once_per_version(self):
+        db = MagicMock()
+        db.get_participants_version.return_value = 3
+        db.get_trainer_participants.return_value = (3, {7: [(1, "Anna", "Nowak", "a@mail.pl")]})
+
+        cache = ParticipantsCache(db, trainer_id=2)
+        self.assertEqual(cache.get(7), [(1, "Anna", "Nowak", "a@mail.pl")])
+        self.assertEqual(cache.get("8"), [])
+        self.assertEqual(db.get_trainer_participants.call_count, 1)
+
+        db.get_participants_version.return_value = 4
+        cache.get(7)
+        self.assertEqual(db.get_trainer_participants.call_count, 2)
+
+
+class TestUiDiagnostics(unittest.TestCase):
+    def test_blocking_handler_is_timed_and_sampled(self):
+        class View:
+            def __init__(self):
+                self.loaded = False
+
+            def _reload(self):
+                time.sleep(0.4)
+                self.loaded = True
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "diag.jsonl")
+            root = MagicMock()
+            diag = UiDiagnostics(root, path, lag_threshold_ms=100, slow_call_ms=100)
+            diag.instrument([View])
+            diag.start()
+            View()._reload()
+            diag.stop()
+
+            with open(path, encoding="utf-8") as f:
+                events = [json.loads(line) for line in f]
+
+        root.after.assert_called_once()
+        kinds = [e["event"] for e in events]
+        self.assertIn("slow_call", kinds)
+        stall = next(e for e in events if e["event"] == "stall")
+        self.assertEqual(stall["handler"], "View._reload")
+        self.assertTrue(any("time.sleep" in line for line in stall["stack"]))
+        summary = events[-1]["handlers"]
+        self.assertEqual(summary[0]["handler"], "View._reload")
+        self.assertEqual(summary[0]["calls"], 1)
+
+
+    def test_memory_monitor_reports_growth(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "memory.jsonl")
+            root = MagicMock()
+            root.winfo_children.return_value = []
+            monitor = MemoryMonitor(root, path)
+            monitor.start()
+            leak = [bytearray(1024) for _ in range(2000)]
+            monitor.stop()
+
+            with open(path, encoding="utf-8") as f:
+                samples = [json.loads(line) for line in f]
+
+        self.assertEqual(len(samples), 2)
+        self.assertNotIn("growth", samples[0])
+        self.assertGreaterEqual(samples[1]["growth"]["traced_kb"], 1900)
+        self.assertIn("unit_tests.py", samples[1]["top_growth"][0]["where"])
+        self.assertEqual(len(leak), 2000)
 
 
 if __name__ == "__main__":